@@ -473,16 +473,7 @@ Response: {
     def _get_all_menu_items(self) -> List[Dict]:
         """Get all menu items for AI context"""
         try:
-            all_items = []
-            main_categories = self.database_manager.get_main_categories()
-            
-            for category in main_categories:
-                sub_categories = self.database_manager.get_sub_categories(category['id'])
-                for sub_category in sub_categories:
-                    items = self.database_manager.get_sub_category_items(sub_category['id'])
-                    all_items.extend(items)
-            
-            return all_items
+            return self.database_manager.get_all_menu_items()
         except Exception as e:
             logger.warning(f"Could not get all menu items: {e}")
             return []
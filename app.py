@@ -1,5 +1,6 @@
 # app.py - UPDATED with Thread Safety and Enhanced Reliability
 import os
+import atexit
 import json
 import logging
 import time
@@ -69,7 +70,48 @@ class ThreadSafeWhatsAppWorkflow:
         """Initialize all components with thread safety and enhanced error handling"""
         try:
             # Thread-safe database manager
-            self.db = ThreadSafeDatabaseManager(self.config.get('db_path', 'hef_cafe.db'))
+            self.db = ThreadSafeDatabaseManager(
+                self.config.get('db_path', 'hef_cafe.db'),
+                pool_size=int(self.config.get('db_pool_size', 8)),
+                single_writer=str(self.config.get('db_single_writer', False)).lower() == 'true',
+                writer_config={
+                    'max_batch': int(self.config.get('db_writer_batch_size', 64)),
+                },
+                cart_cache_size=int(self.config.get('cart_cache_size', 5000)),
+                instrument_queries=str(self.config.get('db_query_stats', True)).lower() == 'true',
+                query_stats_config={
+                    'slow_query_ms': float(self.config.get('db_slow_query_ms', 50)),
+                },
+                log_db_path=self.config.get('log_db_path') or None,
+                maintenance_config={
+                    'checkpoint_interval': float(self.config.get('db_checkpoint_interval', 300)),
+                    'optimize_interval': float(self.config.get('db_optimize_interval', 3600)),
+                    'vacuum_pages': int(self.config.get('db_vacuum_pages', 1000)),
+                    'wal_checkpoint_mb': float(self.config.get('db_wal_checkpoint_mb', 64)),
+                },
+                log_writer_config={
+                    'batch_size': int(self.config.get('log_batch_size', 100)),
+                    'flush_interval_ms': int(self.config.get('log_flush_interval_ms', 200)),
+                    'max_queue_size': int(self.config.get('log_queue_size', 10000)),
+                    'overflow_policy': self.config.get('log_overflow_policy', 'drop_oldest'),
+                },
+                session_writer_config={
+                    'flush_interval_ms': int(self.config.get('session_flush_interval_ms', 250)),
+                },
+                log_archive_config={
+                    'retention_days': float(self.config.get('log_retention_days', 30)),
+                    'archive_dir': self.config.get('log_archive_dir', 'log_archive'),
+                    'batch_size': int(self.config.get('log_archive_batch_size', 500)),
+                    'chunk_batches': int(self.config.get('log_archive_chunk_batches', 10)),
+                    'max_batches': int(self.config.get('log_archive_max_batches', 200)),
+                },
+                shared_sessions=str(self.config.get('shared_sessions', False)).lower() == 'true',
+                shared_session_config={
+                    'lease_ttl': float(self.config.get('session_lease_ttl', 120)),
+                }
+            )
+            atexit.register(self.db.close)
+            session_manager.max_sessions = int(self.config.get('session_cache_max_entries', 50000))
             logger.info("✅ Thread-safe database manager initialized")
 
             # WhatsApp client with enhanced reliability
@@ -140,16 +182,52 @@ class ThreadSafeWhatsAppWorkflow:
                     if cleaned > 0:
                         logger.info(f"🧹 Background cleanup: removed {cleaned} expired sessions")
 
+                    # Reconcile the stats counters and cart totals with the base tables
+                    self.db.refresh_database_counters()
+                    self.db.verify_order_totals()
+
                 except Exception as e:
                     logger.error(f"❌ Background cleanup error: {e}")
                     # Continue running despite errors
                     time.sleep(60)  # Wait before retrying
 
+        def log_archive_worker():
+            """Background conversation log retention worker"""
+            interval = int(self.config.get('log_archive_interval', 300))
+            while True:
+                try:
+                    time.sleep(interval)
+                    self.db.archive_conversation_log()
+
+                except Exception as e:
+                    logger.error(f"❌ Conversation log archive error: {e}")
+                    time.sleep(60)  # Wait before retrying
+
+        def maintenance_worker():
+            """Background database maintenance; each pass only runs tasks that are due"""
+            interval = int(self.config.get('db_maintenance_interval', 60))
+            while True:
+                try:
+                    time.sleep(interval)
+                    self.db.run_maintenance()
+
+                except Exception as e:
+                    logger.error(f"❌ Database maintenance error: {e}")
+                    time.sleep(60)  # Wait before retrying
+
         # Start cleanup thread
         cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
         cleanup_thread.start()
         logger.info("🔄 Background cleanup task started with enhanced reliability")
 
+        archive_thread = threading.Thread(target=log_archive_worker, daemon=True)
+        archive_thread.start()
+        logger.info("🗄️ Conversation log retention task started")
+
+        maintenance_thread = threading.Thread(target=maintenance_worker, daemon=True)
+        maintenance_thread.start()
+        logger.info("🧽 Database maintenance task started")
+
     def handle_whatsapp_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle WhatsApp message with thread safety and enhanced error handling"""
         try:
@@ -568,6 +646,23 @@ def create_flask_app():
             logger.error(f"❌ Session stats error: {e}")
             return jsonify({'status': 'error', 'message': 'Failed to get session stats'}), 500
 
+    @app.route('/db-stats', methods=['GET'])
+    def db_stats():
+        """Query instrumentation: statement latencies, lock waits and slow queries"""
+        try:
+            top = request.args.get('top', 20, type=int)
+            order_by = request.args.get('order_by', 'total_ms')
+            stats = workflow.db.get_query_stats(top=top, order_by=order_by)
+            stats['connection_pool'] = workflow.db.get_pool_stats()
+
+            if request.args.get('reset', 'false').lower() == 'true':
+                workflow.db.reset_query_stats()
+
+            return jsonify(stats), 200
+        except Exception as e:
+            logger.error(f"❌ DB stats error: {e}")
+            return jsonify({'status': 'error', 'message': 'Failed to get database stats'}), 500
+
     @app.route('/analytics', methods=['GET'])
     def analytics():
         """Analytics dashboard with enhanced error handling"""
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark: cart writes with heavy conversation logging, with the
+log in the main database file versus a separate log database file
+
+    python benchmark_db_layout.py [--seconds 5] [--order-threads 8] [--log-threads 4]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_layout(name, split, args):
+    """Run the mixed workload against one layout and return its measurements"""
+    workdir = tempfile.mkdtemp(prefix=f"layout_{name}_")
+    db = ThreadSafeDatabaseManager(
+        os.path.join(workdir, 'hef_cafe.db'),
+        pool_size=args.order_threads + args.log_threads,
+        single_writer=args.single_writer,
+        instrument_queries=False,
+        log_db_path=os.path.join(workdir, 'conversation_log.db') if split else None,
+    )
+
+    stop = threading.Event()
+    latencies = [[] for _ in range(args.order_threads)]
+    log_rows = [0] * args.log_threads
+    content = 'x' * args.log_content_bytes
+
+    def order_worker(index):
+        phone_number = f"9647{index:08d}"
+        samples = latencies[index]
+        db.create_or_update_session(phone_number, 'waiting_for_category', 'arabic')
+        db.flush_sessions([phone_number])
+        while not stop.is_set():
+            for operation in (lambda: db.add_item_to_order(phone_number, 1, 1),
+                              lambda: db.update_item_quantity(phone_number, 1, 2),
+                              lambda: db.remove_last_item_from_order(phone_number)):
+                start = time.perf_counter()
+                operation()
+                samples.append((time.perf_counter() - start) * 1000)
+
+    def log_worker(index):
+        # What the conversation log writer does on every flush, back to back
+        phone_number = f"9648{index:08d}"
+        db.create_or_update_session(phone_number, 'waiting_for_category', 'arabic')
+        db.flush_sessions([phone_number])
+        batch = [(phone_number, 'user_message', content, None, 'waiting_for_category',
+                  '2024-01-01 00:00:00')] * args.log_batch_size
+        while not stop.is_set():
+            db.execute_log_write(lambda conn: conn.executemany("""
+                INSERT INTO conversation_log
+                (phone_number, message_type, content, ai_response, current_step, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, batch))
+            log_rows[index] += len(batch)
+
+    threads = [threading.Thread(target=order_worker, args=(i,)) for i in range(args.order_threads)]
+    threads += [threading.Thread(target=log_worker, args=(i,)) for i in range(args.log_threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    db.close()
+
+    samples = [sample for worker in latencies for sample in worker]
+    return {
+        'layout': name,
+        'order_ops_per_s': len(samples) / elapsed,
+        'p50_ms': percentile(samples, 0.50),
+        'p95_ms': percentile(samples, 0.95),
+        'p99_ms': percentile(samples, 0.99),
+        'max_ms': max(samples) if samples else 0.0,
+        'log_rows_per_s': sum(log_rows) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--order-threads', type=int, default=8)
+    parser.add_argument('--log-threads', type=int, default=4)
+    parser.add_argument('--log-batch-size', type=int, default=200)
+    parser.add_argument('--log-content-bytes', type=int, default=512)
+    parser.add_argument('--single-writer', action='store_true', help="Use single-writer mode for the main file")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    print("🧪 Database layout contention benchmark")
+    print(f"   {args.order_threads} cart threads, {args.log_threads} log threads "
+          f"({args.log_batch_size} rows/batch), {args.seconds}s per layout")
+    print("=" * 78)
+
+    results = [run_layout('single-file', False, args), run_layout('split-log', True, args)]
+
+    print(f"{'layout':<12} {'cart ops/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'log rows/s':>12}")
+    for r in results:
+        print(f"{r['layout']:<12} {r['order_ops_per_s']:>11.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['max_ms']:>8.1f} {r['log_rows_per_s']:>12.0f}")
+
+    single, split = results
+    if single['p99_ms']:
+        print(f"\nsplit-log cart p99: {split['p99_ms'] / single['p99_ms']:.2f}x single-file, "
+              f"throughput {split['order_ops_per_s'] / max(single['order_ops_per_s'], 1):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
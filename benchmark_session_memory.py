@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Session cache memory benchmark: bytes per cached session for the old
+dataclass layout versus the slotted UserWorkflowState, and the resident
+size of the session cache when a blast of users exceeds its cap
+
+    python benchmark_session_memory.py [--users 100000] [--max-sessions 10000]
+"""
+
+import argparse
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.thread_safe_session import ThreadSafeSessionManager, UserWorkflowState
+
+
+@dataclass
+class LegacyWorkflowState:
+    """The previous UserWorkflowState layout, for comparison"""
+    phone_number: str
+    current_step: str = 'waiting_for_language'
+    language_preference: Optional[str] = None
+    customer_name: Optional[str] = None
+    selected_main_category: Optional[int] = None
+    selected_sub_category: Optional[int] = None
+    selected_item: Optional[int] = None
+    order_mode: Optional[str] = None
+    quick_order_item: Optional[str] = None
+    conversation_context: Dict = field(default_factory=dict)
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+    processing: bool = False
+    last_message_id: Optional[str] = None
+
+
+def measure(build, count):
+    """Bytes allocated per object by `build(phone_number)`, phone number strings excluded"""
+    phones = [f"9647{n:07d}" for n in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = {phone_number: build(phone_number) for phone_number in phones}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del states
+    return used / count
+
+
+def state_kwargs(phone_number):
+    # A user part-way through an order
+    return dict(phone_number=phone_number, current_step='waiting_for_quantity',
+                language_preference='arabic', selected_main_category=1,
+                selected_sub_category=3, selected_item=12, order_mode='explore')
+
+
+def blast(users, max_sessions):
+    """Resident cache size after `users` distinct users each send a message"""
+    manager = ThreadSafeSessionManager(max_sessions=max_sessions)
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for n in range(users):
+        phone_number = f"9647{n:07d}"
+        with manager.user_session_lock(phone_number):
+            manager.create_or_update_user_state(**state_kwargs(phone_number))
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return manager.get_session_stats(), current, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--max-sessions', type=int, default=10_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    print("🧪 Session state memory benchmark")
+    print("=" * 60)
+    legacy = measure(lambda p: LegacyWorkflowState(**state_kwargs(p)), args.users)
+    slotted = measure(lambda p: UserWorkflowState(**state_kwargs(p)), args.users)
+    print(f"{'layout':<28} {'bytes/session':>14}")
+    print(f"{'dataclass (previous)':<28} {legacy:>14.0f}")
+    print(f"{'slotted UserWorkflowState':<28} {slotted:>14.0f}   ({legacy / slotted:.1f}x smaller)")
+
+    print(f"\n📈 {args.users:,} users through the session cache")
+    print(f"{'max_sessions':>12} {'cached':>8} {'evicted':>8} {'resident MB':>12} {'peak MB':>9} {'bytes/user':>11} {'us/user':>8}")
+    for cap in (0, args.max_sessions):
+        stats, current, peak, elapsed = blast(args.users, cap)
+        print(f"{cap or 'unlimited':>12} {stats['active_sessions']:>8} {stats['evicted_sessions']:>8} "
+              f"{current / 1e6:>12.1f} {peak / 1e6:>9.1f} {current / args.users:>11.0f} "
+              f"{elapsed / args.users * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
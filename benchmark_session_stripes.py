@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Session cache microbenchmark: per-message state operations from N threads,
+with one cache stripe (a single global lock) versus a lock-striped cache
+
+    python benchmark_session_stripes.py [--seconds 2] [--threads 1,2,4,8] [--stripes 16]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.thread_safe_session import ThreadSafeSessionManager
+
+
+def run(stripes, threads, args):
+    """Run the workload and return operations per second"""
+    manager = ThreadSafeSessionManager(stripes=stripes)
+    stop = threading.Event()
+    ops = [0] * threads
+    barrier = threading.Barrier(threads + 2)  # Workers, stats reader and the timer
+
+    def worker(index):
+        phones = [f"96475{index:02d}{n:05d}" for n in range(args.users_per_thread)]
+        for phone_number in phones:
+            manager.create_or_update_user_state(phone_number, current_step='waiting_for_category')
+        barrier.wait()
+        count = 0
+        while not stop.is_set():
+            for phone_number in phones:
+                # What the handlers do around one message
+                manager.set_user_processing(phone_number, True)
+                manager.get_user_state(phone_number)
+                manager.create_or_update_user_state(phone_number, current_step='waiting_for_item')
+                manager.mark_dirty(phone_number)
+                manager.is_user_processing(phone_number)
+                manager.set_user_processing(phone_number, False)
+            count += 6 * len(phones)
+        ops[index] = count
+
+    def stats_reader():
+        barrier.wait()
+        while not stop.is_set():
+            manager.get_session_stats()
+            time.sleep(0.001)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    reader = threading.Thread(target=stats_reader)
+    for thread in workers + [reader]:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in workers + [reader]:
+        thread.join()
+    return sum(ops) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--threads', default='1,2,4,8')
+    parser.add_argument('--stripes', type=int, default=16)
+    parser.add_argument('--users-per-thread', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    thread_counts = [int(n) for n in args.threads.split(',')]
+
+    print("🧪 Session cache lock striping benchmark")
+    print(f"   {args.users_per_thread} users per thread, stats reader running, {args.seconds}s per run")
+    print("=" * 60)
+    print(f"{'threads':>7} {'1 stripe ops/s':>16} {f'{args.stripes} stripes ops/s':>18} {'speedup':>9}")
+    for threads in thread_counts:
+        single = run(1, threads, args)
+        striped = run(args.stripes, threads, args)
+        print(f"{threads:>7} {single:>16.0f} {striped:>18.0f} {striped / max(single, 1):>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
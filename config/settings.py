@@ -41,6 +41,46 @@ class WhatsAppConfig:
 
         # Database configuration
         self.db_path = os.getenv('DATABASE_PATH', 'hef_cafe.db')
+        self.db_pool_size = int(os.getenv('DATABASE_POOL_SIZE', '8'))
+        self.db_single_writer = os.getenv('DATABASE_SINGLE_WRITER', 'false').lower() == 'true'
+        self.db_writer_batch_size = int(os.getenv('DATABASE_WRITER_BATCH', '64'))
+        self.cart_cache_size = int(os.getenv('CART_CACHE_SIZE', '5000'))
+
+        # Query instrumentation
+        self.db_query_stats = os.getenv('DATABASE_QUERY_STATS', 'true').lower() == 'true'
+        self.db_slow_query_ms = float(os.getenv('DATABASE_SLOW_QUERY_MS', '50'))
+
+        # Background maintenance (WAL checkpoint, ANALYZE/optimize, incremental vacuum)
+        self.db_maintenance_interval = int(os.getenv('DATABASE_MAINTENANCE_INTERVAL', '60'))
+        self.db_checkpoint_interval = int(os.getenv('DATABASE_CHECKPOINT_INTERVAL', '300'))
+        self.db_optimize_interval = int(os.getenv('DATABASE_OPTIMIZE_INTERVAL', '3600'))
+        self.db_vacuum_pages = int(os.getenv('DATABASE_VACUUM_PAGES', '1000'))
+        self.db_wal_checkpoint_mb = float(os.getenv('DATABASE_WAL_CHECKPOINT_MB', '64'))
+
+        # Session write-behind configuration
+        self.session_flush_interval_ms = int(os.getenv('SESSION_FLUSH_INTERVAL_MS', '250'))
+        self.session_cache_max_entries = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '50000'))
+
+        # Several worker processes on one database (e.g. gunicorn -w N): share user locks,
+        # session cache validity and message deduplication through SQLite
+        self.shared_sessions = os.getenv('SHARED_SESSIONS', 'false').lower() == 'true'
+        self.session_lease_ttl = float(os.getenv('SESSION_LEASE_TTL', '120'))
+
+        # Conversation log write-behind configuration (empty DB path: keep it in the main file)
+        self.log_db_path = os.getenv('CONVERSATION_LOG_DB_PATH', '')
+        self.log_batch_size = int(os.getenv('CONVERSATION_LOG_BATCH_SIZE', '100'))
+        self.log_flush_interval_ms = int(os.getenv('CONVERSATION_LOG_FLUSH_MS', '200'))
+        self.log_queue_size = int(os.getenv('CONVERSATION_LOG_QUEUE_SIZE', '10000'))
+        self.log_overflow_policy = os.getenv('CONVERSATION_LOG_OVERFLOW', 'drop_oldest')
+
+        # Conversation log retention (0 keeps rows forever)
+        self.log_retention_days = float(os.getenv('CONVERSATION_LOG_RETENTION_DAYS', '30'))
+        self.log_archive_dir = os.getenv('CONVERSATION_LOG_ARCHIVE_DIR', 'log_archive')
+        self.log_archive_batch_size = int(os.getenv('CONVERSATION_LOG_ARCHIVE_BATCH', '500'))
+        self.log_archive_interval = int(os.getenv('CONVERSATION_LOG_ARCHIVE_INTERVAL', '300'))
+        # Rows are published and deleted every CHUNK batches; a pass stops after MAX_BATCHES (0: no limit)
+        self.log_archive_chunk_batches = int(os.getenv('CONVERSATION_LOG_ARCHIVE_CHUNK_BATCHES', '10'))
+        self.log_archive_max_batches = int(os.getenv('CONVERSATION_LOG_ARCHIVE_MAX_BATCHES', '200'))
 
         # Speech (ASR/TTS) configuration
         self.asr_enabled = os.getenv('ASR_ENABLED', 'true').lower() == 'true'
@@ -109,6 +149,25 @@ class WhatsAppConfig:
         logger.info(f"ENVIRONMENT: {'development' if self.debug_mode else 'production'}")
         logger.info(f"PORT: {self.port}")
         logger.info(f"DATABASE_PATH: {self.db_path}")
+        logger.info(f"DATABASE_POOL_SIZE: {self.db_pool_size}")
+        logger.info(f"DATABASE_SINGLE_WRITER: {'✅ Yes' if self.db_single_writer else '❌ No'} "
+                    f"(batch={self.db_writer_batch_size})")
+        logger.info(f"SESSION_FLUSH_INTERVAL_MS: {self.session_flush_interval_ms}")
+        logger.info(f"SESSION_CACHE_MAX_ENTRIES: {self.session_cache_max_entries or 'unlimited'}")
+        logger.info(f"SHARED_SESSIONS: {'✅ Yes' if self.shared_sessions else '❌ No'} "
+                    f"(lease ttl={self.session_lease_ttl}s)")
+        logger.info(f"CART_CACHE_SIZE: {self.cart_cache_size}")
+        logger.info(f"DATABASE_QUERY_STATS: {'✅ Yes' if self.db_query_stats else '❌ No'} "
+                    f"(slow >= {self.db_slow_query_ms}ms)")
+        logger.info(f"DATABASE_MAINTENANCE: every {self.db_maintenance_interval}s "
+                    f"(checkpoint {self.db_checkpoint_interval}s or {self.db_wal_checkpoint_mb}MB WAL, "
+                    f"optimize {self.db_optimize_interval}s, vacuum {self.db_vacuum_pages} pages)")
+        logger.info(f"CONVERSATION_LOG: batch={self.log_batch_size}, flush={self.log_flush_interval_ms}ms, "
+                    f"queue={self.log_queue_size}, overflow={self.log_overflow_policy}, "
+                    f"db={self.log_db_path or self.db_path}")
+        logger.info(f"CONVERSATION_LOG_RETENTION: {self.log_retention_days} days -> {self.log_archive_dir} "
+                    f"(batch={self.log_archive_batch_size}, chunk={self.log_archive_chunk_batches} batches, "
+                    f"max={self.log_archive_max_batches} batches every {self.log_archive_interval}s)")
 
         if self.waba_id:
             logger.info(f"WABA ID: {self.waba_id}")
@@ -179,6 +238,32 @@ class WhatsAppConfig:
             'client_secret': self.client_secret,
             'waba_id': self.waba_id,
             'db_path': self.db_path,
+            'db_pool_size': self.db_pool_size,
+            'db_single_writer': self.db_single_writer,
+            'db_writer_batch_size': self.db_writer_batch_size,
+            'cart_cache_size': self.cart_cache_size,
+            'db_query_stats': self.db_query_stats,
+            'db_slow_query_ms': self.db_slow_query_ms,
+            'db_maintenance_interval': self.db_maintenance_interval,
+            'db_checkpoint_interval': self.db_checkpoint_interval,
+            'db_optimize_interval': self.db_optimize_interval,
+            'db_vacuum_pages': self.db_vacuum_pages,
+            'db_wal_checkpoint_mb': self.db_wal_checkpoint_mb,
+            'session_flush_interval_ms': self.session_flush_interval_ms,
+            'session_cache_max_entries': self.session_cache_max_entries,
+            'shared_sessions': self.shared_sessions,
+            'session_lease_ttl': self.session_lease_ttl,
+            'log_db_path': self.log_db_path,
+            'log_batch_size': self.log_batch_size,
+            'log_flush_interval_ms': self.log_flush_interval_ms,
+            'log_queue_size': self.log_queue_size,
+            'log_overflow_policy': self.log_overflow_policy,
+            'log_retention_days': self.log_retention_days,
+            'log_archive_dir': self.log_archive_dir,
+            'log_archive_batch_size': self.log_archive_batch_size,
+            'log_archive_interval': self.log_archive_interval,
+            'log_archive_chunk_batches': self.log_archive_chunk_batches,
+            'log_archive_max_batches': self.log_archive_max_batches,
             'ai_enabled': self.ai_enabled,
             'ai_fallback_enabled': self.ai_fallback_enabled,
             'ai_quota_cache_duration': self.ai_quota_cache_duration,
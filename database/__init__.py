@@ -1,13 +1,15 @@
 """Database management module"""
 
 from .manager import DatabaseManager
+from .storage import StorageBackend
+from .memory_storage import InMemoryStorage
 from .models import (
     DatabaseSchema, UserSession, MenuItem, UserOrder,
-    OrderDetails, ConversationLog, CompletedOrder, StepRule
+    OrderDetails, ConversationLog, CompletedOrder, CompletedOrderItem, StepRule
 )
 
 __all__ = [
-    'DatabaseManager', 'DatabaseSchema', 'UserSession',
+    'DatabaseManager', 'StorageBackend', 'InMemoryStorage', 'DatabaseSchema', 'UserSession',
     'MenuItem', 'UserOrder', 'OrderDetails', 'ConversationLog',
-    'CompletedOrder', 'StepRule'
+    'CompletedOrder', 'CompletedOrderItem', 'StepRule'
 ]
\ No newline at end of file
@@ -0,0 +1,193 @@
+# database/cart_cache.py
+"""
+Write-through in-memory cache of user carts (user_orders + order_details)
+"""
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional
+
+from .models import CartItem
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DETAILS = {
+    'service_type': None,
+    'location': None,
+    'total_amount': 0,
+    'item_count': 0,
+    'customizations': None,
+    'order_status': 'in_progress'
+}
+
+
+class Cart:
+    """One user's cart: frozen CartItem lines in insertion order plus the stored totals"""
+
+    __slots__ = ('items', 'total', 'details')
+
+    def __init__(self, items: List[CartItem], details: Dict):
+        self.items = list(items)  # Lines are immutable: share them, replace them on change
+        self.details = dict(details)
+        self.total = self.details.get('total_amount') or 0
+
+    def adjust(self, total_delta: int, count_delta: int):
+        """Mirror the order_details triggers after a committed change"""
+        self.total += total_delta
+        self.details['total_amount'] = self.total
+        self.details['item_count'] = (self.details.get('item_count') or 0) + count_delta
+
+    def snapshot(self) -> Dict:
+        """Dict view in the shape returned by get_user_order"""
+        return {
+            'items': [item.to_dict() for item in self.items],
+            'total': self.total,
+            'details': dict(self.details)
+        }
+
+
+class CartCache:
+    """LRU map of phone number -> Cart.
+
+    The database stays the source of truth: every cart mutation commits to
+    SQLite first and then patches the cached cart inside `mutation()`, so a
+    cached read always reflects committed state. Callers serialize mutations
+    per user (the session lock), which keeps patches applied in commit order.
+    A cart loaded while a mutation of the same cart is in flight is returned
+    but not cached, so a load can never be patched twice with the same change.
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max(1, int(max_size))
+        self._carts: 'OrderedDict[str, Cart]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {}  # phone -> running mutations
+        self._loads: Dict[str, List[list]] = {}  # phone -> [stale] flags of running loads
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, phone_number: str, loader: Callable[[], Cart]) -> Dict:
+        """Return a snapshot of the cart, loading it with `loader()` on a miss"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            if cart is not None:
+                self._carts.move_to_end(phone_number)
+                self._metrics['hits'] += 1
+                return cart.snapshot()
+            self._metrics['misses'] += 1
+            load = [phone_number in self._in_flight]
+            self._loads.setdefault(phone_number, []).append(load)
+
+        try:
+            cart = loader()
+        finally:
+            with self._lock:
+                loads = self._loads[phone_number]
+                loads.remove(load)
+                if not loads:
+                    del self._loads[phone_number]
+
+        with self._lock:
+            # Skip caching if the cart changed while loading: the load may predate it
+            if not load[0] and phone_number not in self._carts:
+                self._put(phone_number, cart)
+            return cart.snapshot()
+
+    def _invalidate_loads(self, phone_number: Optional[str] = None):
+        # Caller holds self._lock
+        groups = self._loads.values() if phone_number is None else [self._loads.get(phone_number, ())]
+        for loads in groups:
+            for load in loads:
+                load[0] = True
+
+    def _put(self, phone_number: str, cart: Cart):
+        self._carts[phone_number] = cart
+        self._carts.move_to_end(phone_number)
+        while len(self._carts) > self.max_size:
+            self._carts.popitem(last=False)
+            self._metrics['evictions'] += 1
+
+    @contextmanager
+    def mutation(self, phone_number: str):
+        """Wrap a database write and the cache patches that follow it"""
+        with self._lock:
+            self._in_flight[phone_number] = self._in_flight.get(phone_number, 0) + 1
+            self._invalidate_loads(phone_number)
+        try:
+            yield
+        except BaseException:
+            # The write may or may not have committed; reload on next read
+            self.evict(phone_number)
+            raise
+        finally:
+            with self._lock:
+                self._invalidate_loads(phone_number)
+                self._in_flight[phone_number] -= 1
+                if not self._in_flight[phone_number]:
+                    del self._in_flight[phone_number]
+
+    def _patch(self, phone_number: str, patch: Callable[[Cart], None]):
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            if cart is not None:
+                patch(cart)
+
+    def add_item(self, phone_number: str, item: CartItem):
+        """Append a committed user_orders row"""
+        def patch(cart):
+            cart.items.append(item)
+            cart.adjust(item.subtotal, 1)
+        self._patch(phone_number, patch)
+
+    def remove_items(self, phone_number: str, predicate: Callable[[CartItem], bool]):
+        """Drop committed deletions"""
+        def patch(cart):
+            removed = [item for item in cart.items if predicate(item)]
+            cart.items = [item for item in cart.items if not predicate(item)]
+            cart.adjust(-sum(item.subtotal for item in removed), -len(removed))
+        self._patch(phone_number, patch)
+
+    def set_quantity(self, phone_number: str, menu_item_id: int, quantity: int):
+        """Apply a committed quantity change (subtotal at the menu price)"""
+        def patch(cart):
+            delta = 0
+            for i, item in enumerate(cart.items):
+                if item.menu_item_id == menu_item_id:
+                    subtotal = quantity * item.price
+                    delta += subtotal - item.subtotal
+                    cart.items[i] = replace(item, quantity=quantity, subtotal=subtotal)
+            cart.adjust(delta, 0)
+        self._patch(phone_number, patch)
+
+    def update_details(self, phone_number: str, **fields):
+        """Apply committed order_details changes"""
+        self._patch(phone_number, lambda cart: cart.details.update(fields))
+
+    def clear(self, phone_number: str):
+        """Cart emptied (e.g. cancelled) but the user is still active"""
+        with self._lock:
+            if phone_number in self._carts:
+                self._put(phone_number, Cart([], DEFAULT_DETAILS))
+
+    def evict(self, phone_number: Optional[str] = None):
+        """Forget one cart, or every cart"""
+        with self._lock:
+            self._invalidate_loads(phone_number)
+            if phone_number is None:
+                self._carts.clear()
+            else:
+                self._carts.pop(phone_number, None)
+
+    def get_total(self, phone_number: str) -> Optional[int]:
+        """Cached cart total, or None when the cart is not cached"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            return None if cart is None else cart.total
+
+    def get_stats(self) -> Dict:
+        """Get cache metrics"""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({'carts': len(self._carts), 'max_size': self.max_size})
+            return stats
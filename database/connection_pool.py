@@ -0,0 +1,212 @@
+# database/connection_pool.py
+"""
+Bounded SQLite connection pool for the thread-safe database manager
+"""
+import sqlite3
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .query_stats import InstrumentedConnection, QueryStats
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteConnectionPool:
+    """Bounded checkout/checkin pool of pre-configured SQLite connections.
+
+    Connections are configured once when they are opened and then reused, so
+    their page cache stays warm between calls. A thread that already holds a
+    connection gets the same one back on a nested checkout, which keeps nested
+    helpers inside the caller's transaction and avoids pool self-deadlock.
+    """
+
+    # Applied once per physical connection instead of on every checkout
+    PRAGMAS = (
+        "PRAGMA auto_vacuum=INCREMENTAL",  # Only takes effect on a new file, so it must precede WAL
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=10000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA foreign_keys = ON",
+        "PRAGMA recursive_triggers = ON",  # REPLACE fires delete triggers (db_counters)
+        "PRAGMA busy_timeout=30000",
+    )
+
+    def __init__(self, db_path: str, max_size: int = 8, timeout: float = 30.0,
+                 query_stats: Optional[QueryStats] = None):
+        self.db_path = db_path
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.query_stats = query_stats  # Statement instrumentation, if enabled
+
+        self._idle: List[sqlite3.Connection] = []  # LIFO: the hottest connection is reused first
+        self._open_count = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+
+        self._stats = {
+            'checkouts': 0,
+            'nested_checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """Open and configure a new physical connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,  # Connections move between threads via the pool
+            factory=InstrumentedConnection if self.query_stats is not None else sqlite3.Connection
+        )
+        if self.query_stats is not None:
+            conn.query_stats = self.query_stats
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def create_unpooled_connection(self) -> sqlite3.Connection:
+        """Open a configured connection outside the pool (the caller closes it)"""
+        return self._create_connection()
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """Check a connection out of the pool, waiting up to `timeout` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open_count < self.max_size:
+                    # Reserve the slot now, open the connection outside the lock
+                    self._open_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f"Timed out waiting for a database connection ({self.max_size} in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            wait_ms = (time.monotonic() - start) * 1000
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_ms'] += wait_ms
+
+        if self.query_stats is not None:
+            self.query_stats.record_checkout(wait_ms)
+
+        if conn is None:
+            try:
+                conn = self._create_connection()
+            except Exception:
+                with self._cond:
+                    self._open_count -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+            logger.debug(f"🔌 Opened pooled connection to {self.db_path}")
+
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False):
+        """Return a connection to the pool, resetting any per-use state"""
+        if not discard:
+            try:
+                # Never hand a connection with an open transaction to the next caller
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = None
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Discarding unusable pooled connection: {e}")
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._open_count -= 1
+                self._stats['discarded'] += 1
+                to_close = conn
+            else:
+                self._idle.append(conn)
+                to_close = None
+            self._cond.notify()
+
+        if to_close is not None:
+            try:
+                to_close.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager for a pooled connection (reentrant per thread)"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            with self._cond:
+                self._stats['nested_checkouts'] += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self.acquire(timeout)
+        self._local.conn = conn
+        self._local.depth = 0
+        discard = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # A corrupt or closed handle must not go back into the pool
+            discard = not isinstance(e, (sqlite3.OperationalError, sqlite3.IntegrityError))
+            raise
+        finally:
+            self._local.conn = None
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._cond.notify_all()
+
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        logger.info(f"🔌 Connection pool for {self.db_path} closed")
+
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'open_connections': self._open_count,
+                'idle_connections': len(self._idle),
+                'in_use_connections': self._open_count - len(self._idle),
+            })
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+        return stats
@@ -0,0 +1,98 @@
+# database/counters.py
+"""
+Trigger-maintained row counters and totals for cheap stats reads
+"""
+import sqlite3
+from typing import Dict
+
+# Tables whose row counts are reported by get_database_stats
+COUNTED_TABLES = ('user_sessions', 'menu_items', 'user_orders', 'order_details',
+                  'completed_orders', 'step_rules')
+
+
+def get_counter_trigger_definitions() -> Dict[str, str]:
+    """Triggers keeping db_counters in step with the counted tables.
+
+    INSERT OR REPLACE only fires the delete trigger for the replaced row when
+    PRAGMA recursive_triggers is ON, which every pooled connection and the
+    legacy DatabaseManager set.
+    """
+    triggers = {}
+
+    for table in COUNTED_TABLES:
+        for event, delta in (('INSERT', '+ 1'), ('DELETE', '- 1')):
+            name = f"trg_{table}_{event.lower()}_counter"
+            triggers[name] = f"""
+                CREATE TRIGGER IF NOT EXISTS {name}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE db_counters SET value = value {delta} WHERE name = '{table}_count';
+                END
+            """
+
+    triggers['trg_completed_orders_insert_revenue'] = """
+        CREATE TRIGGER IF NOT EXISTS trg_completed_orders_insert_revenue
+        AFTER INSERT ON completed_orders
+        BEGIN
+            UPDATE db_counters SET value = value + NEW.total_amount WHERE name = 'total_revenue';
+        END
+    """
+    triggers['trg_completed_orders_delete_revenue'] = """
+        CREATE TRIGGER IF NOT EXISTS trg_completed_orders_delete_revenue
+        AFTER DELETE ON completed_orders
+        BEGIN
+            UPDATE db_counters SET value = value - OLD.total_amount WHERE name = 'total_revenue';
+        END
+    """
+    triggers['trg_completed_orders_update_revenue'] = """
+        CREATE TRIGGER IF NOT EXISTS trg_completed_orders_update_revenue
+        AFTER UPDATE OF total_amount ON completed_orders
+        BEGIN
+            UPDATE db_counters SET value = value - OLD.total_amount + NEW.total_amount
+            WHERE name = 'total_revenue';
+        END
+    """
+
+    return triggers
+
+
+def count_counters(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recount every counter from the base tables (full scans; no writes)"""
+    values = {}
+    for table in COUNTED_TABLES:
+        values[f"{table}_count"] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    values['total_revenue'] = conn.execute(
+        "SELECT COALESCE(SUM(total_amount), 0) FROM completed_orders"
+    ).fetchone()[0]
+    return values
+
+
+def refresh_counters(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recount every counter from the base tables (caller owns the transaction).
+
+    Used to seed the counters; repairs of a live database use count_counters
+    on a read snapshot and apply_counter_deltas instead.
+    """
+    values = count_counters(conn)
+    conn.executemany("""
+        INSERT INTO db_counters (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value
+    """, values.items())
+    return values
+
+
+def apply_counter_deltas(conn: sqlite3.Connection, deltas: Dict[str, int]):
+    """Shift counters by the drift measured on a snapshot (caller owns the transaction).
+
+    Relative updates stay correct when writers moved the counters after the
+    snapshot, because the triggers moved them by the same amounts as the rows.
+    """
+    conn.executemany("""
+        INSERT INTO db_counters (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+    """, deltas.items())
+
+
+def read_counters(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Read all counters (a handful of rows, independent of table sizes)"""
+    return dict(conn.execute("SELECT name, value FROM db_counters").fetchall())
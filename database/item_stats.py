@@ -0,0 +1,66 @@
+# database/item_stats.py
+"""
+Incrementally maintained per-item popularity counters
+"""
+import math
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+
+# Orders lose half their weight in the popularity score every week
+DEFAULT_HALF_LIFE_DAYS = 7.0
+
+
+def decay_rate(half_life_days: float = DEFAULT_HALF_LIFE_DAYS) -> float:
+    """Exponential decay rate per second for the given half-life"""
+    return math.log(2) / (half_life_days * 86400)
+
+
+def _log_add(a: float, b: float) -> float:
+    """log(exp(a) + exp(b)) without overflow"""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def record_order_items(conn: sqlite3.Connection, items: Iterable[Dict], ordered_at: float = None,
+                       half_life_days: float = DEFAULT_HALF_LIFE_DAYS) -> int:
+    """Fold the line items of one completed order into item_stats.
+
+    The decayed score is kept in log space relative to the epoch:
+    score = log(sum(quantity * exp(rate * ordered_at))). Ranking by it equals
+    ranking by exponentially decayed quantity at any moment, and old rows
+    never need to be rewritten as time passes. Returns the number of items updated.
+    """
+    ordered_at = time.time() if ordered_at is None else ordered_at
+    rate = decay_rate(half_life_days)
+    last_ordered = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ordered_at))
+
+    # Merge duplicate lines of the same item
+    totals: Dict[int, List[int]] = {}
+    for item in items:
+        if item.get('menu_item_id') is None:
+            continue
+        quantity, subtotal = totals.setdefault(item['menu_item_id'], [0, 0])
+        totals[item['menu_item_id']] = [quantity + (item.get('quantity') or 1), subtotal + (item.get('subtotal') or 0)]
+
+    for menu_item_id, (quantity, subtotal) in totals.items():
+        row = conn.execute(
+            "SELECT decay_score FROM item_stats WHERE menu_item_id = ?", (menu_item_id,)
+        ).fetchone()
+        score = _log_add(row[0] if row else None, rate * ordered_at + math.log(max(quantity, 1)))
+
+        conn.execute("""
+            INSERT INTO item_stats
+            (menu_item_id, order_count, total_quantity, total_revenue, last_ordered_at, decay_score)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT (menu_item_id) DO UPDATE SET
+                order_count = order_count + 1,
+                total_quantity = total_quantity + excluded.total_quantity,
+                total_revenue = total_revenue + excluded.total_revenue,
+                last_ordered_at = excluded.last_ordered_at,
+                decay_score = excluded.decay_score
+        """, (menu_item_id, quantity, subtotal, last_ordered, score))
+
+    return len(totals)
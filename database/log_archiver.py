@@ -0,0 +1,244 @@
+# database/log_archiver.py
+"""
+Retention for the conversation log: archive expired rows to compressed
+JSONL segments and delete them in small batches
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Callable, Dict, Iterator, Optional
+
+from .write_queue import run_in_transaction
+
+try:
+    import fcntl
+except ImportError:  # Windows: passes are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('id', 'phone_number', 'message_type', 'content', 'ai_response', 'current_step', 'timestamp')
+
+
+class ConversationLogArchiver:
+    """Moves conversation_log rows older than `retention_days` into
+    date-partitioned segment files under `archive_dir`, one file per chunk
+    and day: conversation_log-YYYY-MM-DD.<pass>-<chunk>.jsonl.gz
+
+    A pass holds an exclusive lock file in the archive directory, so worker
+    processes sharing the database take turns instead of archiving the same
+    rows. A pass works in chunks of at most `chunk_batches` batches: the
+    chunk's rows are read without holding the write lock and written to
+    temporary segments, the segments are renamed into place when complete,
+    and then the chunk's rows are deleted by primary key in short
+    transactions before the next chunk is read. Memory and the rows at risk
+    stay bounded by one chunk: a crash before the rename leaves the rows in
+    the table for the next pass, a crash after it can archive one chunk
+    twice, and no crash loses rows. A pass stops after `max_batches`
+    batches (None or 0: until no expired rows are left).
+    """
+
+    LOCK_FILE = ".archive.lock"
+
+    def __init__(self, connection_factory: Callable, execute_write: Callable = None,
+                 archive_dir: str = "log_archive", retention_days: float = 30,
+                 batch_size: int = 500, batch_pause_ms: int = 50,
+                 chunk_batches: int = 10, max_batches: Optional[int] = 200):
+        self._connection_factory = connection_factory
+        self._execute_write = execute_write or partial(run_in_transaction, connection_factory)
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = max(1, int(batch_size))
+        self.batch_pause = max(0, int(batch_pause_ms)) / 1000.0
+        self.chunk_batches = max(1, int(chunk_batches))
+        self.max_batches = max_batches or None
+
+        self._run_lock = threading.Lock()  # One archive pass at a time in this process
+        self._metrics = {
+            'runs': 0,
+            'archived': 0,
+            'batches': 0,
+            'chunks': 0,
+            'skipped_locked': 0,
+            'last_run_ms': 0.0,
+            'last_cutoff': None,
+        }
+
+    def segment_path(self, day: str, pass_id: Optional[str] = None) -> str:
+        """Path of an archive segment for a YYYY-MM-DD day (written by pass chunk `pass_id`)"""
+        name = f"conversation_log-{day}.{pass_id}.jsonl.gz" if pass_id else f"conversation_log-{day}.jsonl.gz"
+        return os.path.join(self.archive_dir, name)
+
+    @contextmanager
+    def _pass_lock(self):
+        """Exclusive lock on the archive directory across processes; yields False if another pass holds it"""
+        if fcntl is None:
+            yield True  # No flock on this platform: only the in-process lock applies
+            return
+        with open(os.path.join(self.archive_dir, self.LOCK_FILE), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def archive_expired(self, max_batches: Optional[int] = None) -> int:
+        """Archive and delete expired rows (at most `max_batches` batches, default
+        from the constructor); returns the number of rows archived"""
+        if not self.retention_days or self.retention_days <= 0:
+            return 0
+        if not self._run_lock.acquire(blocking=False):
+            return 0  # Another pass is already running
+
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with self._pass_lock() as locked:
+                if not locked:
+                    self._metrics['skipped_locked'] += 1
+                    logger.debug("⏳ Another process is archiving the conversation log")
+                    return 0
+                return self._archive_pass(max_batches or self.max_batches)
+
+        except Exception as e:
+            logger.error(f"❌ Error archiving conversation log: {e}")
+            return 0
+        finally:
+            self._run_lock.release()
+
+    def _archive_pass(self, max_batches: Optional[int]) -> int:
+        start = time.perf_counter()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        pass_id = f"{int(time.time() * 1000)}-{os.getpid()}"
+
+        archived = batches = chunks = 0
+        position = ('', 0)  # Keyset position (timestamp, id) of the last row read
+        while max_batches is None or batches < max_batches:
+            limit = self.chunk_batches if max_batches is None else min(self.chunk_batches, max_batches - batches)
+            if chunks:
+                time.sleep(self.batch_pause)
+            rows, chunk_batches, position, exhausted = self._archive_chunk(
+                cutoff, position, limit, f"{pass_id}-{chunks}"
+            )
+            archived += rows
+            batches += chunk_batches
+            chunks += 1
+            if exhausted:
+                break
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._metrics['runs'] += 1
+        self._metrics['archived'] += archived
+        self._metrics['batches'] += batches
+        self._metrics['chunks'] += chunks
+        self._metrics['last_run_ms'] = round(elapsed_ms, 2)
+        self._metrics['last_cutoff'] = cutoff
+
+        if archived:
+            logger.info(f"🗄️ Archived {archived} conversation log rows older than {cutoff} "
+                        f"in {batches} batches ({elapsed_ms:.0f}ms)")
+        return archived
+
+    def _archive_chunk(self, cutoff: str, position: tuple, max_batches: int, chunk_id: str):
+        """Archive up to `max_batches` batches: publish their segments, then delete their rows.
+
+        Returns (rows archived, batches read, keyset position, whether no expired rows are left).
+        """
+        segments: Dict[str, tuple] = {}  # final path -> (temporary path, open gzip file)
+        archived_ids = []
+        batches = 0
+        exhausted = False
+        try:
+            while batches < max_batches:
+                with self._connection_factory() as conn:
+                    rows = conn.execute("""
+                        SELECT id, phone_number, message_type, content, ai_response, current_step, timestamp
+                        FROM conversation_log
+                        WHERE timestamp < ? AND (timestamp, id) > (?, ?)
+                        ORDER BY timestamp, id
+                        LIMIT ?
+                    """, (cutoff, position[0], position[1], self.batch_size)).fetchall()
+                    if conn.in_transaction:
+                        conn.commit()
+
+                if rows:
+                    self._write_rows(rows, segments, chunk_id)
+                    archived_ids.extend(row[0] for row in rows)
+                    position = (rows[-1][6], rows[-1][0])
+                    batches += 1
+                if len(rows) < self.batch_size:
+                    exhausted = True
+                    break
+
+            # Publish complete segments, then drop their rows from the table
+            for final_path, (temp_path, f) in segments.items():
+                f.close()
+                os.replace(temp_path, final_path)
+            segments.clear()
+        finally:
+            for temp_path, f in segments.values():
+                f.close()
+                os.remove(temp_path)
+
+        for offset in range(0, len(archived_ids), self.batch_size):
+            if offset:
+                time.sleep(self.batch_pause)  # Give request threads a turn at the write lock
+            chunk = archived_ids[offset:offset + self.batch_size]
+            self._execute_write(lambda conn: conn.executemany(
+                "DELETE FROM conversation_log WHERE id = ?", [(row_id,) for row_id in chunk]
+            ))
+
+        return len(archived_ids), batches, position, exhausted
+
+    def _write_rows(self, rows, segments: Dict[str, tuple], chunk_id: str):
+        """Write rows to this chunk's temporary segment for their day"""
+        for row in rows:
+            day = str(row[6] or '')[:10] or 'unknown'
+            final_path = self.segment_path(day, chunk_id)
+            segment = segments.get(final_path)
+            if segment is None:
+                temp_path = os.path.join(self.archive_dir, f".{os.path.basename(final_path)}.tmp")
+                segment = segments[final_path] = (temp_path, gzip.open(temp_path, 'wt', encoding='utf-8'))
+            segment[1].write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n')
+
+    def iter_archived(self, start_day: str = None, end_day: str = None,
+                      phone_number: str = None) -> Iterator[Dict]:
+        """Stream archived records from the segments in [start_day, end_day], oldest day first"""
+        if not os.path.isdir(self.archive_dir):
+            return
+
+        prefix, suffix = "conversation_log-", ".jsonl.gz"
+        segments = sorted(
+            (name[len(prefix):].split('.', 1)[0], name)
+            for name in os.listdir(self.archive_dir)
+            if name.startswith(prefix) and name.endswith(suffix)
+        )
+        for day, name in segments:
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if phone_number is None or record['phone_number'] == phone_number:
+                        yield record
+
+    def get_stats(self) -> Dict:
+        """Get archiver metrics"""
+        stats = dict(self._metrics)
+        stats.update({
+            'retention_days': self.retention_days,
+            'archive_dir': self.archive_dir,
+            'batch_size': self.batch_size,
+            'chunk_batches': self.chunk_batches,
+            'max_batches': self.max_batches,
+        })
+        return stats
@@ -0,0 +1,192 @@
+# database/log_writer.py
+"""
+Asynchronous write-behind writer for the conversation log
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationLogWriter:
+    """Bounded background writer that batches conversation_log inserts.
+
+    `submit` only appends to an in-memory buffer; a daemon thread flushes the
+    buffer with `executemany` in a single transaction whenever `batch_size`
+    records are waiting or `flush_interval_ms` has passed since the oldest
+    pending record arrived.
+
+    Overflow policies when the buffer is full:
+        drop_oldest - evict the oldest pending record (default)
+        drop_newest - reject the incoming record
+        block       - wait up to `block_timeout` seconds for room, then reject
+    """
+
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, execute_write: Callable, batch_size: int = 100,
+                 flush_interval_ms: int = 200, max_queue_size: int = 10000,
+                 overflow_policy: str = 'drop_oldest', block_timeout: float = 0.5,
+                 ensure_sessions: bool = True):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self._execute_write = execute_write  # Runs a job(conn) in a write transaction
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0, int(flush_interval_ms)) / 1000.0
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        # The log table only references user_sessions when both live in one database file
+        self.ensure_sessions = ensure_sessions
+
+        self._buffer = deque()
+        self._oldest_at = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One flush at a time (worker or caller)
+        self._stopped = False
+
+        self._metrics = {
+            'submitted': 0,
+            'written': 0,
+            'dropped_overflow': 0,
+            'dropped_errors': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'max_batch': 0,
+            'last_flush_ms': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="conversation-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, phone_number: str, message_type: str, content: str,
+               ai_response: str = None, current_step: str = None) -> bool:
+        """Queue a conversation record without blocking on the database"""
+        # Capture the time now; CURRENT_TIMESTAMP would be the flush time
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        record = (phone_number, message_type or 'unknown', content or '', ai_response, current_step, timestamp)
+
+        with self._cond:
+            if self._stopped:
+                return False
+
+            if len(self._buffer) >= self.max_queue_size:
+                if self.overflow_policy == 'drop_oldest':
+                    self._buffer.popleft()
+                    self._metrics['dropped_overflow'] += 1
+                elif self.overflow_policy == 'block':
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._buffer) >= self.max_queue_size and not self._stopped:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    if len(self._buffer) >= self.max_queue_size or self._stopped:
+                        self._metrics['dropped_overflow'] += 1
+                        return False
+                else:
+                    self._metrics['dropped_overflow'] += 1
+                    return False
+
+            if not self._buffer:
+                self._oldest_at = time.monotonic()
+            self._buffer.append(record)
+            self._metrics['submitted'] += 1
+            self._cond.notify_all()
+            return True
+
+    def _run(self):
+        """Worker loop: wait for a full batch or the flush interval, then flush"""
+        while True:
+            with self._cond:
+                while not self._buffer and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return  # close() performs the final flush
+
+                deadline = self._oldest_at + self.flush_interval
+                while self._buffer and len(self._buffer) < self.batch_size and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Conversation log writer error: {e}")
+
+    def flush(self) -> int:
+        """Write every pending record now; returns the number of rows written"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._buffer:
+                    return 0
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._cond.notify_all()  # Wake producers blocked on a full buffer
+
+            start = time.perf_counter()
+            try:
+                self._execute_write(lambda conn: self._write_batch(conn, batch, self.ensure_sessions))
+            except Exception as e:
+                # Logging must never take down message processing; drop the batch
+                with self._cond:
+                    self._metrics['failed_flushes'] += 1
+                    self._metrics['dropped_errors'] += len(batch)
+                logger.error(f"❌ Error flushing {len(batch)} conversation log records: {e}")
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self._metrics['written'] += len(batch)
+                self._metrics['flushes'] += 1
+                self._metrics['max_batch'] = max(self._metrics['max_batch'], len(batch))
+                self._metrics['last_flush_ms'] = round(elapsed_ms, 2)
+            logger.debug(f"📝 Flushed {len(batch)} conversation log records in {elapsed_ms:.1f}ms")
+            return len(batch)
+
+    @staticmethod
+    def _write_batch(conn, batch, ensure_sessions=True):
+        if ensure_sessions:
+            # Ensure user sessions exist to satisfy the foreign key
+            conn.executemany("""
+                INSERT OR IGNORE INTO user_sessions
+                (phone_number, current_step, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, {(r[0], r[4] or 'waiting_for_language') for r in batch})
+        conn.executemany("""
+            INSERT INTO conversation_log
+            (phone_number, message_type, content, ai_response, current_step, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, batch)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker and flush whatever is still pending"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+
+        self._thread.join(timeout)
+        written = self.flush()
+        logger.info(f"📝 Conversation log writer stopped (final flush: {written} records)")
+
+    def get_stats(self) -> Dict:
+        """Get writer metrics"""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({
+                'pending': len(self._buffer),
+                'max_queue_size': self.max_queue_size,
+                'batch_size': self.batch_size,
+                'flush_interval_ms': int(self.flush_interval * 1000),
+                'overflow_policy': self.overflow_policy,
+            })
+            return stats
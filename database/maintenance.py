@@ -0,0 +1,208 @@
+# database/maintenance.py
+"""
+Background upkeep of one SQLite file: WAL checkpoints, planner statistics
+and incremental vacuum, deferred while the database is busy
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .query_stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+TASKS = ('checkpoint', 'analyze', 'optimize', 'vacuum')
+
+
+class DatabaseMaintenance:
+    """Runs maintenance tasks on a pooled database when they are due.
+
+    `run_due()` is called periodically from a background thread. Each task
+    has its own interval; when the pool shows traffic (connections in use or
+    a high checkout rate since the previous call) due tasks are skipped until
+    a quiet call. The one exception is a WAL file past `wal_checkpoint_mb`:
+    it gets a PASSIVE checkpoint, which never blocks readers or writers.
+
+    Statements run with a short busy timeout so maintenance gives way to
+    request traffic instead of queueing behind it.
+    """
+
+    def __init__(self, name: str, db_path: str, connection_factory: Callable,
+                 pool_stats: Callable[[], Dict], checkpoint_interval: float = 300,
+                 optimize_interval: float = 3600, analyze_interval: float = 86400,
+                 vacuum_interval: float = 3600, vacuum_pages: int = 1000,
+                 vacuum_min_free_pages: int = 100, wal_checkpoint_mb: float = 64,
+                 busy_connections: int = 2, busy_checkouts_per_s: float = 20,
+                 busy_timeout_ms: int = 1000):
+        self.name = name
+        self.db_path = db_path
+        self._connection_factory = connection_factory  # Pooled connection context manager
+        self._pool_stats = pool_stats
+
+        self.intervals = {
+            'checkpoint': checkpoint_interval,
+            'optimize': optimize_interval,
+            'analyze': analyze_interval,
+            'vacuum': vacuum_interval,
+        }
+        self.vacuum_pages = max(1, int(vacuum_pages))
+        self.vacuum_min_free_pages = max(0, int(vacuum_min_free_pages))
+        self.wal_checkpoint_bytes = int(wal_checkpoint_mb * 1024 * 1024)
+        self.busy_connections = busy_connections
+        self.busy_checkouts_per_s = busy_checkouts_per_s
+        self.busy_timeout_ms = int(busy_timeout_ms)
+
+        self._run_lock = threading.Lock()  # One maintenance pass at a time
+        started = time.monotonic()
+        self._last_run = {task: started for task in TASKS}
+        self._last_probe = (started, pool_stats().get('checkouts', 0))
+
+        self._durations = {task: Histogram() for task in TASKS}
+        self._metrics = {
+            'passes': 0,
+            'skipped_busy': 0,
+            'passive_checkpoints': 0,
+            'failures': 0,
+            'last_checkpoint': None,
+            'pages_vacuumed': 0,
+            'last_activity': None,
+        }
+
+    def wal_size(self) -> int:
+        """Current size of the -wal file in bytes"""
+        try:
+            return os.path.getsize(f"{self.db_path}-wal")
+        except OSError:
+            return 0
+
+    def _activity(self) -> Dict:
+        """Pool load since the previous call"""
+        now = time.monotonic()
+        stats = self._pool_stats()
+        checkouts = stats.get('checkouts', 0)
+        probed_at, previous = self._last_probe
+        self._last_probe = (now, checkouts)
+        elapsed = max(now - probed_at, 1e-6)
+        return {
+            'in_use_connections': stats.get('in_use_connections', 0),
+            'checkouts_per_s': round((checkouts - previous) / elapsed, 2),
+        }
+
+    def is_busy(self, activity: Dict) -> bool:
+        return (activity['in_use_connections'] >= self.busy_connections
+                or activity['checkouts_per_s'] >= self.busy_checkouts_per_s)
+
+    def run_due(self, force: bool = False) -> Dict[str, float]:
+        """Run the tasks whose interval has passed (all of them with `force`).
+
+        Returns the duration in ms of each task that ran.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {}  # Another pass is already running
+
+        try:
+            now = time.monotonic()
+            activity = self._activity()
+            self._metrics['last_activity'] = activity
+            wal_size = self.wal_size()
+            due = [task for task in TASKS if force or now - self._last_run[task] >= self.intervals[task]]
+            if wal_size >= self.wal_checkpoint_bytes and 'checkpoint' not in due:
+                due.insert(0, 'checkpoint')
+            if not due:
+                return {}
+
+            if not force and self.is_busy(activity):
+                self._metrics['skipped_busy'] += 1
+                if 'checkpoint' in due and wal_size >= self.wal_checkpoint_bytes:
+                    # Keep the WAL bounded under sustained load without blocking anyone
+                    self._run_task('checkpoint', lambda conn: self._checkpoint(conn, 'PASSIVE'))
+                    self._metrics['passive_checkpoints'] += 1
+                logger.debug(f"⏳ Deferred {self.name} maintenance ({', '.join(due)}): {activity}")
+                return {}
+
+            runners = {
+                'checkpoint': lambda conn: self._checkpoint(conn, 'TRUNCATE'),
+                'optimize': self._optimize,
+                'analyze': lambda conn: conn.execute("ANALYZE"),
+                'vacuum': self._incremental_vacuum,
+            }
+            durations = {}
+            for task in due:
+                if task == 'optimize' and 'analyze' in durations:
+                    self._last_run[task] = time.monotonic()  # A full ANALYZE just ran
+                    continue
+                elapsed_ms = self._run_task(task, runners[task])
+                if elapsed_ms is not None:
+                    durations[task] = elapsed_ms
+            self._metrics['passes'] += 1
+            if durations:
+                logger.info(f"🧽 {self.name} maintenance: " +
+                            ", ".join(f"{task} {ms:.1f}ms" for task, ms in durations.items()))
+            return durations
+        finally:
+            self._run_lock.release()
+
+    def _run_task(self, task: str, runner: Callable[[sqlite3.Connection], None]) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            with self._connection_factory() as conn:
+                previous_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+                conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+                try:
+                    runner(conn)
+                finally:
+                    conn.execute(f"PRAGMA busy_timeout = {previous_timeout}")
+        except sqlite3.Error as e:
+            self._metrics['failures'] += 1
+            logger.warning(f"⚠️ {self.name} maintenance task '{task}' failed: {e}")
+            return None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._durations[task].add(elapsed_ms)
+        self._last_run[task] = time.monotonic()
+        return elapsed_ms
+
+    def _checkpoint(self, conn: sqlite3.Connection, mode: str):
+        busy, wal_pages, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        self._metrics['last_checkpoint'] = {
+            'mode': mode,
+            'busy': bool(busy),
+            'wal_pages': wal_pages,
+            'checkpointed_pages': checkpointed,
+            'wal_bytes_after': self.wal_size(),
+        }
+
+    def _optimize(self, conn: sqlite3.Connection):
+        # PRAGMA optimize only refreshes existing statistics; gather them once first
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
+
+    def _incremental_vacuum(self, conn: sqlite3.Connection):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return  # Only files created with auto_vacuum=INCREMENTAL can shrink incrementally
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages < self.vacuum_min_free_pages:
+            return
+        # executescript steps the pragma to completion (execute frees a single page)
+        conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+        self._metrics['pages_vacuumed'] += free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def get_stats(self) -> Dict:
+        """Get maintenance metrics"""
+        now = time.monotonic()
+        stats = dict(self._metrics)
+        stats.update({
+            'wal_bytes': self.wal_size(),
+            'tasks': {
+                task: dict(self._durations[task].to_dict(),
+                           interval_s=self.intervals[task],
+                           seconds_since_run=round(now - self._last_run[task], 1))
+                for task in TASKS
+            },
+        })
+        return stats
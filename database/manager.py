@@ -1,8 +1,15 @@
 import sqlite3
 import json
 import logging
-from typing import Dict, List, Optional
+from contextlib import closing
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 from .models import DatabaseSchema, UserSession, MenuItem, UserOrder, OrderDetails
+from .migrations import apply_migrations, insert_completed_order_items
+from .order_ids import OrderIdAllocator
+from .write_queue import run_in_transaction
+from .item_stats import record_order_items
+from .counters import read_counters
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +20,7 @@ class DatabaseManager:
     def get_available_categories(self) -> List[Dict]:
         """Get main categories for compatibility with old code"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.execute("""
                     SELECT id as category_id, name_ar as category_name_ar, name_en as category_name_en
@@ -29,7 +36,7 @@ class DatabaseManager:
     def get_category_items(self, main_category_id: int) -> List[Dict]:
         """Get all items for a main category (all sub-categories combined)"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.execute("""
                     SELECT mi.id, mi.sub_category_id, mi.main_category_id, 
@@ -78,13 +85,23 @@ class DatabaseManager:
             logger.error(f"❌ Error getting simplified workflow data: {e}")
             return {'type': 'error', 'data': []}
 
+    def _connect(self, timeout: float = 5.0) -> sqlite3.Connection:
+        """Open a connection with the pragmas the counter triggers rely on"""
+        conn = sqlite3.connect(self.db_path, timeout=timeout)
+        # INSERT OR REPLACE must fire the delete triggers, or db_counters drift
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
     def __init__(self, db_path: str = "hef_cafe.db"):
         self.db_path = db_path
         self.init_database()
+        self._order_ids = OrderIdAllocator(partial(
+            run_in_transaction, lambda: closing(self._connect(timeout=60.0))
+        ))
 
     def init_database(self):
         """Initialize SQLite database with all required tables"""
-        with sqlite3.connect(self.db_path, timeout=60.0) as conn:
+        with self._connect(timeout=60.0) as conn:
             # Configure database for better concurrency
             conn.execute("PRAGMA journal_mode=WAL")
             conn.execute("PRAGMA synchronous=NORMAL")
@@ -107,6 +124,9 @@ class DatabaseManager:
                     conn.execute(sql)
                     logger.info(f" Created/verified table: {table_name}")
 
+            # Bring the schema up to date
+            apply_migrations(conn)
+
             # Populate initial data
             self.populate_initial_data()
 
@@ -154,7 +174,7 @@ class DatabaseManager:
     def populate_initial_data(self):
         """Populate database with initial data"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -206,7 +226,7 @@ class DatabaseManager:
     def get_user_session(self, phone_number: str) -> Optional[Dict]:
         """Get user session with new structure"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -243,7 +263,7 @@ class DatabaseManager:
                                 selected_sub_category: int = None, selected_item: int = None) -> bool:
         """Create or update user session with new structure"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -285,7 +305,7 @@ class DatabaseManager:
     def delete_session(self, phone_number: str) -> bool:
         """Delete user session and related data with better error handling"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 # Enable WAL mode for better concurrency
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
@@ -310,7 +330,7 @@ class DatabaseManager:
                 import time
                 time.sleep(1)
                 try:
-                    with sqlite3.connect(self.db_path, timeout=60.0) as conn:
+                    with self._connect(timeout=60.0) as conn:
                         conn.execute("PRAGMA journal_mode=WAL")
                         conn.execute("PRAGMA busy_timeout=60000")
                         conn.execute("PRAGMA synchronous=NORMAL")
@@ -348,7 +368,7 @@ class DatabaseManager:
             logger.info("✅ New user, allowing language selection")
             return True
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.execute("""
                 SELECT allowed_next_steps FROM step_rules 
                 WHERE current_step = ?
@@ -367,33 +387,10 @@ class DatabaseManager:
             return is_allowed
 
     # Menu Operations
-    def get_available_categories(self) -> List[Dict]:
-        """Get all available menu categories"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT DISTINCT category_id, category_name_ar, category_name_en
-                FROM menu_items 
-                WHERE available = 1
-                ORDER BY category_id
-            """)
-            return [dict(row) for row in cursor.fetchall()]
-
-    def get_category_items(self, category_id: int) -> List[Dict]:
-        """Get items for specific category"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM menu_items 
-                WHERE category_id = ? AND available = 1
-                ORDER BY id
-            """, (category_id,))
-            return [dict(row) for row in cursor.fetchall()]
-
     def get_item_by_id(self, item_id: int) -> Optional[Dict]:
         """Get menu item by ID with new structure"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -425,7 +422,7 @@ class DatabaseManager:
     def add_item_to_order(self, phone_number: str, item_id: int, quantity: int, special_requests: str = None, special_price: int = None) -> bool:
         """Add item to user's order with new structure"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -464,10 +461,54 @@ class DatabaseManager:
             logger.error(f"❌ Error adding item to order: {e}")
             return False
 
+    def add_items_to_order(self, phone_number: str, items: List[Tuple]) -> int:
+        """Add several (item_id, quantity[, special_price[, special_requests]]) items in one transaction"""
+        entries = [tuple(entry) + (None,) * (4 - len(entry)) for entry in items]
+        if not entries:
+            return 0
+        try:
+            with self._connect(timeout=30.0) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA busy_timeout=30000")
+
+                # Get item prices in one query
+                item_ids = sorted({entry[0] for entry in entries})
+                placeholders = ', '.join('?' * len(item_ids))
+                prices = dict(conn.execute(
+                    f"SELECT id, price FROM menu_items WHERE id IN ({placeholders}) AND available = 1",
+                    item_ids
+                ).fetchall())
+
+                rows = []
+                for item_id, quantity, special_price, special_requests in entries:
+                    if item_id not in prices:
+                        logger.error(f"❌ Item {item_id} not found or not available")
+                        continue
+                    price = special_price if special_price is not None else prices[item_id]
+                    rows.append((phone_number, item_id, quantity, price * quantity, special_requests))
+
+                if rows:
+                    conn.executemany("""
+                        INSERT INTO user_orders (phone_number, menu_item_id, quantity, subtotal, special_requests)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, rows)
+                    conn.execute("""
+                        INSERT OR IGNORE INTO order_details (phone_number)
+                        VALUES (?)
+                    """, (phone_number,))
+
+                conn.commit()
+                logger.info(f"✅ Added {len(rows)} items to order for {phone_number}")
+                return len(rows)
+
+        except Exception as e:
+            logger.error(f"❌ Error adding items to order: {e}")
+            return 0
+
     def get_user_order(self, phone_number: str) -> Optional[Dict]:
         """Get user's current order with new menu structure"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -482,7 +523,6 @@ class DatabaseManager:
                 """, (phone_number,))
                 
                 items = []
-                total = 0
                 
                 for row in cursor.fetchall():
                     item = {
@@ -499,11 +539,10 @@ class DatabaseManager:
                         'unit': row[10]
                     }
                     items.append(item)
-                    total += row[4]
                 
-                # Get order details
+                # Get order details (totals are maintained by triggers on user_orders)
                 cursor = conn.execute("""
-                    SELECT service_type, location, total_amount, customizations, order_status
+                    SELECT service_type, location, total_amount, customizations, order_status, item_count
                     FROM order_details 
                     WHERE phone_number = ?
                 """, (phone_number,))
@@ -513,13 +552,14 @@ class DatabaseManager:
                     'service_type': details_row[0] if details_row else None,
                     'location': details_row[1] if details_row else None,
                     'total_amount': details_row[2] if details_row else 0,
+                    'item_count': details_row[5] if details_row else 0,
                     'customizations': details_row[3] if details_row else None,
                     'order_status': details_row[4] if details_row else 'in_progress'
                 }
                 
                 return {
                     'items': items,
-                    'total': total,
+                    'total': details['total_amount'],
                     'details': details
                 }
                 
@@ -527,11 +567,23 @@ class DatabaseManager:
             logger.error(f"❌ Error getting user order: {e}")
             return None
 
+    def get_order_total(self, phone_number: str) -> int:
+        """Get the stored cart total without reading the cart items"""
+        try:
+            with self._connect(timeout=30.0) as conn:
+                row = conn.execute(
+                    "SELECT total_amount FROM order_details WHERE phone_number = ?", (phone_number,)
+                ).fetchone()
+                return row[0] if row else 0
+        except Exception as e:
+            logger.error(f"❌ Error getting order total: {e}")
+            return 0
+
     def update_order_details(self, phone_number: str, service_type: str = None,
                              location: str = None, customizations: str = None) -> bool:
         """Update order service details using UPSERT"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 # First, ensure the record exists
                 conn.execute("""
                     INSERT OR IGNORE INTO order_details (phone_number)
@@ -570,10 +622,9 @@ class DatabaseManager:
     def complete_order(self, phone_number: str) -> str:
         """Complete order and generate order ID with better error handling"""
         try:
-            import random
-            order_id = f"HEF{random.randint(1000, 9999)}"
+            order_id = self._order_ids.next_id()
 
-            with sqlite3.connect(self.db_path, timeout=60.0) as conn:
+            with self._connect(timeout=60.0) as conn:
                 # Enable WAL mode for better concurrency
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=60000")
@@ -595,6 +646,8 @@ class DatabaseManager:
                     order['details'].get('service_type'),
                     order['details'].get('location')
                 ))
+                insert_completed_order_items(conn, order_id, order['items'])
+                record_order_items(conn, order['items'])
 
                 # Clear current order data (but don't delete session yet)
                 conn.execute("DELETE FROM user_orders WHERE phone_number = ?", (phone_number,))
@@ -618,7 +671,7 @@ class DatabaseManager:
                 import time
                 time.sleep(2)
                 try:
-                    with sqlite3.connect(self.db_path, timeout=120.0) as conn:
+                    with self._connect(timeout=120.0) as conn:
                         conn.execute("PRAGMA journal_mode=WAL")
                         conn.execute("PRAGMA busy_timeout=120000")
                         conn.execute("PRAGMA synchronous=NORMAL")
@@ -639,6 +692,8 @@ class DatabaseManager:
                             order['details'].get('service_type'),
                             order['details'].get('location')
                         ))
+                        insert_completed_order_items(conn, order_id, order['items'])
+                        record_order_items(conn, order['items'])
 
                         # Clear current order data
                         conn.execute("DELETE FROM user_orders WHERE phone_number = ?", (phone_number,))
@@ -666,7 +721,7 @@ class DatabaseManager:
     def remove_last_item_from_order(self, phone_number: str) -> bool:
         """Remove the last added item from user's order"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -702,7 +757,7 @@ class DatabaseManager:
     def update_item_quantity(self, phone_number: str, item_id: int, new_quantity: int) -> bool:
         """Update quantity of existing item in user's order"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -723,7 +778,7 @@ class DatabaseManager:
     def delete_menu_item(self, item_id: int) -> bool:
         """Delete a menu item by setting it as unavailable"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -753,7 +808,7 @@ class DatabaseManager:
                          ai_response: str = None, current_step: str = None):
         """Log conversation for analytics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.execute("""
                     INSERT INTO conversation_log 
                     (phone_number, message_type, content, ai_response, current_step)
@@ -766,7 +821,7 @@ class DatabaseManager:
     # Analytics and Reporting
     def get_order_history(self, phone_number: str = None, limit: int = 50) -> List[Dict]:
         """Get order history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
 
             if phone_number:
@@ -787,7 +842,7 @@ class DatabaseManager:
 
     def get_conversation_history(self, phone_number: str, limit: int = 100) -> List[Dict]:
         """Get conversation history for a user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute("""
                 SELECT * FROM conversation_log 
@@ -800,16 +855,21 @@ class DatabaseManager:
 
     def get_popular_items(self, limit: int = 10) -> List[Dict]:
         """Get most popular menu items"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute("""
                 SELECT 
-                    co.items_json,
-                    COUNT(*) as order_count,
-                    SUM(co.total_amount) as total_revenue
-                FROM completed_orders co
-                GROUP BY co.items_json
-                ORDER BY order_count DESC
+                    s.menu_item_id,
+                    mi.item_name_ar,
+                    mi.item_name_en,
+                    mi.price,
+                    s.order_count,
+                    s.total_quantity,
+                    s.total_revenue,
+                    s.last_ordered_at
+                FROM item_stats s
+                LEFT JOIN menu_items mi ON mi.id = s.menu_item_id
+                ORDER BY s.decay_score DESC
                 LIMIT ?
             """, (limit,))
 
@@ -819,7 +879,7 @@ class DatabaseManager:
     def cleanup_old_sessions(self, days_old: int = 7) -> int:
         """Clean up old user sessions"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.execute("""
                     DELETE FROM user_sessions 
                     WHERE created_at < datetime('now', '-{} days')
@@ -836,7 +896,7 @@ class DatabaseManager:
 
     def get_database_stats(self) -> Dict:
         """Get database statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             stats = {}
 
             # Count records in each table
@@ -851,16 +911,15 @@ class DatabaseManager:
             cursor = conn.execute("SELECT COUNT(DISTINCT phone_number) FROM user_sessions")
             stats['active_users'] = cursor.fetchone()[0]
 
-            cursor = conn.execute("SELECT SUM(total_amount) FROM completed_orders")
-            total_revenue = cursor.fetchone()[0]
-            stats['total_revenue'] = total_revenue or 0
+            # Trigger-maintained total instead of summing every completed order
+            stats['total_revenue'] = read_counters(conn).get('total_revenue', 0)
 
             return stats
 
     def get_main_categories(self) -> List[Dict]:
         """Get all main categories"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -889,7 +948,7 @@ class DatabaseManager:
     def get_sub_categories(self, main_category_id: int) -> List[Dict]:
         """Get sub categories for a main category"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -919,7 +978,7 @@ class DatabaseManager:
     def get_sub_category_items(self, sub_category_id: int) -> List[Dict]:
         """Get items for a sub category"""
         try:
-            with sqlite3.connect(self.db_path, timeout=30.0) as conn:
+            with self._connect(timeout=30.0) as conn:
                 conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("PRAGMA busy_timeout=30000")
                 
@@ -0,0 +1,404 @@
+# database/memory_storage.py
+"""
+Pure in-memory storage backend for benchmarks and tests
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cart_cache import Cart, DEFAULT_DETAILS
+from .item_stats import DEFAULT_HALF_LIFE_DAYS, decay_rate, _log_add
+from .menu_catalog import MenuCatalog
+from .models import (
+    DatabaseSchema, MainCategory, SubCategory, MenuItem, CartItem, CompletedOrder, CompletedOrderItem
+)
+from .storage import StorageBackend, session_from_state
+from utils.thread_safe_session import session_manager
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp() -> str:
+    """UTC timestamp formatted like SQLite's CURRENT_TIMESTAMP"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class InMemoryStorage(StorageBackend):
+    """StorageBackend keeping everything in process memory.
+
+    Behaves like ThreadSafeDatabaseManager (same return shapes, same cart
+    totals, same order ID format) but never touches disk, so handler
+    performance can be measured without SQLite I/O. Nothing survives a
+    restart and nothing is shared between processes.
+    """
+
+    def __init__(self, log_size: int = 10000, half_life_days: float = DEFAULT_HALF_LIFE_DAYS,
+                 order_id_prefix: str = "HEF"):
+        self._lock = threading.RLock()
+        self._decay_rate = decay_rate(half_life_days)
+        self._order_id_prefix = order_id_prefix
+
+        # Menu rows (unavailable items included, for names in order history)
+        self._main_categories = {row[0]: MainCategory(*row) for row in DatabaseSchema.get_initial_menu_data()}
+        self._sub_categories = {row[0]: SubCategory(*row) for row in DatabaseSchema.get_initial_sub_categories()}
+        self._menu_items = {row[0]: MenuItem(*row) for row in DatabaseSchema.get_initial_items()}
+        self._menu_version = 0
+        self._catalog = self._build_catalog()
+
+        self._carts: Dict[str, Cart] = {}
+        self._next_line_id = 1
+
+        self._completed_orders: List[CompletedOrder] = []
+        self._completed_items: Dict[str, List[CompletedOrderItem]] = {}  # order_id -> line items
+        self._order_day = None
+        self._order_sequence = 0
+        self._item_stats: Dict[int, Dict] = {}
+
+        self._conversation_log = deque(maxlen=max(1, int(log_size)))
+
+        logger.info("✅ In-memory storage initialized")
+
+    def _build_catalog(self) -> MenuCatalog:
+        # Caller holds self._lock (or is __init__)
+        self._menu_version += 1
+        return MenuCatalog(self._menu_version, list(self._main_categories.values()),
+                           list(self._sub_categories.values()), list(self._menu_items.values()))
+
+    # Sessions (live state is the session manager's cache; nothing to persist)
+    def get_user_session(self, phone_number: str) -> Optional[Dict]:
+        """Get user session"""
+        state = session_manager.get_user_state(phone_number)
+        return session_from_state(state) if state else None
+
+    def create_or_update_session(self, phone_number: str, current_step: str,
+                                 language: str = None, customer_name: str = None,
+                                 selected_main_category: int = None,
+                                 selected_sub_category: int = None,
+                                 selected_item: int = None,
+                                 order_mode: str = None, quick_order_item: str = None) -> bool:
+        """Create or update user session"""
+        with session_manager.user_session_lock(phone_number):
+            try:
+                session_manager.create_or_update_user_state(
+                    phone_number=phone_number,
+                    current_step=current_step,
+                    language_preference=language,
+                    customer_name=customer_name,
+                    selected_main_category=selected_main_category,
+                    selected_sub_category=selected_sub_category,
+                    selected_item=selected_item,
+                    order_mode=order_mode,
+                    quick_order_item=quick_order_item
+                )
+                return True
+            except Exception as e:
+                logger.error(f"❌ Error updating session for {phone_number}: {e}")
+                return False
+
+    def update_session_field(self, phone_number: str, field_name: str, value: Any) -> bool:
+        """Update a specific field in user session"""
+        with session_manager.user_session_lock(phone_number):
+            state = session_manager.get_user_state(phone_number)
+            if state is not None and hasattr(state, field_name):
+                setattr(state, field_name, value)
+                state.touch()
+            return True
+
+    def delete_session(self, phone_number: str, only_session: bool = False) -> bool:
+        """Delete user session (with its cart and conversation log unless `only_session`)"""
+        with session_manager.user_session_lock(phone_number):
+            session_manager.delete_user_state(phone_number)
+            with self._lock:
+                if not only_session:
+                    self._carts.pop(phone_number, None)
+                self._delete_conversation_log(phone_number)
+            return True
+
+    def cleanup_expired_sessions(self, days_old: int = 7) -> int:
+        """Clean up expired sessions"""
+        return session_manager.cleanup_expired_sessions()
+
+    # Carts
+    def add_items_to_order(self, phone_number: str, items: List[Tuple]) -> int:
+        """Add (item_id, quantity[, special_price[, special_requests]]) items; returns how many were added"""
+        entries = [tuple(entry) + (None,) * (4 - len(entry)) for entry in items]
+        added = 0
+        with session_manager.user_session_lock(phone_number), self._lock:
+            cart = self._carts.get(phone_number)
+            for item_id, quantity, special_price, special_requests in entries:
+                item = self._catalog.item(item_id)
+                if not item:
+                    logger.error(f"❌ Item {item_id} not found or not available")
+                    continue
+
+                price = item.price if special_price is None else special_price
+                if cart is None:
+                    cart = self._carts[phone_number] = Cart([], DEFAULT_DETAILS)
+                cart.items.append(CartItem(self._next_line_id, phone_number, item.id, quantity,
+                                           price * quantity, special_requests, _timestamp(),
+                                           item.item_name_ar, item.item_name_en, item.price,
+                                           item.unit or 'piece'))
+                cart.adjust(price * quantity, 1)
+                self._next_line_id += 1
+                added += 1
+        return added
+
+    def get_user_order(self, phone_number: str) -> Optional[Dict]:
+        """Get user order"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            return cart.snapshot() if cart else Cart([], DEFAULT_DETAILS).snapshot()
+
+    def get_order_total(self, phone_number: str) -> int:
+        """Get the cart total"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            return cart.total if cart else 0
+
+    def _remove_lines(self, phone_number: str, predicate) -> int:
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            if cart is None:
+                return 0
+            removed = [item for item in cart.items if predicate(item)]
+            if removed:
+                cart.items = [item for item in cart.items if not predicate(item)]
+                cart.adjust(-sum(item.subtotal for item in removed), -len(removed))
+            return len(removed)
+
+    def remove_last_item_from_order(self, phone_number: str) -> bool:
+        """Remove the last added item from user's order"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            last_id = cart.items[-1].id if cart and cart.items else None
+            return self._remove_lines(phone_number, lambda item: item.id == last_id) > 0
+
+    def remove_item_from_order(self, phone_number: str, menu_item_id: int) -> bool:
+        """Remove a specific item from user's order by menu_item_id"""
+        return self._remove_lines(phone_number, lambda item: item.menu_item_id == menu_item_id) > 0
+
+    def update_item_quantity(self, phone_number: str, item_id: int, new_quantity: int) -> bool:
+        """Update quantity of existing item in user's order"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            if cart is None:
+                return False
+            delta = 0
+            updated = 0
+            for i, item in enumerate(cart.items):
+                if item.menu_item_id == item_id:
+                    subtotal = new_quantity * item.price
+                    delta += subtotal - item.subtotal
+                    cart.items[i] = replace(item, quantity=new_quantity, subtotal=subtotal)
+                    updated += 1
+            cart.adjust(delta, 0)
+            return updated > 0
+
+    def update_order_details(self, phone_number: str, **kwargs) -> bool:
+        """Update order details"""
+        with self._lock:
+            cart = self._carts.get(phone_number)
+            if cart is None:
+                cart = self._carts[phone_number] = Cart([], DEFAULT_DETAILS)
+            cart.details.update({field: value for field, value in kwargs.items() if value is not None})
+            return True
+
+    def cancel_order(self, phone_number: str) -> bool:
+        """Cancel order and reset the session to the first step"""
+        with session_manager.user_session_lock(phone_number):
+            with self._lock:
+                self._carts.pop(phone_number, None)
+            state = session_manager.get_user_state(phone_number)
+            if state is not None:
+                state.current_step = 'waiting_for_language'
+                state.selected_main_category = None
+                state.selected_sub_category = None
+                state.selected_item = None
+                state.touch()
+            return True
+
+    def complete_order(self, phone_number: str) -> Optional[str]:
+        """Move the cart to completed orders and clear the user's state"""
+        with session_manager.user_session_lock(phone_number):
+            with self._lock:
+                cart = self._carts.get(phone_number)
+                if cart is None or not cart.items:
+                    logger.error(f"❌ No order found for {phone_number}")
+                    return None
+
+                day = datetime.now().strftime('%y%m%d')
+                if day != self._order_day:
+                    self._order_day, self._order_sequence = day, 0
+                self._order_sequence += 1
+                order_id = f"{self._order_id_prefix}{day}{self._order_sequence:04d}"
+
+                completed_at = _timestamp()
+                self._completed_orders.append(CompletedOrder(
+                    len(self._completed_orders) + 1, phone_number, order_id,
+                    json.dumps([item.to_dict() for item in cart.items]), cart.total,
+                    cart.details.get('service_type'), cart.details.get('location'), completed_at
+                ))
+                self._completed_items[order_id] = [
+                    CompletedOrderItem(None, order_id, item.menu_item_id, item.quantity, item.subtotal)
+                    for item in cart.items
+                ]
+                self._record_order_items(cart.items, completed_at)
+
+                del self._carts[phone_number]
+                self._delete_conversation_log(phone_number)
+
+            session_manager.delete_user_state(phone_number)
+            logger.info(f"✅ Order {order_id} completed for {phone_number}")
+            return order_id
+
+    def _record_order_items(self, items: List[CartItem], completed_at: str):
+        """Same time-decayed popularity scores as item_stats.record_order_items"""
+        # Caller holds self._lock
+        now = time.time()
+        totals: Dict[int, List[int]] = {}
+        for item in items:
+            quantity, subtotal = totals.get(item.menu_item_id, (0, 0))
+            totals[item.menu_item_id] = [quantity + (item.quantity or 1), subtotal + (item.subtotal or 0)]
+
+        for menu_item_id, (quantity, subtotal) in totals.items():
+            stats = self._item_stats.setdefault(menu_item_id, {
+                'order_count': 0, 'total_quantity': 0, 'total_revenue': 0,
+                'last_ordered_at': None, 'decay_score': None
+            })
+            stats['order_count'] += 1
+            stats['total_quantity'] += quantity
+            stats['total_revenue'] += subtotal
+            stats['last_ordered_at'] = completed_at
+            stats['decay_score'] = _log_add(stats['decay_score'],
+                                            self._decay_rate * now + math.log(max(quantity, 1)))
+
+    # Menu
+    def get_main_categories(self) -> List[Dict]:
+        """Get main categories"""
+        return self._catalog.get_main_categories()
+
+    def get_sub_categories(self, main_category_id: int) -> List[Dict]:
+        """Get sub-categories for a main category"""
+        return self._catalog.get_sub_categories(main_category_id)
+
+    def get_sub_category_items(self, sub_category_id: int) -> List[Dict]:
+        """Get items for a specific sub-category"""
+        return self._catalog.get_sub_category_items(sub_category_id)
+
+    def get_category_items(self, main_category_id: int) -> List[Dict]:
+        """Get all items for a main category"""
+        return self._catalog.get_category_items(main_category_id)
+
+    def get_item_by_id(self, item_id: int) -> Optional[Dict]:
+        """Get item by ID"""
+        return self._catalog.get_item_by_id(item_id)
+
+    def get_all_menu_items(self) -> List[Dict]:
+        """Get every available item across all categories, in menu order"""
+        return self._catalog.get_all_items()
+
+    def get_popular_items(self, limit: int = 5) -> List[Dict]:
+        """Get the top available menu items by time-decayed order volume"""
+        with self._lock:
+            ranked = sorted(self._item_stats.items(), key=lambda entry: entry[1]['decay_score'], reverse=True)
+
+        popular_items = []
+        for menu_item_id, stats in ranked:
+            item = self._catalog.item(menu_item_id)
+            if not item:
+                continue
+            popular = item.to_dict()
+            popular.update({name: value for name, value in stats.items() if name != 'decay_score'})
+            popular_items.append(popular)
+            if len(popular_items) >= limit:
+                break
+        return popular_items
+
+    def delete_menu_item(self, item_id: int) -> bool:
+        """Mark a menu item unavailable"""
+        with self._lock:
+            item = self._menu_items.get(item_id)
+            if not item or not item.available:
+                logger.warning(f"⚠️ Menu item with ID {item_id} not found or already deleted")
+                return False
+            self._menu_items[item_id] = replace(item, available=False)
+            self._catalog = self._build_catalog()
+        logger.info(f"✅ Successfully deleted menu item with ID: {item_id}")
+        return True
+
+    # Completed orders
+    def get_order_history(self, phone_number: str = None, limit: int = 50) -> List[Dict]:
+        """Get order history, newest first"""
+        with self._lock:
+            orders = [order for order in reversed(self._completed_orders)
+                      if phone_number is None or order.phone_number == phone_number]
+            return [order.to_dict() for order in orders[:limit]]
+
+    def get_recent_order_items(self, phone_number: str, limit: int = 3) -> List[Dict]:
+        """Get the line items of a user's most recent completed orders, newest order first"""
+        with self._lock:
+            recent_items = []
+            orders = [order for order in reversed(self._completed_orders) if order.phone_number == phone_number]
+            for order in orders[:limit]:
+                for line in self._completed_items.get(order.order_id, ()):
+                    menu_item = self._menu_items.get(line.menu_item_id)
+                    recent_items.append({
+                        'order_id': order.order_id,
+                        'completed_at': order.completed_at,
+                        'menu_item_id': line.menu_item_id,
+                        'quantity': line.quantity,
+                        'subtotal': line.subtotal,
+                        'item_name_ar': menu_item.item_name_ar if menu_item else 'Unknown Item',
+                        'item_name_en': menu_item.item_name_en if menu_item else 'Unknown Item'
+                    })
+            return recent_items
+
+    # Conversation log (bounded: the oldest records are dropped first)
+    def log_conversation(self, phone_number: str, message_type: str, content: str,
+                         ai_response: str = None, current_step: str = None):
+        """Record a conversation message"""
+        with self._lock:
+            self._conversation_log.append({
+                'phone_number': phone_number,
+                'message_type': message_type,
+                'content': content,
+                'ai_response': ai_response,
+                'current_step': current_step,
+                'timestamp': _timestamp()
+            })
+
+    def get_conversation_log(self, phone_number: str = None) -> List[Dict]:
+        """Get logged conversation records, oldest first"""
+        with self._lock:
+            return [dict(record) for record in self._conversation_log
+                    if phone_number is None or record['phone_number'] == phone_number]
+
+    def _delete_conversation_log(self, phone_number: str):
+        # Caller holds self._lock
+        kept = [record for record in self._conversation_log if record['phone_number'] != phone_number]
+        if len(kept) != len(self._conversation_log):
+            self._conversation_log.clear()
+            self._conversation_log.extend(kept)
+
+    # Stats
+    def get_database_stats(self) -> Dict:
+        """Get storage statistics"""
+        with self._lock:
+            stats = {
+                'backend': 'memory',
+                'menu_items_count': len(self._menu_items),
+                'user_orders_count': sum(len(cart.items) for cart in self._carts.values()),
+                'order_details_count': len(self._carts),
+                'completed_orders_count': len(self._completed_orders),
+                'conversation_log_count': len(self._conversation_log),
+                'total_revenue': sum(order.total_amount for order in self._completed_orders),
+            }
+        stats.update(session_manager.get_session_stats())
+        stats['active_users'] = stats['active_sessions']
+        return stats
@@ -0,0 +1,127 @@
+# database/menu_catalog.py
+"""
+Immutable in-memory snapshot of the menu, indexed for O(1) reads
+"""
+import logging
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+
+from .models import MainCategory, SubCategory, MenuItem
+
+logger = logging.getLogger(__name__)
+
+
+def _as_id(value) -> Optional[int]:
+    """Normalize an id the way SQLite's INTEGER affinity would ('5' -> 5)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MenuCatalog:
+    """Versioned, read-only menu snapshot.
+
+    A catalog is built once from the database and never mutated afterwards;
+    when the menu version changes the manager builds a new catalog and swaps
+    the reference. Rows are frozen model instances: `item()` hands them out
+    as is, the dict getters return fresh dict views for the handlers.
+    """
+
+    def __init__(self, version: int, main_categories: List[MainCategory],
+                 sub_categories: List[SubCategory], items: List[MenuItem]):
+        self.version = version
+
+        # Available main categories in display order
+        self._main_categories: Tuple[MainCategory, ...] = tuple(
+            sorted((c for c in main_categories if c.available), key=lambda c: c.display_order)
+        )
+
+        # Available sub-categories per main category, in display order
+        sub_by_main: Dict[int, List[SubCategory]] = {}
+        for sub in sorted(sub_categories, key=lambda s: s.display_order):
+            if sub.available:
+                sub_by_main.setdefault(sub.main_category_id, []).append(sub)
+
+        # Available items, indexed by id, sub-category and main category (name order)
+        available_items = sorted((i for i in items if i.available), key=lambda i: i.item_name_ar)
+        items_by_sub: Dict[int, List[MenuItem]] = {}
+        items_by_main: Dict[int, List[MenuItem]] = {}
+        for item in available_items:
+            items_by_sub.setdefault(item.sub_category_id, []).append(item)
+            items_by_main.setdefault(item.main_category_id, []).append(item)
+
+        self._sub_by_main = MappingProxyType({k: tuple(v) for k, v in sub_by_main.items()})
+        self._items_by_sub = MappingProxyType({k: tuple(v) for k, v in items_by_sub.items()})
+        self._items_by_main = MappingProxyType({k: tuple(v) for k, v in items_by_main.items()})
+        self._items_by_id = MappingProxyType({item.id: item for item in available_items})
+
+        # Browse order used by quick-order search: main -> sub -> item
+        self._all_items: Tuple[MenuItem, ...] = tuple(
+            item
+            for main in self._main_categories
+            for sub in self._sub_by_main.get(main.id, ())
+            for item in self._items_by_sub.get(sub.id, ())
+        )
+
+    @classmethod
+    def load(cls, conn, version: int) -> 'MenuCatalog':
+        """Build a catalog from the menu tables using an open connection"""
+        main_categories = [
+            MainCategory(*row[:4], available=bool(row[4]))
+            for row in conn.execute("""
+                SELECT id, name_ar, name_en, display_order, available
+                FROM main_categories
+            """)
+        ]
+
+        sub_categories = [
+            SubCategory(*row[:5], available=bool(row[5]))
+            for row in conn.execute("""
+                SELECT id, main_category_id, name_ar, name_en, display_order, available
+                FROM sub_categories
+            """)
+        ]
+
+        items = [
+            MenuItem(*row[:7], available=bool(row[7]))
+            for row in conn.execute("""
+                SELECT id, sub_category_id, main_category_id, item_name_ar,
+                       item_name_en, price, unit, available
+                FROM menu_items
+            """)
+        ]
+
+        catalog = cls(version, main_categories, sub_categories, items)
+        logger.info(f"📚 Loaded menu catalog v{version}: {len(catalog._main_categories)} categories, "
+                    f"{len(catalog._items_by_id)} items")
+        return catalog
+
+    def item(self, item_id: int) -> Optional[MenuItem]:
+        """Get an available item by ID as the shared (frozen) model instance"""
+        return self._items_by_id.get(_as_id(item_id))
+
+    def get_main_categories(self) -> List[Dict]:
+        """Get available main categories"""
+        return [c.to_dict() for c in self._main_categories]
+
+    def get_sub_categories(self, main_category_id: int) -> List[Dict]:
+        """Get available sub-categories for a main category"""
+        return [s.to_dict() for s in self._sub_by_main.get(_as_id(main_category_id), ())]
+
+    def get_sub_category_items(self, sub_category_id: int) -> List[Dict]:
+        """Get available items for a sub-category"""
+        return [i.to_dict() for i in self._items_by_sub.get(_as_id(sub_category_id), ())]
+
+    def get_category_items(self, main_category_id: int) -> List[Dict]:
+        """Get all available items for a main category"""
+        return [i.to_dict() for i in self._items_by_main.get(_as_id(main_category_id), ())]
+
+    def get_item_by_id(self, item_id: int) -> Optional[Dict]:
+        """Get an available item by ID"""
+        item = self._items_by_id.get(_as_id(item_id))
+        return item.to_dict() if item else None
+
+    def get_all_items(self) -> List[Dict]:
+        """Get every browsable item in menu order"""
+        return [i.to_dict() for i in self._all_items]
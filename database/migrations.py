@@ -0,0 +1,356 @@
+# database/migrations.py
+"""
+Versioned schema migrations applied at startup
+"""
+import sqlite3
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, List
+
+from .models import DatabaseSchema
+from .item_stats import record_order_items
+from .counters import get_counter_trigger_definitions, refresh_counters
+from .order_totals import get_order_total_trigger_definitions, verify_order_totals
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A single, ordered schema change"""
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+# Ordered registry, filled by the @migration decorator below
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a function as the migration for `version`"""
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+# Online-safe building blocks: both are metadata-only or incremental in SQLite
+# and never rebuild an existing table.
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """Check whether a table already has a column"""
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    if column_exists(conn, table, column):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"➕ Added column {table}.{column}")
+    return True
+
+
+def create_indexes(conn: sqlite3.Connection, index_sql: dict):
+    """Create indexes from a {name: CREATE INDEX IF NOT EXISTS ...} mapping"""
+    for index_name, sql in index_sql.items():
+        conn.execute(sql)
+        logger.info(f"📇 Created/verified index: {index_name}")
+
+
+def insert_completed_order_items(conn: sqlite3.Connection, order_id: str, items: List[dict]) -> int:
+    """Write the line items of a completed order; returns the number of rows written"""
+    rows = [
+        (order_id, item['menu_item_id'], item.get('quantity', 1), item.get('subtotal', 0))
+        for item in items
+        if item.get('menu_item_id') is not None
+    ]
+    conn.executemany("""
+        INSERT INTO completed_order_items (order_id, menu_item_id, quantity, subtotal)
+        VALUES (?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+
+def _ensure_version_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL
+        )
+    """)
+    if conn.in_transaction:
+        conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the highest applied migration version (0 for a fresh database)"""
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: List[Migration] = None) -> List[int]:
+    """Apply every pending migration, each in its own transaction.
+
+    Each migration takes the write lock with BEGIN IMMEDIATE and re-checks
+    the version table, so several processes starting at once apply each
+    migration exactly once. Returns the versions applied by this call.
+    """
+    migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+    if conn.in_transaction:
+        conn.commit()
+    _ensure_version_table(conn)
+
+    applied = []
+    for m in migrations:
+        if m.version <= get_schema_version(conn):
+            continue
+
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE TRANSACTION")
+        try:
+            already = conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (m.version,)
+            ).fetchone()
+            if already:
+                conn.rollback()
+                continue
+
+            m.apply(conn)
+
+            duration_ms = (time.perf_counter() - start) * 1000
+            conn.execute(
+                "INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)",
+                (m.version, m.description, round(duration_ms, 2))
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Migration {m.version} ({m.description}) failed: {e}")
+            raise
+
+        applied.append(m.version)
+        logger.info(f"✅ Applied migration {m.version}: {m.description} ({duration_ms:.1f}ms)")
+
+    return applied
+
+
+# Migrations
+#
+# Each migration spells out the exact tables and indexes of its schema version
+# instead of reading the current definitions in models.py, so what a version
+# means never changes. A new table or index gets a new migration, plus the
+# matching entry in models.py.
+@migration(1, "Add quick_order_item column to user_sessions")
+def _add_quick_order_item(conn):
+    add_column_if_missing(conn, 'user_sessions', 'quick_order_item', 'TEXT')
+
+
+@migration(2, "Menu version counter triggers")
+def _menu_version_triggers(conn):
+    for trigger_name, sql in DatabaseSchema.get_trigger_definitions().items():
+        conn.execute(sql)
+        logger.info(f"⚙️ Created/verified trigger: {trigger_name}")
+    conn.execute("INSERT OR IGNORE INTO menu_version (id, version) VALUES (1, 0)")
+
+
+@migration(3, "Secondary indexes for hot lookups")
+def _hot_lookup_indexes(conn):
+    create_indexes(conn, {
+        'idx_user_orders_phone_added': """
+            CREATE INDEX IF NOT EXISTS idx_user_orders_phone_added
+            ON user_orders (phone_number, added_at)
+        """,
+        'idx_user_orders_menu_item': """
+            CREATE INDEX IF NOT EXISTS idx_user_orders_menu_item
+            ON user_orders (menu_item_id)
+        """,
+        'idx_conversation_log_phone': """
+            CREATE INDEX IF NOT EXISTS idx_conversation_log_phone
+            ON conversation_log (phone_number, timestamp)
+        """,
+        'idx_completed_orders_phone_completed': """
+            CREATE INDEX IF NOT EXISTS idx_completed_orders_phone_completed
+            ON completed_orders (phone_number, completed_at)
+        """,
+        'idx_completed_orders_completed': """
+            CREATE INDEX IF NOT EXISTS idx_completed_orders_completed
+            ON completed_orders (completed_at)
+        """,
+        'idx_menu_items_sub_category': """
+            CREATE INDEX IF NOT EXISTS idx_menu_items_sub_category
+            ON menu_items (sub_category_id, available, item_name_ar)
+        """,
+        'idx_menu_items_main_category': """
+            CREATE INDEX IF NOT EXISTS idx_menu_items_main_category
+            ON menu_items (main_category_id, available, item_name_ar)
+        """,
+        'idx_sub_categories_main_category': """
+            CREATE INDEX IF NOT EXISTS idx_sub_categories_main_category
+            ON sub_categories (main_category_id, available, display_order)
+        """,
+        'idx_user_sessions_created': """
+            CREATE INDEX IF NOT EXISTS idx_user_sessions_created
+            ON user_sessions (created_at)
+        """,
+    })
+
+
+@migration(4, "Order ID sequence table")
+def _order_sequences(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS order_sequences (
+            day TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        )
+    """)
+
+
+@migration(5, "Normalized completed_order_items table with backfill from items_json")
+def _completed_order_items(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS completed_order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id TEXT NOT NULL,
+            menu_item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            subtotal INTEGER NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES completed_orders (order_id)
+        )
+    """)
+    create_indexes(conn, {
+        'idx_completed_order_items_order': """
+            CREATE INDEX IF NOT EXISTS idx_completed_order_items_order
+            ON completed_order_items (order_id)
+        """,
+        'idx_completed_order_items_menu_item': """
+            CREATE INDEX IF NOT EXISTS idx_completed_order_items_menu_item
+            ON completed_order_items (menu_item_id, quantity, subtotal)
+        """,
+    })
+
+    rows = conn.execute("""
+        SELECT co.order_id, co.items_json FROM completed_orders co
+        WHERE NOT EXISTS (SELECT 1 FROM completed_order_items coi WHERE coi.order_id = co.order_id)
+    """).fetchall()
+
+    backfilled = 0
+    for order_id, items_json in rows:
+        try:
+            items = json.loads(items_json or '[]')
+        except (TypeError, ValueError):
+            logger.warning(f"⚠️ Skipping order {order_id}: unreadable items_json")
+            continue
+        backfilled += insert_completed_order_items(conn, order_id, items)
+
+    logger.info(f"📦 Backfilled {backfilled} order items from {len(rows)} completed orders")
+
+
+@migration(6, "Item popularity counters with backfill from order history")
+def _item_stats(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_stats (
+            menu_item_id INTEGER PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            total_quantity INTEGER NOT NULL DEFAULT 0,
+            total_revenue INTEGER NOT NULL DEFAULT 0,
+            last_ordered_at TIMESTAMP,
+            decay_score REAL NOT NULL DEFAULT 0
+        )
+    """)
+    create_indexes(conn, {
+        'idx_item_stats_decay_score': """
+            CREATE INDEX IF NOT EXISTS idx_item_stats_decay_score
+            ON item_stats (decay_score)
+        """,
+    })
+
+    # Replay history oldest first so last_ordered_at ends on the newest order
+    rows = conn.execute("""
+        SELECT co.order_id, CAST(strftime('%s', co.completed_at) AS INTEGER),
+               coi.menu_item_id, coi.quantity, coi.subtotal
+        FROM completed_orders co
+        JOIN completed_order_items coi ON coi.order_id = co.order_id
+        ORDER BY co.completed_at, co.order_id
+    """).fetchall()
+
+    orders = {}
+    for order_id, completed_at, menu_item_id, quantity, subtotal in rows:
+        _, items = orders.setdefault(order_id, (completed_at, []))
+        items.append({'menu_item_id': menu_item_id, 'quantity': quantity, 'subtotal': subtotal})
+
+    for ordered_at, items in orders.values():
+        record_order_items(conn, items, ordered_at=ordered_at)
+
+    logger.info(f"📈 Backfilled item stats from {len(orders)} completed orders")
+
+
+@migration(7, "Conversation log timestamp index for retention sweeps")
+def _conversation_log_timestamp_index(conn):
+    create_indexes(conn, {
+        'idx_conversation_log_timestamp': """
+            CREATE INDEX IF NOT EXISTS idx_conversation_log_timestamp
+            ON conversation_log (timestamp)
+        """,
+    })
+
+
+@migration(8, "Trigger-maintained table counters for stats")
+def _db_counters(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS db_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for trigger_name, sql in get_counter_trigger_definitions().items():
+        conn.execute(sql)
+        logger.info(f"⚙️ Created/verified trigger: {trigger_name}")
+    refresh_counters(conn)
+
+
+@migration(9, "Trigger-maintained cart totals in order_details")
+def _order_totals(conn):
+    add_column_if_missing(conn, 'order_details', 'item_count', 'INTEGER DEFAULT 0')
+    for trigger_name, sql in get_order_total_trigger_definitions().items():
+        conn.execute(sql)
+        logger.info(f"⚙️ Created/verified trigger: {trigger_name}")
+    repaired = verify_order_totals(conn, repair=True)
+    if repaired:
+        logger.info(f"🧮 Backfilled totals for {len(repaired)} carts")
+
+
+@migration(10, "User lease and processed message tables for multi-process workers")
+def _shared_sessions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_leases (
+            phone_number TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL NOT NULL,
+            generation INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            message_key TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL
+        )
+    """)
+    create_indexes(conn, {
+        'idx_user_leases_expires': """
+            CREATE INDEX IF NOT EXISTS idx_user_leases_expires
+            ON user_leases (expires_at)
+        """,
+        'idx_processed_messages_seen': """
+            CREATE INDEX IF NOT EXISTS idx_processed_messages_seen
+            ON processed_messages (seen_at)
+        """,
+    })
@@ -1,13 +1,48 @@
 """
 Database Models and Schema Definitions for Hef Cafe WhatsApp Bot
 """
-from typing import Dict, List, Any
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Any, Sequence, Tuple
+from dataclasses import dataclass, fields
 from datetime import datetime
+from operator import attrgetter
 
+# Per model class: field names and a getter returning all field values as a tuple
+_ROW_FIELDS: Dict[type, Tuple[Tuple[str, ...], Callable]] = {}
 
-@dataclass
-class UserSession:
+
+class Row:
+    """Base of the row models: slotted, frozen dataclasses built straight
+    from SQL result tuples (columns in field order), with dict views for
+    callers that still expect plain dicts.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def _fields(cls) -> Tuple[Tuple[str, ...], Callable]:
+        entry = _ROW_FIELDS.get(cls)
+        if entry is None:
+            names = tuple(f.name for f in fields(cls))
+            entry = _ROW_FIELDS[cls] = (names, attrgetter(*names))
+        return entry
+
+    @classmethod
+    def field_names(cls) -> Tuple[str, ...]:
+        return cls._fields()[0]
+
+    @classmethod
+    def dict_from_row(cls, row: Sequence) -> Dict[str, Any]:
+        """Dict view of a result tuple without building an instance"""
+        return dict(zip(cls._fields()[0], row))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict copy of the fields"""
+        names, values = self._fields()
+        return dict(zip(names, values(self)))
+
+
+@dataclass(frozen=True, slots=True)
+class UserSession(Row):
     """User session data model"""
     phone_number: str
     current_step: str
@@ -23,8 +58,8 @@ class UserSession:
     updated_at: datetime = None
 
 
-@dataclass
-class MainCategory:
+@dataclass(frozen=True, slots=True)
+class MainCategory(Row):
     """Main category data model"""
     id: int
     name_ar: str
@@ -34,8 +69,8 @@ class MainCategory:
     created_at: datetime = None
 
 
-@dataclass
-class SubCategory:
+@dataclass(frozen=True, slots=True)
+class SubCategory(Row):
     """Sub category data model"""
     id: int
     main_category_id: int
@@ -46,8 +81,8 @@ class SubCategory:
     created_at: datetime = None
 
 
-@dataclass
-class MenuItem:
+@dataclass(frozen=True, slots=True)
+class MenuItem(Row):
     """Menu item data model"""
     id: int
     sub_category_id: int
@@ -60,8 +95,8 @@ class MenuItem:
     created_at: datetime = None
 
 
-@dataclass
-class UserOrder:
+@dataclass(frozen=True, slots=True)
+class UserOrder(Row):
     """User order item data model"""
     id: int = None
     phone_number: str = None
@@ -72,20 +107,30 @@ class UserOrder:
     added_at: datetime = None
 
 
-@dataclass
-class OrderDetails:
+@dataclass(frozen=True, slots=True)
+class CartItem(UserOrder):
+    """Cart line: a user_orders row joined with its menu item"""
+    item_name_ar: str = 'Unknown Item'
+    item_name_en: str = 'Unknown Item'
+    price: int = 0
+    unit: str = 'piece'
+
+
+@dataclass(frozen=True, slots=True)
+class OrderDetails(Row):
     """Order details data model"""
     phone_number: str
     service_type: str = None
     location: str = None
     total_amount: int = 0
+    item_count: int = 0
     customizations: str = None
     order_status: str = 'in_progress'
     created_at: datetime = None
 
 
-@dataclass
-class ConversationLog:
+@dataclass(frozen=True, slots=True)
+class ConversationLog(Row):
     """Conversation log data model"""
     id: int = None
     phone_number: str = None
@@ -96,8 +141,8 @@ class ConversationLog:
     timestamp: datetime = None
 
 
-@dataclass
-class CompletedOrder:
+@dataclass(frozen=True, slots=True)
+class CompletedOrder(Row):
     """Completed order data model"""
     id: int = None
     phone_number: str = None
@@ -109,8 +154,18 @@ class CompletedOrder:
     completed_at: datetime = None
 
 
-@dataclass
-class StepRule:
+@dataclass(frozen=True, slots=True)
+class CompletedOrderItem(Row):
+    """Completed order line item data model"""
+    id: int = None
+    order_id: str = None
+    menu_item_id: int = None
+    quantity: int = None
+    subtotal: int = None
+
+
+@dataclass(frozen=True, slots=True)
+class StepRule(Row):
     """Step validation rule data model"""
     current_step: str
     allowed_next_steps: str
@@ -202,6 +257,7 @@ class DatabaseSchema:
                     service_type TEXT,
                     location TEXT,
                     total_amount INTEGER DEFAULT 0,
+                    item_count INTEGER DEFAULT 0,
                     customizations TEXT,
                     order_status TEXT DEFAULT 'in_progress',
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -235,6 +291,28 @@ class DatabaseSchema:
                 )
             """,
 
+            'completed_order_items': """
+                CREATE TABLE IF NOT EXISTS completed_order_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id TEXT NOT NULL,
+                    menu_item_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    subtotal INTEGER NOT NULL,
+                    FOREIGN KEY (order_id) REFERENCES completed_orders (order_id)
+                )
+            """,
+
+            'item_stats': """
+                CREATE TABLE IF NOT EXISTS item_stats (
+                    menu_item_id INTEGER PRIMARY KEY,
+                    order_count INTEGER NOT NULL DEFAULT 0,
+                    total_quantity INTEGER NOT NULL DEFAULT 0,
+                    total_revenue INTEGER NOT NULL DEFAULT 0,
+                    last_ordered_at TIMESTAMP,
+                    decay_score REAL NOT NULL DEFAULT 0
+                )
+            """,
+
             'step_rules': """
                 CREATE TABLE IF NOT EXISTS step_rules (
                     current_step TEXT PRIMARY KEY,
@@ -242,9 +320,186 @@ class DatabaseSchema:
                     required_data TEXT,
                     description TEXT
                 )
+            """,
+
+            'menu_version': """
+                CREATE TABLE IF NOT EXISTS menu_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """,
+
+            'db_counters': """
+                CREATE TABLE IF NOT EXISTS db_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """,
+
+            'order_sequences': """
+                CREATE TABLE IF NOT EXISTS order_sequences (
+                    day TEXT PRIMARY KEY,
+                    next_value INTEGER NOT NULL
+                )
+            """,
+
+            # Cross-process user locks: owner is NULL (or expired) when free;
+            # generation changes on every release so other workers can spot stale caches
+            'user_leases': """
+                CREATE TABLE IF NOT EXISTS user_leases (
+                    phone_number TEXT PRIMARY KEY,
+                    owner TEXT,
+                    expires_at REAL NOT NULL,
+                    generation INTEGER NOT NULL
+                )
+            """,
+
+            # Message IDs claimed by any worker, for cross-process deduplication
+            'processed_messages': """
+                CREATE TABLE IF NOT EXISTS processed_messages (
+                    message_key TEXT PRIMARY KEY,
+                    seen_at REAL NOT NULL
+                )
             """
         }
 
+    @staticmethod
+    def get_log_database_definitions() -> Dict[str, str]:
+        """Schema of a separate conversation log database file.
+
+        Same columns as conversation_log in the main database, minus the
+        foreign key: user_sessions lives in the other file.
+        """
+        index_sql = DatabaseSchema.get_index_definitions()
+        return {
+            'conversation_log': """
+                CREATE TABLE IF NOT EXISTS conversation_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    phone_number TEXT NOT NULL,
+                    message_type TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    ai_response TEXT,
+                    current_step TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+            'idx_conversation_log_phone': index_sql['idx_conversation_log_phone'],
+            'idx_conversation_log_timestamp': index_sql['idx_conversation_log_timestamp'],
+        }
+
+    @staticmethod
+    def get_index_definitions() -> Dict[str, str]:
+        """Get secondary index creation SQL statements for hot lookups"""
+        return {
+            # Cart reads: WHERE phone_number = ? ORDER BY added_at
+            'idx_user_orders_phone_added': """
+                CREATE INDEX IF NOT EXISTS idx_user_orders_phone_added
+                ON user_orders (phone_number, added_at)
+            """,
+
+            # Foreign key checks when menu items are added, changed or removed
+            'idx_user_orders_menu_item': """
+                CREATE INDEX IF NOT EXISTS idx_user_orders_menu_item
+                ON user_orders (menu_item_id)
+            """,
+
+            # Per-user conversation lookups and deletes
+            'idx_conversation_log_phone': """
+                CREATE INDEX IF NOT EXISTS idx_conversation_log_phone
+                ON conversation_log (phone_number, timestamp)
+            """,
+
+            # Retention sweeps: WHERE timestamp < ? ORDER BY timestamp
+            'idx_conversation_log_timestamp': """
+                CREATE INDEX IF NOT EXISTS idx_conversation_log_timestamp
+                ON conversation_log (timestamp)
+            """,
+
+            # Per-user order history: WHERE phone_number = ? ORDER BY completed_at DESC
+            'idx_completed_orders_phone_completed': """
+                CREATE INDEX IF NOT EXISTS idx_completed_orders_phone_completed
+                ON completed_orders (phone_number, completed_at)
+            """,
+
+            # Global order history: ORDER BY completed_at DESC LIMIT ?
+            'idx_completed_orders_completed': """
+                CREATE INDEX IF NOT EXISTS idx_completed_orders_completed
+                ON completed_orders (completed_at)
+            """,
+
+            # Items of given orders: WHERE order_id = ? / IN (...)
+            'idx_completed_order_items_order': """
+                CREATE INDEX IF NOT EXISTS idx_completed_order_items_order
+                ON completed_order_items (order_id)
+            """,
+
+            # Item-level aggregates: GROUP BY menu_item_id
+            'idx_completed_order_items_menu_item': """
+                CREATE INDEX IF NOT EXISTS idx_completed_order_items_menu_item
+                ON completed_order_items (menu_item_id, quantity, subtotal)
+            """,
+
+            # Top-N popular items: ORDER BY decay_score DESC LIMIT ?
+            'idx_item_stats_decay_score': """
+                CREATE INDEX IF NOT EXISTS idx_item_stats_decay_score
+                ON item_stats (decay_score)
+            """,
+
+            # Menu browsing: WHERE sub_category_id = ? AND available = 1 ORDER BY item_name_ar
+            'idx_menu_items_sub_category': """
+                CREATE INDEX IF NOT EXISTS idx_menu_items_sub_category
+                ON menu_items (sub_category_id, available, item_name_ar)
+            """,
+
+            'idx_menu_items_main_category': """
+                CREATE INDEX IF NOT EXISTS idx_menu_items_main_category
+                ON menu_items (main_category_id, available, item_name_ar)
+            """,
+
+            'idx_sub_categories_main_category': """
+                CREATE INDEX IF NOT EXISTS idx_sub_categories_main_category
+                ON sub_categories (main_category_id, available, display_order)
+            """,
+
+            # Session cleanup: WHERE created_at < ?
+            'idx_user_sessions_created': """
+                CREATE INDEX IF NOT EXISTS idx_user_sessions_created
+                ON user_sessions (created_at)
+            """,
+
+            # Purge of free and abandoned leases: WHERE expires_at < ?
+            'idx_user_leases_expires': """
+                CREATE INDEX IF NOT EXISTS idx_user_leases_expires
+                ON user_leases (expires_at)
+            """,
+
+            # Dedup window expiry: WHERE seen_at < ?
+            'idx_processed_messages_seen': """
+                CREATE INDEX IF NOT EXISTS idx_processed_messages_seen
+                ON processed_messages (seen_at)
+            """
+        }
+
+    @staticmethod
+    def get_trigger_definitions() -> Dict[str, str]:
+        """Get trigger creation SQL statements"""
+        triggers = {}
+
+        # Any change to the menu tables bumps the menu version so cached
+        # menu catalogs know to rebuild
+        for table in ('main_categories', 'sub_categories', 'menu_items'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                name = f"trg_{table}_{event.lower()}_menu_version"
+                triggers[name] = f"""
+                    CREATE TRIGGER IF NOT EXISTS {name}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE menu_version SET version = version + 1 WHERE id = 1;
+                    END
+                """
+
+        return triggers
+
     @staticmethod
     def get_initial_menu_data() -> List[tuple]:
         """Get initial menu data for population - Main Categories, Sub Categories, and Items"""
@@ -0,0 +1,64 @@
+# database/order_ids.py
+"""
+Collision-free order ID allocation from per-day sequence blocks
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class OrderIdAllocator:
+    """Hands out monotonic order IDs such as HEF2501150042.
+
+    Each process reserves a block of sequence numbers for the current day in
+    the order_sequences table (one short write transaction per block) and then
+    serves IDs from memory. Blocks never overlap, so IDs are unique across
+    threads and worker processes; unused numbers in a block are simply skipped.
+    """
+
+    def __init__(self, execute_write: Callable, block_size: int = 20, prefix: str = "HEF"):
+        self._execute_write = execute_write  # Runs a job(conn) in its own write transaction
+        self.block_size = max(1, int(block_size))
+        self.prefix = prefix
+
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = 0
+        self._end = 0
+
+    def next_id(self) -> str:
+        """Get the next order ID (must not be called inside an open transaction)"""
+        with self._lock:
+            day = datetime.now().strftime('%y%m%d')
+            if day != self._day or self._next >= self._end:
+                self._reserve_block(day)
+            sequence = self._next
+            self._next += 1
+
+        return f"{self.prefix}{day}{sequence:04d}"
+
+    def _reserve_block(self, day: str):
+        """Claim the next block of sequence numbers for `day`"""
+        def reserve(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO order_sequences (day, next_value) VALUES (?, 1)",
+                (day,)
+            )
+            start = conn.execute(
+                "SELECT next_value FROM order_sequences WHERE day = ?", (day,)
+            ).fetchone()[0]
+            conn.execute(
+                "UPDATE order_sequences SET next_value = ? WHERE day = ?",
+                (start + self.block_size, day)
+            )
+            return start
+
+        start = self._execute_write(reserve)
+
+        self._day = day
+        self._next = start
+        self._end = start + self.block_size
+        logger.debug(f"🔢 Reserved order sequence block {start}-{self._end - 1} for {day}")
@@ -0,0 +1,95 @@
+# database/order_totals.py
+"""
+Trigger-maintained cart totals in order_details
+"""
+import sqlite3
+from typing import Dict, List
+
+
+def get_order_total_trigger_definitions() -> Dict[str, str]:
+    """Triggers keeping order_details.total_amount / item_count equal to the
+    sum of subtotals / number of rows in user_orders for the same phone.
+
+    The insert trigger creates the order_details row if needed, so every cart
+    with items has its totals row.
+    """
+    return {
+        'trg_user_orders_insert_total': """
+            CREATE TRIGGER IF NOT EXISTS trg_user_orders_insert_total
+            AFTER INSERT ON user_orders
+            BEGIN
+                INSERT OR IGNORE INTO order_details (phone_number) VALUES (NEW.phone_number);
+                UPDATE order_details
+                SET total_amount = total_amount + NEW.subtotal, item_count = item_count + 1
+                WHERE phone_number = NEW.phone_number;
+            END
+        """,
+        'trg_user_orders_delete_total': """
+            CREATE TRIGGER IF NOT EXISTS trg_user_orders_delete_total
+            AFTER DELETE ON user_orders
+            BEGIN
+                UPDATE order_details
+                SET total_amount = total_amount - OLD.subtotal, item_count = item_count - 1
+                WHERE phone_number = OLD.phone_number;
+            END
+        """,
+        'trg_user_orders_update_total': """
+            CREATE TRIGGER IF NOT EXISTS trg_user_orders_update_total
+            AFTER UPDATE OF subtotal, phone_number ON user_orders
+            BEGIN
+                UPDATE order_details
+                SET total_amount = total_amount - OLD.subtotal, item_count = item_count - 1
+                WHERE phone_number = OLD.phone_number;
+                INSERT OR IGNORE INTO order_details (phone_number) VALUES (NEW.phone_number);
+                UPDATE order_details
+                SET total_amount = total_amount + NEW.subtotal, item_count = item_count + 1
+                WHERE phone_number = NEW.phone_number;
+            END
+        """,
+    }
+
+
+def verify_order_totals(conn: sqlite3.Connection, repair: bool = False) -> List[Dict]:
+    """Compare stored totals with user_orders in one pass; optionally fix them.
+
+    Returns one entry per drifted cart (stored vs actual). With `repair` the
+    caller must hold a write transaction.
+    """
+    drifted = [
+        {
+            'phone_number': row[0],
+            'stored_total': row[1],
+            'stored_item_count': row[2],
+            'total': row[3],
+            'item_count': row[4],
+        }
+        for row in conn.execute("""
+            SELECT phones.phone_number,
+                   od.total_amount, od.item_count,
+                   COALESCE(carts.total, 0), COALESCE(carts.item_count, 0)
+            FROM (
+                SELECT phone_number FROM order_details
+                UNION
+                SELECT phone_number FROM user_orders
+            ) AS phones
+            LEFT JOIN order_details od ON od.phone_number = phones.phone_number
+            LEFT JOIN (
+                SELECT phone_number, SUM(subtotal) AS total, COUNT(*) AS item_count
+                FROM user_orders
+                GROUP BY phone_number
+            ) AS carts ON carts.phone_number = phones.phone_number
+            WHERE od.total_amount IS NOT COALESCE(carts.total, 0)
+               OR od.item_count IS NOT COALESCE(carts.item_count, 0)
+        """)
+    ]
+
+    if repair and drifted:
+        conn.executemany(
+            "INSERT OR IGNORE INTO order_details (phone_number) VALUES (?)",
+            [(d['phone_number'],) for d in drifted]
+        )
+        conn.executemany(
+            "UPDATE order_details SET total_amount = ?, item_count = ? WHERE phone_number = ?",
+            [(d['total'], d['item_count'], d['phone_number']) for d in drifted]
+        )
+    return drifted
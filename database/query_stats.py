@@ -0,0 +1,450 @@
+# database/query_stats.py
+"""
+Per-statement query instrumentation for pooled SQLite connections
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+def normalize_sql(sql: str) -> str:
+    """Statement key: whitespace collapsed (parameters are already placeholders)"""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ('counts', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def merge(self, other: 'Histogram'):
+        """Add another histogram's samples to this one"""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total_ms += other.total_ms
+        if other.max_ms > self.max_ms:
+            self.max_ms = other.max_ms
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of samples"""
+        total = self.count
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * total:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        total = self.count
+        return {
+            'count': total,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / total, 3) if total else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class StatementStats:
+    """Counters for one normalized statement"""
+
+    __slots__ = ('latency', 'rows', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0  # Rows fetched for queries, rows changed for DML
+        self.errors = 0
+
+    def merge(self, other: 'StatementStats'):
+        self.latency.merge(other.latency)
+        self.rows += other.rows
+        self.errors += other.errors
+
+
+class _StatsShard:
+    """One thread's counters; its lock is only contended by get_stats and reset"""
+
+    __slots__ = ('lock', 'thread', 'statements', 'pool_wait', 'write_lock_wait', 'commits')
+
+    def __init__(self, thread: Optional[threading.Thread] = None):
+        self.lock = threading.Lock()
+        self.thread = thread
+        self.statements: Dict[str, StatementStats] = {}
+        self.pool_wait = Histogram()
+        self.write_lock_wait = Histogram()
+        self.commits = Histogram()
+
+    def statement(self, key: str, max_statements: int) -> StatementStats:
+        # Caller holds self.lock
+        stats = self.statements.get(key)
+        if stats is None:
+            if len(self.statements) >= max_statements:
+                key = '<other>'  # Dynamic SQL must not grow the table without bound
+                stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+        return stats
+
+    def merge(self, other: '_StatsShard', max_statements: int):
+        # Caller holds both locks
+        for key, stats in other.statements.items():
+            self.statement(key, max_statements).merge(stats)
+        self.pool_wait.merge(other.pool_wait)
+        self.write_lock_wait.merge(other.write_lock_wait)
+        self.commits.merge(other.commits)
+
+
+class QueryStats:
+    """Collects statement latencies, row counts, lock waits and per-message
+    connection/query counts from instrumented connections.
+
+    Statements slower than `slow_query_ms` go into a ring buffer of the last
+    `slow_log_size` slow queries together with their EXPLAIN QUERY PLAN.
+
+    Statement, checkout and commit counters are kept per thread and merged
+    when stats are read, so recording never contends with other threads.
+    Counters of threads that have exited are folded into one retired shard.
+    """
+
+    def __init__(self, slow_query_ms: float = 50.0, slow_log_size: int = 100,
+                 max_statements: int = 500):
+        self.slow_query_ms = slow_query_ms
+        self.max_statements = max(1, int(max_statements))
+        self._lock = threading.Lock()  # Shard list, slow log and message histograms
+        self._local = threading.local()
+        self._shards: List[_StatsShard] = []
+        self._retired = _StatsShard()  # Counters of exited threads
+        self._slow_queries = deque(maxlen=max(1, int(slow_log_size)))
+        self._message_connections: Dict[int, int] = {}
+        self._message_queries: Dict[int, int] = {}
+        self._messages = 0
+        self._started_at = time.time()
+
+    def _shard(self) -> _StatsShard:
+        """This thread's counters (registered on first use)"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _StatsShard(threading.current_thread())
+            with self._lock:
+                if len(self._shards) >= 64:
+                    self._retire_dead_shards()
+                self._shards.append(shard)
+        return shard
+
+    def _retire_dead_shards(self):
+        # Caller holds self._lock
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                with shard.lock, self._retired.lock:
+                    self._retired.merge(shard, self.max_statements)
+        self._shards = alive
+
+    def record_statement(self, key: str, elapsed_ms: float, rows: int = 0, failed: bool = False):
+        """Record one execute/executemany call"""
+        shard = self._shard()
+        with shard.lock:
+            stats = shard.statement(key, self.max_statements)
+            stats.latency.add(elapsed_ms)
+            stats.rows += max(0, rows)
+            if failed:
+                stats.errors += 1
+            if key.startswith('BEGIN IMMEDIATE'):
+                # Time spent waiting for SQLite's write lock
+                shard.write_lock_wait.add(elapsed_ms)
+
+        message = getattr(self._local, 'message', None)
+        if message is not None:
+            message['queries'] += 1
+
+    def record_rows(self, key: str, rows: int):
+        """Add rows fetched from a query's cursor (once per cursor, not per row)"""
+        if rows:
+            shard = self._shard()
+            with shard.lock:
+                shard.statement(key, self.max_statements).rows += rows
+
+    def record_commit(self, elapsed_ms: float):
+        shard = self._shard()
+        with shard.lock:
+            shard.commits.add(elapsed_ms)
+
+    def record_checkout(self, wait_ms: float):
+        """Record a top-level pool checkout and the time spent waiting for it"""
+        shard = self._shard()
+        with shard.lock:
+            shard.pool_wait.add(wait_ms)
+
+        message = getattr(self._local, 'message', None)
+        if message is not None:
+            message['connections'] += 1
+
+    def is_slow(self, elapsed_ms: float) -> bool:
+        return self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms
+
+    def record_slow_query(self, conn: sqlite3.Connection, sql: str, params, elapsed_ms: float):
+        """Keep a slow statement with its query plan (explained on the same connection)"""
+        key = normalize_sql(sql)
+        plan: List[str] = []
+        if key.split(' ', 1)[0].upper() in _EXPLAINABLE:
+            try:
+                rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+                plan = [row[-1] for row in rows]
+            except sqlite3.Error as e:
+                plan = [f"unavailable: {e}"]
+
+        entry = {
+            'sql': key,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'at': time.time(),
+            'thread': threading.current_thread().name,
+            'plan': plan,
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        logger.warning(f"🐢 Slow query ({elapsed_ms:.1f}ms): {key[:200]}")
+
+    @contextmanager
+    def track_message(self):
+        """Count connections and queries issued by this thread inside the block"""
+        outer = getattr(self._local, 'message', None)
+        if outer is not None:
+            yield outer  # Nested: count towards the enclosing message
+            return
+
+        message = {'connections': 0, 'queries': 0}
+        self._local.message = message
+        try:
+            yield message
+        finally:
+            self._local.message = None
+            with self._lock:
+                self._messages += 1
+                connections = self._message_connections
+                connections[message['connections']] = connections.get(message['connections'], 0) + 1
+                queries = self._message_queries
+                queries[message['queries']] = queries.get(message['queries'], 0) + 1
+
+    def get_stats(self, top: int = 20, order_by: str = 'total_ms') -> Dict:
+        """Snapshot of the collected metrics; statements sorted by `order_by`"""
+        merged = _StatsShard()
+        with self._lock:
+            self._retire_dead_shards()
+            for shard in [self._retired] + self._shards:
+                with shard.lock:
+                    merged.merge(shard, self.max_statements)
+            messages = self._messages
+            connections = dict(self._message_connections)
+            queries = dict(self._message_queries)
+            stats = {
+                'since': self._started_at,
+                'slow_query_ms': self.slow_query_ms,
+                'slow_queries': list(self._slow_queries),
+            }
+
+        statements = [
+            dict(sql=key, rows=s.rows, errors=s.errors, **s.latency.to_dict())
+            for key, s in merged.statements.items()
+        ]
+        stats.update({
+            'statements_tracked': len(statements),
+            'pool_wait': merged.pool_wait.to_dict(),
+            'write_lock_wait': merged.write_lock_wait.to_dict(),
+            'commits': merged.commits.to_dict(),
+        })
+
+        statements.sort(key=lambda s: s.get(order_by, 0), reverse=True)
+        stats['total_queries'] = sum(s['count'] for s in statements)
+        stats['statements'] = statements[:top] if top else statements
+
+        def summarize(counts: Dict[int, int]) -> Dict:
+            total = sum(n * c for n, c in counts.items())
+            return {
+                'avg': round(total / messages, 2) if messages else 0.0,
+                'max': max(counts) if counts else 0,
+                'distribution': {str(n): c for n, c in sorted(counts.items())},
+            }
+
+        stats['messages'] = {
+            'count': messages,
+            'connections_per_message': summarize(connections),
+            'queries_per_message': summarize(queries),
+        }
+        return stats
+
+    def reset(self):
+        """Drop everything collected so far"""
+        with self._lock:
+            for shard in [self._retired] + self._shards:
+                with shard.lock:
+                    shard.statements.clear()
+                    shard.pool_wait = Histogram()
+                    shard.write_lock_wait = Histogram()
+                    shard.commits = Histogram()
+            self._slow_queries.clear()
+            self._message_connections.clear()
+            self._message_queries.clear()
+            self._messages = 0
+            self._started_at = time.time()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing execute/executemany and counting fetched rows.
+
+    Fetched rows are counted on the cursor and recorded once: when it is
+    exhausted, closed, re-executed or garbage collected.
+    """
+
+    _stats: Optional[QueryStats] = None
+    _key: Optional[str] = None
+    _rows = 0
+
+    def _record_rows(self):
+        if self._rows:
+            rows, self._rows = self._rows, 0
+            self._stats.record_rows(self._key, rows)
+
+    def _timed(self, method, sql, params):
+        stats = self._stats
+        self._record_rows()
+        key = normalize_sql(sql)
+        self._key = key
+        start = time.perf_counter()
+        try:
+            method(self, sql, params)
+        except Exception:
+            stats.record_statement(key, (time.perf_counter() - start) * 1000, failed=True)
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats.record_statement(key, elapsed_ms, rows=self.rowcount)
+        if stats.is_slow(elapsed_ms):
+            if method is sqlite3.Cursor.executemany:
+                # Explain with the first parameter set when it is still available
+                params = params[0] if isinstance(params, (list, tuple)) and params else ()
+            stats.record_slow_query(self.connection, sql, params, elapsed_ms)
+        return self
+
+    def execute(self, sql, parameters=()):
+        if self._stats is None:
+            return super().execute(sql, parameters)
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if self._stats is not None:
+            if row is None:
+                self._record_rows()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._stats is not None:
+            self._rows += len(rows)
+            if not rows:
+                self._record_rows()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._stats is not None:
+            self._rows += len(rows)
+            self._record_rows()
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._stats is not None:
+                self._record_rows()
+            raise
+        if self._stats is not None:
+            self._rows += 1
+        return row
+
+    def close(self):
+        if self._stats is not None:
+            self._record_rows()
+        super().close()
+
+    def __del__(self):
+        if self._rows:
+            try:
+                self._record_rows()
+            except Exception:
+                pass  # Interpreter shutdown
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are recorded in `query_stats` (pass as factory=)"""
+
+    query_stats: Optional[QueryStats] = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, InstrumentedCursor):
+            cursor._stats = self.query_stats
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        stats = self.query_stats
+        if stats is None:
+            return super().commit()
+        start = time.perf_counter()
+        super().commit()
+        stats.record_commit((time.perf_counter() - start) * 1000)
@@ -0,0 +1,288 @@
+# database/session_leases.py
+"""
+Cross-process user leases and message claims for multi-worker deployments
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLeases:
+    """Makes per-user locking, session caches and deduplication hold across
+    worker processes that share one SQLite database.
+
+    - A user's lease row is taken when a worker first enters the user's lock
+      and released when it leaves; another process waits (polling) until the
+      lease is free or its holder's `lease_ttl` has run out (crashed worker).
+      A background thread renews held leases every `lease_ttl / 3`, so a
+      slow handler keeps its lease for as long as its process is alive.
+    - Every release, and every takeover of a lease another process still
+      owned, stamps a new generation. A worker that acquires a lease with a
+      generation other than the one it last wrote knows another process
+      handled the user in between and drops its cached state (`on_stale`),
+      so the next read comes from SQLite.
+    - Before releasing, `before_release` persists the user's dirty session,
+      so the next holder reads what this one wrote.
+    - Message claims are a primary-key insert; the first worker to claim a
+      message ID processes it, a retry delivered to any other worker is a
+      duplicate.
+
+    Reentrant and repeat holds stay in-process: the session manager only
+    calls acquire/release for a thread's outermost hold, and a worker that
+    keeps handling the same user keeps its cache.
+    """
+
+    def __init__(self, execute_write: Callable, on_stale: Callable[[str], None],
+                 before_release: Optional[Callable[[str], None]] = None,
+                 lease_ttl: float = 120.0, message_ttl: float = 300.0,
+                 purge_interval: float = 60.0, max_tracked_users: int = 100_000):
+        self._execute_write = execute_write  # Runs a job(conn) in its own write transaction
+        self._on_stale = on_stale
+        self._before_release = before_release
+        self.lease_ttl = lease_ttl
+        self.message_ttl = message_ttl
+        self.purge_interval = purge_interval
+        self.max_tracked_users = max(1, int(max_tracked_users))
+
+        self._lock = threading.Lock()
+        self._generations: 'OrderedDict[str, int]' = OrderedDict()  # Last generation this process wrote
+        self._owner_pid = None
+        self._owner = None
+        self._last_purge = time.time()
+
+        # Leases this process holds, renewed by a daemon thread while held
+        self._held = set()
+        self._renewer: Optional[threading.Thread] = None
+        self._renewer_pid = None
+        self._stop = threading.Event()
+
+        self._metrics = {
+            'acquires': 0,
+            'lease_waits': 0,
+            'stale_invalidations': 0,
+            'lost_leases': 0,
+            'renewals': 0,
+            'takeovers': 0,
+            'claims': 0,
+            'remote_duplicates': 0,
+            'purged_leases': 0,
+            'purged_messages': 0,
+        }
+
+    @property
+    def owner(self) -> str:
+        """Identity of this process (renewed after a fork)"""
+        pid = os.getpid()
+        if pid != self._owner_pid:
+            self._owner_pid = pid
+            self._owner = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+            with self._lock:
+                self._generations.clear()  # Inherited from the parent, not written by us
+        return self._owner
+
+    def _count(self, metric: str, amount: int = 1):
+        with self._lock:
+            self._metrics[metric] += amount
+
+    def acquire(self, phone_number: str, timeout: float = 10.0):
+        """Take the user's lease, waiting up to `timeout`; TimeoutError if it stays taken"""
+        owner = self.owner
+
+        self._ensure_renewer()
+
+        def take(conn):
+            now = time.time()
+            previous = conn.execute(
+                "SELECT owner FROM user_leases WHERE phone_number = ?", (phone_number,)
+            ).fetchone()
+            # A lease taken over from another process (crashed or past its ttl) gets a
+            # new generation: that process may have changed the user without releasing
+            taken = conn.execute("""
+                INSERT INTO user_leases (phone_number, owner, expires_at, generation)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(phone_number) DO UPDATE
+                SET owner = excluded.owner, expires_at = excluded.expires_at,
+                    generation = CASE WHEN user_leases.owner IS NOT NULL AND user_leases.owner != excluded.owner
+                                      THEN excluded.generation ELSE user_leases.generation END
+                WHERE user_leases.owner IS NULL OR user_leases.owner = excluded.owner
+                   OR user_leases.expires_at < ?
+            """, (phone_number, owner, now + self.lease_ttl, time.time_ns(), now)).rowcount
+            if not taken:
+                return None
+            takeover = previous is not None and previous[0] is not None and previous[0] != owner
+            generation = conn.execute(
+                "SELECT generation FROM user_leases WHERE phone_number = ?", (phone_number,)
+            ).fetchone()[0]
+            return generation, takeover
+
+        deadline = time.monotonic() + timeout
+        delay = 0.002
+        while True:
+            taken = self._execute_write(take)
+            if taken is not None:
+                generation, takeover = taken
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Could not acquire lease for user {phone_number}")
+            self._count('lease_waits')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+        if takeover:
+            logger.warning(f"⚠️ Took over the expired lease of user {phone_number}")
+        with self._lock:
+            self._held.add(phone_number)
+            self._metrics['acquires'] += 1
+            self._metrics['takeovers'] += int(takeover)
+            stale = self._generations.get(phone_number) != generation
+            if stale:
+                self._metrics['stale_invalidations'] += 1
+        if stale:
+            # Another process may have changed this user since we cached it
+            self._on_stale(phone_number)
+
+    def release(self, phone_number: str):
+        """Persist the user's pending state and hand the lease back with a new generation"""
+        if self._before_release is not None:
+            try:
+                self._before_release(phone_number)
+            except Exception as e:
+                logger.error(f"❌ Error persisting session for {phone_number} before lease release: {e}")
+
+        owner = self.owner
+        generation = time.time_ns()
+
+        def give_back(conn):
+            return conn.execute("""
+                UPDATE user_leases SET owner = NULL, expires_at = ?, generation = ?
+                WHERE phone_number = ? AND owner = ?
+            """, (time.time(), generation, phone_number, owner)).rowcount
+
+        try:
+            released = self._execute_write(give_back)
+        except Exception as e:
+            released = 0
+            logger.error(f"❌ Error releasing lease for {phone_number}: {e}")
+
+        with self._lock:
+            self._held.discard(phone_number)
+            if released:
+                self._generations[phone_number] = generation
+                self._generations.move_to_end(phone_number)
+                if len(self._generations) > self.max_tracked_users:
+                    self._generations.popitem(last=False)  # Forgotten users just reload once
+            else:
+                self._generations.pop(phone_number, None)
+                self._metrics['lost_leases'] += 1
+        if not released:
+            logger.warning(f"⚠️ Lease for {phone_number} expired while held (lease_ttl={self.lease_ttl}s)")
+
+    def _ensure_renewer(self):
+        """Start the renewal thread (again in a forked child, where it doesn't survive)"""
+        pid = os.getpid()
+        if self._renewer_pid == pid:
+            return
+        with self._lock:
+            if self._renewer_pid == pid:
+                return
+            if self._renewer_pid is not None:
+                self._held.clear()  # The parent's leases, not ours
+            self._renewer_pid = pid
+            self._renewer = threading.Thread(target=self._run_renewer, name="session-lease-renewer", daemon=True)
+            self._renewer.start()
+
+    def _run_renewer(self):
+        """Worker loop: extend held leases well before they expire"""
+        while not self._stop.wait(self.lease_ttl / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.error(f"❌ Lease renewal error: {e}")
+
+    def renew(self) -> int:
+        """Extend every lease this process holds by lease_ttl; returns how many were renewed"""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return 0
+
+        owner = self.owner
+        expires_at = time.time() + self.lease_ttl
+        renewed = self._execute_write(lambda conn: conn.executemany("""
+            UPDATE user_leases SET expires_at = ? WHERE phone_number = ? AND owner = ?
+        """, [(expires_at, phone_number, owner) for phone_number in held]).rowcount)
+
+        self._count('renewals', renewed)
+        if renewed < len(held):
+            logger.warning(f"⚠️ {len(held) - renewed} held leases were already taken over")
+        return renewed
+
+    def close(self, timeout: float = 5.0):
+        """Stop renewing leases"""
+        self._stop.set()
+        if self._renewer is not None and self._renewer_pid == os.getpid():
+            self._renewer.join(timeout)
+
+    def claim_message(self, message_key: str) -> bool:
+        """Claim a message for processing; False if any worker claimed it within message_ttl"""
+        now = time.time()
+        purge = now - self._last_purge >= self.purge_interval
+        if purge:
+            self._last_purge = now
+
+        def claim(conn):
+            claimed = conn.execute("""
+                INSERT INTO processed_messages (message_key, seen_at) VALUES (?, ?)
+                ON CONFLICT(message_key) DO UPDATE SET seen_at = excluded.seen_at
+                WHERE processed_messages.seen_at < ?
+            """, (message_key, now, now - self.message_ttl)).rowcount
+            if purge:
+                self._purge(conn, now)
+            return claimed
+
+        try:
+            claimed = bool(self._execute_write(claim))
+        except Exception as e:
+            # Better to risk a duplicate than to drop the message
+            logger.error(f"❌ Error claiming message {message_key}: {e}")
+            return True
+        self._count('claims')
+        if not claimed:
+            self._count('remote_duplicates')
+        return claimed
+
+    def _purge(self, conn, now: float):
+        """Delete expired message claims and leases that are free or long abandoned"""
+        messages = conn.execute(
+            "DELETE FROM processed_messages WHERE seen_at < ?", (now - self.message_ttl,)
+        ).rowcount
+        # Released leases keep expires_at = release time; dropping them is safe because
+        # a recreated row gets a fresh generation, which simply reads as stale
+        leases = conn.execute(
+            "DELETE FROM user_leases WHERE expires_at < ?", (now - self.lease_ttl,)
+        ).rowcount
+        with self._lock:
+            self._metrics['purged_messages'] += messages
+            self._metrics['purged_leases'] += leases
+        if messages or leases:
+            logger.debug(f"🧹 Purged {messages} message claims and {leases} leases")
+
+    def get_stats(self) -> Dict:
+        """Get lease and claim metrics"""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['tracked_users'] = len(self._generations)
+            stats['held_leases'] = len(self._held)
+        stats.update({
+            'owner': self.owner,
+            'lease_ttl_s': self.lease_ttl,
+            'message_ttl_s': self.message_ttl,
+        })
+        return stats
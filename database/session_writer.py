@@ -0,0 +1,100 @@
+# database/session_writer.py
+"""
+Write-behind persistence for in-memory user sessions
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class SessionWriter:
+    """Persists dirty sessions from the session manager in batches.
+
+    Session updates only touch memory and mark the user dirty; this writer
+    stores the latest state of every dirty user in one transaction, either
+    on demand (end of a message, before order completion, on shutdown) or
+    every `flush_interval_ms` from a daemon thread. Several updates to the
+    same session between flushes collapse into a single row write.
+    """
+
+    def __init__(self, session_manager, execute_write: Callable, flush_interval_ms: int = 250):
+        self._sessions = session_manager
+        self._execute_write = execute_write  # Runs a job(conn) in a write transaction
+        self.flush_interval = max(10, int(flush_interval_ms)) / 1000.0
+
+        # Held from snapshot to commit so a delete that flushes first can't be
+        # overtaken by an older in-flight batch re-inserting the session
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._metrics = {
+            'flushes': 0,
+            'sessions_written': 0,
+            'failed_flushes': 0,
+            'max_batch': 0,
+            'last_flush_ms': 0.0,
+        }
+
+        # Dirty sessions the cache wants to evict are written out first
+        session_manager.set_eviction_handler(self.flush)
+
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Worker loop: flush every interval until stopped"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Session writer error: {e}")
+
+    def flush(self, phone_numbers: Iterable[str] = None) -> int:
+        """Persist dirty sessions (all, or only `phone_numbers`); returns rows written"""
+        with self._flush_lock:
+            rows = self._sessions.take_dirty_sessions(phone_numbers)
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self._execute_write(lambda conn: conn.executemany("""
+                    INSERT OR REPLACE INTO user_sessions
+                    (phone_number, current_step, language_preference, customer_name,
+                     selected_main_category, selected_sub_category, selected_item, order_mode, quick_order_item, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """, rows))
+            except Exception as e:
+                # Keep the sessions dirty so the next flush retries them
+                self._sessions.mark_dirty(*(row[0] for row in rows))
+                self._metrics['failed_flushes'] += 1
+                logger.error(f"❌ Error persisting {len(rows)} sessions: {e}")
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._metrics['flushes'] += 1
+            self._metrics['sessions_written'] += len(rows)
+            self._metrics['max_batch'] = max(self._metrics['max_batch'], len(rows))
+            self._metrics['last_flush_ms'] = round(elapsed_ms, 2)
+            logger.debug(f"💾 Persisted {len(rows)} sessions in {elapsed_ms:.1f}ms")
+            return len(rows)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker and persist whatever is still dirty"""
+        self._stop.set()
+        self._thread.join(timeout)
+        self._sessions.set_eviction_handler(None)
+        written = self.flush()
+        logger.info(f"💾 Session writer stopped (final flush: {written} sessions)")
+
+    def get_stats(self) -> Dict:
+        """Get writer metrics"""
+        stats = dict(self._metrics)
+        stats.update({
+            'pending': self._sessions.dirty_session_count(),
+            'flush_interval_ms': int(self.flush_interval * 1000),
+        })
+        return stats
@@ -0,0 +1,204 @@
+# database/storage.py
+"""
+Storage backend interface shared by the SQLite and in-memory implementations
+"""
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.thread_safe_session import session_manager, UserWorkflowState
+
+
+def session_from_state(state: UserWorkflowState) -> Dict:
+    """Session dict (user_sessions columns) for an in-memory workflow state"""
+    return {
+        'phone_number': state.phone_number,
+        'current_step': state.current_step,
+        'language_preference': state.language_preference,
+        'customer_name': state.customer_name,
+        'selected_main_category': state.selected_main_category,
+        'selected_sub_category': state.selected_sub_category,
+        'selected_item': state.selected_item,
+        'order_mode': state.order_mode,
+        'quick_order_item': state.quick_order_item,
+        'conversation_context': state.context_json(),
+        'created_at': datetime.fromtimestamp(state.created_at).isoformat(),
+        'updated_at': datetime.fromtimestamp(state.updated_at).isoformat()
+    }
+
+
+class StorageBackend(ABC):
+    """Everything the workflow handlers need from storage: sessions, carts,
+    menu, completed orders and the conversation log.
+
+    Return values are plain dicts and lists with the same keys for every
+    backend, so handlers can run against any implementation. Live session
+    state is kept by the shared session manager; backends persist it.
+    """
+
+    # Sessions
+    @abstractmethod
+    def get_user_session(self, phone_number: str) -> Optional[Dict]:
+        """Get a user's session"""
+
+    @abstractmethod
+    def create_or_update_session(self, phone_number: str, current_step: str,
+                                 language: str = None, customer_name: str = None,
+                                 selected_main_category: int = None,
+                                 selected_sub_category: int = None,
+                                 selected_item: int = None,
+                                 order_mode: str = None, quick_order_item: str = None) -> bool:
+        """Create or update a user's session"""
+
+    @abstractmethod
+    def update_session_field(self, phone_number: str, field_name: str, value: Any) -> bool:
+        """Update one session field"""
+
+    @abstractmethod
+    def delete_session(self, phone_number: str, only_session: bool = False) -> bool:
+        """Delete a user's session (and cart and conversation log unless `only_session`)"""
+
+    @abstractmethod
+    def cleanup_expired_sessions(self, days_old: int = 7) -> int:
+        """Remove old sessions; returns how many were removed"""
+
+    def flush_sessions(self, phone_numbers: List[str] = None) -> int:
+        """Persist pending session changes; returns rows written"""
+        return 0
+
+    def validate_step_transition(self, phone_number: str, next_step: str) -> bool:
+        """Validate step transition"""
+        state = session_manager.get_user_state(phone_number)
+        current_step = state.current_step if state else 'waiting_for_language'
+
+        # Allow transitions from any step to language (restart)
+        if next_step == 'waiting_for_language':
+            return True
+
+        # Define allowed transitions
+        allowed_transitions = {
+            'waiting_for_language': ['waiting_for_category'],
+            'waiting_for_category': ['waiting_for_item'],
+            'waiting_for_item': ['waiting_for_quantity'],
+            'waiting_for_quantity': ['waiting_for_additional'],
+            'waiting_for_additional': ['waiting_for_category', 'waiting_for_service'],
+            'waiting_for_service': ['waiting_for_location'],
+            'waiting_for_location': ['waiting_for_confirmation'],
+            'waiting_for_confirmation': ['completed', 'waiting_for_language']
+        }
+
+        return next_step in allowed_transitions.get(current_step, [])
+
+    # Carts
+    def add_item_to_order(self, phone_number: str, item_id: int, quantity: int,
+                          special_requests: str = None, special_price: int = None) -> bool:
+        """Add item to order"""
+        return self.add_items_to_order(
+            phone_number, [(item_id, quantity, special_price, special_requests)]
+        ) == 1
+
+    @abstractmethod
+    def add_items_to_order(self, phone_number: str, items: List[Tuple]) -> int:
+        """Add (item_id, quantity[, special_price[, special_requests]]) items; returns how many were added"""
+
+    @abstractmethod
+    def get_user_order(self, phone_number: str) -> Optional[Dict]:
+        """Get the cart as {'items': [...], 'total': int, 'details': {...}}"""
+
+    def get_current_order(self, phone_number: str) -> Optional[Dict]:
+        """Get current order for a user (alias for get_user_order)"""
+        return self.get_user_order(phone_number)
+
+    def get_order_total(self, phone_number: str) -> int:
+        """Get the cart total"""
+        order = self.get_user_order(phone_number)
+        return order['total'] if order else 0
+
+    @abstractmethod
+    def remove_last_item_from_order(self, phone_number: str) -> bool:
+        """Remove the most recently added cart line"""
+
+    @abstractmethod
+    def remove_item_from_order(self, phone_number: str, menu_item_id: int) -> bool:
+        """Remove every cart line for a menu item"""
+
+    @abstractmethod
+    def update_item_quantity(self, phone_number: str, item_id: int, new_quantity: int) -> bool:
+        """Set the quantity of a menu item already in the cart"""
+
+    @abstractmethod
+    def update_order_details(self, phone_number: str, **kwargs) -> bool:
+        """Update service type, location and other order details"""
+
+    @abstractmethod
+    def cancel_order(self, phone_number: str) -> bool:
+        """Empty the cart and reset the session"""
+
+    @abstractmethod
+    def complete_order(self, phone_number: str) -> Optional[str]:
+        """Move the cart to completed orders; returns the order ID"""
+
+    # Menu
+    @abstractmethod
+    def get_main_categories(self) -> List[Dict]:
+        """Get available main categories"""
+
+    @abstractmethod
+    def get_sub_categories(self, main_category_id: int) -> List[Dict]:
+        """Get available sub-categories for a main category"""
+
+    @abstractmethod
+    def get_sub_category_items(self, sub_category_id: int) -> List[Dict]:
+        """Get available items for a sub-category"""
+
+    @abstractmethod
+    def get_category_items(self, main_category_id: int) -> List[Dict]:
+        """Get all available items for a main category"""
+
+    @abstractmethod
+    def get_item_by_id(self, item_id: int) -> Optional[Dict]:
+        """Get an available item by ID"""
+
+    @abstractmethod
+    def get_all_menu_items(self) -> List[Dict]:
+        """Get every available item, in menu order"""
+
+    @abstractmethod
+    def get_popular_items(self, limit: int = 5) -> List[Dict]:
+        """Get the most ordered available items"""
+
+    @abstractmethod
+    def delete_menu_item(self, item_id: int) -> bool:
+        """Mark a menu item unavailable"""
+
+    # Completed orders
+    @abstractmethod
+    def get_order_history(self, phone_number: str = None, limit: int = 50) -> List[Dict]:
+        """Get completed orders, newest first"""
+
+    @abstractmethod
+    def get_recent_order_items(self, phone_number: str, limit: int = 3) -> List[Dict]:
+        """Get the line items of a user's most recent completed orders, newest order first"""
+
+    # Conversation log
+    @abstractmethod
+    def log_conversation(self, phone_number: str, message_type: str, content: str,
+                         ai_response: str = None, current_step: str = None):
+        """Record a conversation message"""
+
+    def flush_conversation_log(self) -> int:
+        """Write queued conversation records; returns how many were written"""
+        return 0
+
+    # Maintenance and stats
+    @abstractmethod
+    def get_database_stats(self) -> Dict:
+        """Get storage statistics"""
+
+    def track_message(self):
+        """Context manager wrapped around the handling of one message"""
+        return nullcontext()
+
+    def close(self):
+        """Release resources (call on shutdown)"""
@@ -7,65 +7,247 @@ import json
 import logging
 import threading
 import time
-from typing import Dict, List, Optional, Any
-from contextlib import contextmanager
-from .models import DatabaseSchema
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from contextlib import contextmanager, nullcontext
+from .models import DatabaseSchema, CartItem, CompletedOrder
+from .connection_pool import SQLiteConnectionPool
+from .menu_catalog import MenuCatalog
+from .log_writer import ConversationLogWriter
+from .log_archiver import ConversationLogArchiver
+from .session_writer import SessionWriter
+from .session_leases import SessionLeases
+from .write_queue import SingleWriter, run_in_transaction
+from .cart_cache import Cart, CartCache
+from .query_stats import QueryStats
+from .order_ids import OrderIdAllocator
+from .item_stats import record_order_items
+from .counters import apply_counter_deltas, count_counters, read_counters
+from .order_totals import verify_order_totals
+from .migrations import apply_migrations, insert_completed_order_items
+from .maintenance import DatabaseMaintenance
+from .storage import StorageBackend, session_from_state
 from utils.thread_safe_session import session_manager, UserWorkflowState
 
 logger = logging.getLogger(__name__)
 
 
-class ThreadSafeDatabaseManager:
-    """Thread-safe database manager with user isolation"""
+class ThreadSafeDatabaseManager(StorageBackend):
+    """Thread-safe SQLite storage backend with user isolation"""
 
-    def __init__(self, db_path: str = "hef_cafe.db"):
+    def __init__(self, db_path: str = "hef_cafe.db", pool_size: int = 8,
+                 menu_check_interval: float = 5.0, log_writer_config: Optional[Dict] = None,
+                 log_archive_config: Optional[Dict] = None, session_writer_config: Optional[Dict] = None,
+                 single_writer: bool = False, writer_config: Optional[Dict] = None,
+                 cart_cache_size: int = 5000, instrument_queries: bool = True,
+                 query_stats_config: Optional[Dict] = None, log_db_path: Optional[str] = None,
+                 maintenance_config: Optional[Dict] = None, shared_sessions: bool = False,
+                 shared_session_config: Optional[Dict] = None):
         self.db_path = db_path
         self._db_lock = threading.RLock()
-        self._connection_pool = {}
-        self._pool_lock = threading.Lock()
+
+        # Per-statement latency, rows and lock waits of every pooled connection
+        self._query_stats: Optional[QueryStats] = None
+        if instrument_queries:
+            self._query_stats = QueryStats(**(query_stats_config or {}))
+        self._pool = SQLiteConnectionPool(db_path, max_size=pool_size, query_stats=self._query_stats)
+
+        # Optional separate file for conversation_log: its writes take that file's
+        # WAL write lock instead of competing with session and cart writes
+        self.log_db_path = log_db_path if log_db_path and log_db_path != db_path else None
+        self._log_pool: Optional[SQLiteConnectionPool] = None
+        if self.log_db_path:
+            self._log_pool = SQLiteConnectionPool(self.log_db_path, max_size=max(2, pool_size // 2),
+                                                  query_stats=self._query_stats)
+
+        # Menu snapshot, swapped atomically when the menu version changes
+        self._menu_catalog: Optional[MenuCatalog] = None
+        self._menu_catalog_lock = threading.Lock()
+        self._menu_checked_at = 0.0
+        self.menu_check_interval = menu_check_interval
+
+        # Carts are read from memory; every cart mutation writes through to SQLite
+        self._carts = CartCache(max_size=cart_cache_size)
 
         # Initialize database
         self.init_database()
 
+        # Optional single-writer mode: every mutation runs on one dedicated thread
+        self._writer: Optional[SingleWriter] = None
+        if single_writer:
+            self._writer = SingleWriter(self._pool.create_unpooled_connection, **(writer_config or {}))
+
+        # Session changes stay in memory and are persisted in batches
+        self._session_writer = SessionWriter(session_manager, self.execute_write,
+                                             **(session_writer_config or {}))
+
+        # Multi-process workers: user locks, session caches and dedup coordinated through SQLite
+        self._leases: Optional[SessionLeases] = None
+        if shared_sessions:
+            self._leases = SessionLeases(self.execute_write, self._drop_stale_user,
+                                         before_release=lambda phone_number: self._session_writer.flush([phone_number]),
+                                         **(shared_session_config or {}))
+            session_manager.set_coordinator(self._leases)
+
+        # Rows logged before the log was split out move to the log file once
+        if self._log_pool is not None:
+            self._move_conversation_log_to_log_file()
+
+        # Conversation logging happens off the request path
+        self._log_writer = ConversationLogWriter(self.execute_log_write,
+                                                 ensure_sessions=self._log_pool is None,
+                                                 **(log_writer_config or {}))
+
+        # Expired conversation log rows are moved to compressed archive segments
+        self._log_archiver = ConversationLogArchiver(self.get_log_connection, self.execute_log_write,
+                                                     **(log_archive_config or {}))
+
+        # Sequence-based order IDs (HEFyymmddNNNN)
+        self._order_ids = OrderIdAllocator(self.execute_write)
+
+        # Checkpoints, planner statistics and incremental vacuum for each database file
+        self._maintenance = [DatabaseMaintenance('main', db_path, self._pool.connection, self._pool.get_stats,
+                                                 **(maintenance_config or {}))]
+        if self._log_pool is not None:
+            self._maintenance.append(DatabaseMaintenance('log', self.log_db_path, self._log_pool.connection,
+                                                         self._log_pool.get_stats, **(maintenance_config or {})))
+
         logger.info("✅ Thread-safe database manager initialized")
 
     @contextmanager
     def get_db_connection(self, timeout: float = 30.0):
-        """Get database connection with proper locking"""
-        conn = None
-        try:
-            conn = sqlite3.connect(
-                self.db_path,
-                timeout=timeout,
-                check_same_thread=False  # Allow cross-thread usage
-            )
-
-            # Configure for better concurrency
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
-            conn.execute("PRAGMA cache_size=10000")
-            conn.execute("PRAGMA temp_store=MEMORY")
-            conn.execute("PRAGMA foreign_keys = ON")
-            conn.execute("PRAGMA busy_timeout=30000")
-
-            yield conn
-
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                logger.warning(f"⚠️ Database locked, retrying...")
-                time.sleep(0.1)
+        """Check out a pooled database connection with proper locking"""
+        with self._pool.connection(timeout=timeout) as conn:
+            try:
+                yield conn
+
+            except sqlite3.OperationalError as e:
+                if "database is locked" in str(e):
+                    # The pool's busy_timeout has already waited for the lock
+                    logger.error(f"❌ Database still locked after busy timeout: {e}")
+                else:
+                    logger.error(f"❌ Database operational error: {e}")
                 raise
-            else:
-                logger.error(f"❌ Database operational error: {e}")
+            except Exception as e:
+                # Any open transaction is rolled back when the pool takes the connection back
+                logger.error(f"❌ Database error: {e}")
                 raise
+
+    def execute_write(self, job: Callable[[sqlite3.Connection], Any], timeout: float = 30.0) -> Any:
+        """Run job(conn) in a write transaction and return its result.
+
+        In single-writer mode the job is queued to the writer thread and
+        committed together with other queued jobs; otherwise it runs on a
+        pooled connection in its own BEGIN IMMEDIATE transaction. Jobs must
+        not commit or roll back themselves.
+        """
+        if self._writer is not None:
+            return self._writer.execute(job, timeout)
+        return run_in_transaction(lambda: self.get_db_connection(timeout), job)
+
+    def get_log_connection(self, timeout: float = 30.0):
+        """Check out a connection to the database holding conversation_log"""
+        if self._log_pool is None:
+            return self.get_db_connection(timeout)
+        return self._log_pool.connection(timeout=timeout)
+
+    def execute_log_write(self, job: Callable[[sqlite3.Connection], Any], timeout: float = 30.0) -> Any:
+        """Run a conversation_log write job (on the log file when it is split out)"""
+        if self._log_pool is None:
+            return self.execute_write(job, timeout)
+        return run_in_transaction(lambda: self._log_pool.connection(timeout=timeout), job)
+
+    def _delete_conversation_log(self, conn: sqlite3.Connection, phone_number: str):
+        """Delete a user's log rows inside a main-database job, or right after it when split"""
+        if self._log_pool is None:
+            conn.execute("DELETE FROM conversation_log WHERE phone_number = ?", (phone_number,))
+
+    def _delete_split_conversation_log(self, phone_number: str):
+        if self._log_pool is not None:
+            self.execute_log_write(lambda conn: conn.execute(
+                "DELETE FROM conversation_log WHERE phone_number = ?", (phone_number,)
+            ))
+
+    def _move_conversation_log_to_log_file(self, batch_size: int = 500) -> int:
+        """Move conversation_log rows left in the main file into the log file.
+
+        Rows logged before CONVERSATION_LOG_DB_PATH was set would otherwise never
+        be archived or deleted. Each batch is copied while the main file's write
+        lock is held and deleted in that same transaction, so workers starting
+        together never copy the same rows; a crash between the two commits can
+        duplicate one batch in the log file but never loses rows.
+        """
+        def move_batch(conn):
+            rows = conn.execute("""
+                SELECT id, phone_number, message_type, content, ai_response, current_step, timestamp
+                FROM conversation_log
+                ORDER BY id
+                LIMIT ?
+            """, (batch_size,)).fetchall()
+            if rows:
+                self.execute_log_write(lambda log_conn: log_conn.executemany("""
+                    INSERT INTO conversation_log
+                    (phone_number, message_type, content, ai_response, current_step, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [row[1:] for row in rows]))
+                conn.execute("DELETE FROM conversation_log WHERE id <= ?", (rows[-1][0],))
+            return len(rows)
+
+        moved = 0
+        try:
+            with self.get_db_connection() as conn:
+                # Only take the write lock when there is something to move
+                pending = conn.execute("SELECT 1 FROM conversation_log LIMIT 1").fetchone()
+            while pending:
+                count = self.execute_write(move_batch)
+                moved += count
+                pending = count == batch_size
         except Exception as e:
-            logger.error(f"❌ Database error: {e}")
-            if conn:
-                conn.rollback()
-            raise
-        finally:
-            if conn:
-                conn.close()
+            logger.error(f"❌ Error moving conversation log rows to {self.log_db_path}: {e}")
+
+        if moved:
+            logger.info(f"📦 Moved {moved} conversation log rows to {self.log_db_path}")
+        return moved
+
+    def get_pool_stats(self) -> Dict:
+        """Get connection pool statistics"""
+        return self._pool.get_stats()
+
+    def track_message(self):
+        """Context manager counting the connections and queries one message uses"""
+        if self._query_stats is None:
+            return nullcontext()
+        return self._query_stats.track_message()
+
+    def get_query_stats(self, top: int = 20, order_by: str = 'total_ms') -> Dict:
+        """Get query instrumentation: per-statement histograms, lock waits, slow queries"""
+        if self._query_stats is None:
+            return {'enabled': False}
+        stats = self._query_stats.get_stats(top=top, order_by=order_by)
+        stats['enabled'] = True
+        return stats
+
+    def reset_query_stats(self):
+        """Start a fresh query measurement window"""
+        if self._query_stats is not None:
+            self._query_stats.reset()
+
+    def close(self):
+        """Flush pending writes and release pooled connections (call on shutdown)"""
+        if self._leases is not None:
+            session_manager.set_coordinator(None)
+            self._leases.close()
+        self._session_writer.close()
+        self._log_writer.close()
+        if self._writer is not None:
+            self._writer.close()
+        self._pool.close()
+        if self._log_pool is not None:
+            self._log_pool.close()
+
+    def _drop_stale_user(self, phone_number: str):
+        """Forget a user's cached session and cart after another process handled them"""
+        session_manager.invalidate_user_state(phone_number)
+        self._carts.evict(phone_number)
 
     def init_database(self):
         """Initialize database with thread safety"""
@@ -79,9 +261,19 @@ class ThreadSafeDatabaseManager:
 
                 conn.commit()
 
+                # Bring the schema up to date
+                apply_migrations(conn)
+
                 # Populate initial data if needed
                 self._populate_initial_data(conn)
 
+            if self._log_pool is not None:
+                with self.get_log_connection(timeout=60.0) as conn:
+                    for name, sql in DatabaseSchema.get_log_database_definitions().items():
+                        conn.execute(sql)
+                        logger.debug(f"✅ Created/verified {name} in {self.log_db_path}")
+                    conn.commit()
+
     def _populate_initial_data(self, conn):
         """Populate initial data (thread-safe)"""
         try:
@@ -139,20 +331,7 @@ class ThreadSafeDatabaseManager:
         # First check in-memory cache
         state = session_manager.get_user_state(phone_number)
         if state:
-            return {
-                'phone_number': state.phone_number,
-                'current_step': state.current_step,
-                'language_preference': state.language_preference,
-                'customer_name': state.customer_name,
-                'selected_main_category': state.selected_main_category,
-                'selected_sub_category': state.selected_sub_category,
-                'selected_item': state.selected_item,
-                'order_mode': state.order_mode,
-                'quick_order_item': state.quick_order_item,
-                'conversation_context': json.dumps(state.conversation_context),
-                'created_at': state.created_at.isoformat(),
-                'updated_at': state.updated_at.isoformat()
-            }
+            return session_from_state(state)
 
         # Fallback to database (for persistence)
         try:
@@ -227,18 +406,8 @@ class ThreadSafeDatabaseManager:
                     quick_order_item=quick_order_item
                 )
 
-                # Persist to database
-                with self.get_db_connection() as conn:
-                    # Use INSERT OR REPLACE for atomic operation
-                    conn.execute("""
-                        INSERT OR REPLACE INTO user_sessions 
-                        (phone_number, current_step, language_preference, customer_name, 
-                         selected_main_category, selected_sub_category, selected_item, order_mode, quick_order_item, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (phone_number, current_step, language, customer_name,
-                          selected_main_category, selected_sub_category, selected_item, order_mode, quick_order_item))
-
-                    conn.commit()
+                # Persisted by the session writer (end of message or next interval)
+                session_manager.mark_dirty(phone_number)
 
                 logger.debug(f"✅ Session updated for {phone_number}: {current_step}")
                 return True
@@ -251,25 +420,31 @@ class ThreadSafeDatabaseManager:
         """Delete user session with thread safety"""
         with session_manager.user_session_lock(phone_number):
             try:
-                # Remove from in-memory cache
+                # Remove from in-memory cache (drops any unpersisted changes)
                 session_manager.delete_user_state(phone_number)
 
-                # Remove from database
-                with self.get_db_connection() as conn:
-                    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+                # Wait out an in-flight session batch so it can't re-insert the row
+                self._session_writer.flush([phone_number])
+
+                # Write out queued log records so the delete below covers them
+                self._log_writer.flush()
 
+                def delete_rows(conn):
                     if only_session:
                         # Only delete session record and conversation log (for when orders already cleaned up)
-                        conn.execute("DELETE FROM conversation_log WHERE phone_number = ?", (phone_number,))
+                        self._delete_conversation_log(conn, phone_number)
                         conn.execute("DELETE FROM user_sessions WHERE phone_number = ?", (phone_number,))
                     else:
                         # Delete all related data in proper order to avoid foreign key constraints
                         conn.execute("DELETE FROM user_orders WHERE phone_number = ?", (phone_number,))
                         conn.execute("DELETE FROM order_details WHERE phone_number = ?", (phone_number,))
-                        conn.execute("DELETE FROM conversation_log WHERE phone_number = ?", (phone_number,))
+                        self._delete_conversation_log(conn, phone_number)
                         conn.execute("DELETE FROM user_sessions WHERE phone_number = ?", (phone_number,))
 
-                    conn.commit()
+                with self._carts.mutation(phone_number):
+                    self.execute_write(delete_rows)
+                    self._carts.evict(phone_number)
+                self._delete_split_conversation_log(phone_number)
 
                 logger.info(f"🗑️ Session deleted for {phone_number}")
                 return True
@@ -279,37 +454,63 @@ class ThreadSafeDatabaseManager:
                 return False
 
     # Order Operations (Thread-Safe)
-    def add_item_to_order(self, phone_number: str, item_id: int, quantity: int,
-                          special_requests: str = None, special_price: int = None) -> bool:
-        """Add item to order with thread safety"""
+    def add_items_to_order(self, phone_number: str, items: List[Tuple]) -> int:
+        """Add several items to an order in one write transaction.
+
+        `items` holds (item_id, quantity[, special_price[, special_requests]])
+        tuples. Prices are resolved with a single IN query and rows are
+        inserted with executemany; unavailable items are skipped. Returns the
+        number of items added.
+        """
+        entries = [tuple(entry) + (None,) * (4 - len(entry)) for entry in items]
+        if not entries:
+            return 0
+
         with session_manager.user_session_lock(phone_number):
             try:
-                with self.get_db_connection() as conn:
-                    conn.execute("BEGIN IMMEDIATE TRANSACTION")
-
-                    # Get item price atomically
-                    cursor = conn.execute(
-                        "SELECT price FROM menu_items WHERE id = ? AND available = 1",
-                        (item_id,)
-                    )
-                    item = cursor.fetchone()
-
-                    if not item:
-                        logger.error(f"❌ Item {item_id} not found or not available")
-                        return False
-
-                    price = item[0]
-                    # Use special price if provided (for offers), otherwise use regular price
-                    if special_price is not None:
-                        price = special_price
-                        logger.info(f"🎯 Using special price {special_price} for item {item_id} (regular price: {item[0]})")
-                    subtotal = price * quantity
+                def add_items(conn):
+                    # Get item prices atomically
+                    item_ids = sorted({entry[0] for entry in entries})
+                    placeholders = ', '.join('?' * len(item_ids))
+                    menu = {
+                        row[0]: row[1:] for row in conn.execute(
+                            f"SELECT id, price, item_name_ar, item_name_en, unit FROM menu_items "
+                            f"WHERE id IN ({placeholders}) AND available = 1",
+                            item_ids
+                        )
+                    }
 
-                    # Add item to order
-                    conn.execute("""
+                    rows = []
+                    for item_id, quantity, special_price, special_requests in entries:
+                        item = menu.get(item_id)
+                        if not item:
+                            logger.error(f"❌ Item {item_id} not found or not available")
+                            continue
+
+                        price = item[0]
+                        # Use special price if provided (for offers), otherwise use regular price
+                        if special_price is not None:
+                            price = special_price
+                            logger.info(f"🎯 Using special price {special_price} for item {item_id} (regular price: {item[0]})")
+                        rows.append((phone_number, item_id, quantity, price * quantity, special_requests))
+
+                    if not rows:
+                        return []
+
+                    # Conversation logging is asynchronous, so make sure the session row exists
+                    self._ensure_session_row(conn, phone_number)
+
+                    # Add items to order; ids above the current maximum are ours (we hold the write lock)
+                    last_id = conn.execute("SELECT MAX(id) FROM user_orders").fetchone()[0] or 0
+                    conn.executemany("""
                         INSERT INTO user_orders (phone_number, menu_item_id, quantity, subtotal, special_requests)
                         VALUES (?, ?, ?, ?, ?)
-                    """, (phone_number, item_id, quantity, subtotal, special_requests))
+                    """, rows)
+                    inserted = conn.execute("""
+                        SELECT id, added_at FROM user_orders
+                        WHERE id > ? AND phone_number = ?
+                        ORDER BY id
+                    """, (last_id, phone_number)).fetchall()
 
                     # Create order details record if doesn't exist
                     conn.execute("""
@@ -317,110 +518,122 @@ class ThreadSafeDatabaseManager:
                         VALUES (?)
                     """, (phone_number,))
 
-                    conn.commit()
-                    
-                    # Verify the item was actually added
-                    verify_cursor = conn.execute(
-                        "SELECT COUNT(*) FROM user_orders WHERE phone_number = ? AND menu_item_id = ?",
-                        (phone_number, item_id)
-                    )
-                    count = verify_cursor.fetchone()[0]
-                    logger.info(f"✅ Added item {item_id} × {quantity} to order for {phone_number}. Verification count: {count}")
+                    # The cart rows as get_user_order would read them back
+                    added = []
+                    for (row_id, added_at), (_, item_id, quantity, subtotal, special_requests) in zip(inserted, rows):
+                        price, item_name_ar, item_name_en, unit = menu[item_id]
+                        added.append(CartItem(row_id, phone_number, item_id, quantity, subtotal, special_requests,
+                                              added_at, item_name_ar, item_name_en, price, unit or 'piece'))
+                    return added
 
-                return True
+                with self._carts.mutation(phone_number):
+                    added = self.execute_write(add_items)
+                    for item in added:
+                        self._carts.add_item(phone_number, item)
+
+                for item in added:
+                    logger.info(f"✅ Added item {item.menu_item_id} × {item.quantity} to order for {phone_number}")
+                return len(added)
 
             except Exception as e:
-                logger.error(f"❌ Error adding item to order: {e}")
-                return False
+                logger.error(f"❌ Error adding items to order: {e}")
+                return 0
 
     def get_user_order(self, phone_number: str) -> Optional[Dict]:
-        """Get user order with thread safety"""
+        """Get user order with thread safety (served from the cart cache)"""
         try:
-            with self.get_db_connection() as conn:
-                logger.info(f"🔍 Getting user order for {phone_number}")
-                
-                # Get order items
-                cursor = conn.execute("""
-                    SELECT uo.id, uo.phone_number, uo.menu_item_id, uo.quantity, 
-                           uo.subtotal, uo.special_requests, uo.added_at,
-                           COALESCE(mi.item_name_ar, 'Unknown Item') as item_name_ar, 
-                           COALESCE(mi.item_name_en, 'Unknown Item') as item_name_en, 
-                           COALESCE(mi.price, 0) as price, 
-                           COALESCE(mi.unit, 'piece') as unit
-                    FROM user_orders uo
-                    LEFT JOIN menu_items mi ON uo.menu_item_id = mi.id
-                    WHERE uo.phone_number = ?
-                    ORDER BY uo.added_at
-                """, (phone_number,))
+            def load():
+                with self.get_db_connection() as conn:
+                    return self._read_user_order(conn, phone_number)
 
-                items = []
-                total = 0
-                
-                rows = cursor.fetchall()
-                logger.info(f"🔍 Database query returned {len(rows)} rows for {phone_number}")
+            return self._carts.get(phone_number, load)
 
-                for row in rows:
-                    item = {
-                        'id': row[0],
-                        'phone_number': row[1],
-                        'menu_item_id': row[2],
-                        'quantity': row[3],
-                        'subtotal': row[4],
-                        'special_requests': row[5],
-                        'added_at': row[6],
-                        'item_name_ar': row[7],
-                        'item_name_en': row[8],
-                        'price': row[9],
-                        'unit': row[10]
-                    }
-                    items.append(item)
-                    total += row[4]
-                    logger.info(f"🔍 Found item: {item['item_name_ar']} × {item['quantity']} = {item['subtotal']}")
-                
-                logger.info(f"🔍 Total items found: {len(items)}, Total amount: {total}")
+        except Exception as e:
+            logger.error(f"❌ Error getting user order: {e}")
+            return None
 
-                # Get order details
-                cursor = conn.execute("""
-                    SELECT service_type, location, total_amount, customizations, order_status
-                    FROM order_details 
-                    WHERE phone_number = ?
-                """, (phone_number,))
+    def _read_user_order(self, conn: sqlite3.Connection, phone_number: str) -> Cart:
+        """Read cart items and order details using an open connection"""
+        logger.debug(f"🔍 Getting user order for {phone_number}")
+        
+        # Get order items (columns in CartItem field order)
+        cursor = conn.execute("""
+            SELECT uo.id, uo.phone_number, uo.menu_item_id, uo.quantity, 
+                   uo.subtotal, uo.special_requests, uo.added_at,
+                   COALESCE(mi.item_name_ar, 'Unknown Item') as item_name_ar, 
+                   COALESCE(mi.item_name_en, 'Unknown Item') as item_name_en, 
+                   COALESCE(mi.price, 0) as price, 
+                   COALESCE(mi.unit, 'piece') as unit
+            FROM user_orders uo
+            LEFT JOIN menu_items mi ON uo.menu_item_id = mi.id
+            WHERE uo.phone_number = ?
+            ORDER BY uo.added_at
+        """, (phone_number,))
+
+        items = [CartItem(*row) for row in cursor.fetchall()]
+        logger.debug(f"🔍 Database query returned {len(items)} rows for {phone_number}")
+
+        # Get order details (totals are maintained by triggers on user_orders)
+        cursor = conn.execute("""
+            SELECT service_type, location, total_amount, customizations, order_status, item_count
+            FROM order_details 
+            WHERE phone_number = ?
+        """, (phone_number,))
+
+        details_row = cursor.fetchone()
+        details = {
+            'service_type': details_row[0] if details_row else None,
+            'location': details_row[1] if details_row else None,
+            'total_amount': details_row[2] if details_row else 0,
+            'item_count': details_row[5] if details_row else 0,
+            'customizations': details_row[3] if details_row else None,
+            'order_status': details_row[4] if details_row else 'in_progress'
+        }
+        logger.debug(f"🔍 Total items found: {len(items)}, Total amount: {details['total_amount']}")
+
+        return Cart(items, details)
+
+    def get_order_total(self, phone_number: str) -> int:
+        """Get the stored cart total without reading the cart items"""
+        try:
+            total = self._carts.get_total(phone_number)
+            if total is not None:
+                return total
 
-                details_row = cursor.fetchone()
-                details = {
-                    'service_type': details_row[0] if details_row else None,
-                    'location': details_row[1] if details_row else None,
-                    'total_amount': details_row[2] if details_row else 0,
-                    'customizations': details_row[3] if details_row else None,
-                    'order_status': details_row[4] if details_row else 'in_progress'
-                }
-
-                return {
-                    'items': items,
-                    'total': total,
-                    'details': details
-                }
+            with self.get_db_connection() as conn:
+                row = conn.execute(
+                    "SELECT total_amount FROM order_details WHERE phone_number = ?", (phone_number,)
+                ).fetchone()
+                return row[0] if row else 0
 
         except Exception as e:
-            logger.error(f"❌ Error getting user order: {e}")
-            return None
+            logger.error(f"❌ Error getting order total: {e}")
+            return 0
 
     def complete_order(self, phone_number: str) -> str:
-        """Complete order with thread safety"""
+        """Complete order atomically: read, archive and clear the cart in one transaction"""
         with session_manager.user_session_lock(phone_number):
             try:
-                import random
-                order_id = f"HEF{random.randint(1000, 9999)}"
+                # Cart mutations need this user's lock, so the cart can't empty before the
+                # archive below; checking first keeps empty carts from burning order IDs
+                order = self.get_user_order(phone_number)
+                if not order or not order['items']:
+                    logger.error(f"❌ No order found for {phone_number}")
+                    return None
 
-                with self.get_db_connection() as conn:
-                    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+                # Allocate before the transaction: block reservations commit on their own
+                order_id = self._order_ids.next_id()
+
+                # Persist pending session changes before the session row is removed
+                self._session_writer.flush([phone_number])
 
-                    # Get order data
-                    order = self.get_user_order(phone_number)
+                # Write out queued log records so the delete below covers them
+                self._log_writer.flush()
 
-                    if not order or not order['items']:
-                        logger.error(f"❌ No order found for {phone_number}")
-                        return None
+                def archive_cart(conn):
+                    order = self._read_user_order(conn, phone_number).snapshot()
+                    if not order['items']:
+                        return False
 
                     # Save to completed orders
                     conn.execute("""
@@ -435,16 +648,27 @@ class ThreadSafeDatabaseManager:
                         order['details'].get('service_type'),
                         order['details'].get('location')
                     ))
+                    insert_completed_order_items(conn, order_id, order['items'])
+                    record_order_items(conn, order['items'])
 
-                    # Clear current order data and conversation log
+                    # Clear current order data, conversation log and the session row
                     conn.execute("DELETE FROM user_orders WHERE phone_number = ?", (phone_number,))
                     conn.execute("DELETE FROM order_details WHERE phone_number = ?", (phone_number,))
-                    conn.execute("DELETE FROM conversation_log WHERE phone_number = ?", (phone_number,))
+                    self._delete_conversation_log(conn, phone_number)
+                    conn.execute("DELETE FROM user_sessions WHERE phone_number = ?", (phone_number,))
+                    return True
 
-                    conn.commit()
+                with self._carts.mutation(phone_number):
+                    completed = self.execute_write(archive_cart)
+                    if completed:
+                        self._carts.evict(phone_number)
 
-                # Clear session (orders already deleted above)
-                self.delete_session(phone_number, only_session=True)
+                if not completed:
+                    logger.error(f"❌ No order found for {phone_number}")
+                    return None
+                self._delete_split_conversation_log(phone_number)
+
+                session_manager.delete_user_state(phone_number)
 
                 logger.info(f"✅ Order {order_id} completed for {phone_number}")
                 return order_id
@@ -453,29 +677,48 @@ class ThreadSafeDatabaseManager:
                 logger.error(f"❌ Error completing order: {e}")
                 return None
 
-    # Menu Operations (Read-only, thread-safe by nature)
+    # Menu Operations (served from the in-memory catalog)
+    def get_menu_catalog(self) -> MenuCatalog:
+        """Get the current menu catalog, rebuilding it if the menu version changed.
+
+        The version is re-checked at most every `menu_check_interval` seconds, so
+        menu reads between checks never touch the database.
+        """
+        catalog = self._menu_catalog
+        if catalog is not None and time.monotonic() - self._menu_checked_at < self.menu_check_interval:
+            return catalog
+
+        with self._menu_catalog_lock:
+            catalog = self._menu_catalog
+            if catalog is not None and time.monotonic() - self._menu_checked_at < self.menu_check_interval:
+                return catalog
+
+            with self.get_db_connection() as conn:
+                # Read version and rows from one snapshot
+                own_transaction = not conn.in_transaction
+                if own_transaction:
+                    conn.execute("BEGIN")
+                version = conn.execute("SELECT version FROM menu_version WHERE id = 1").fetchone()[0]
+                if catalog is None or catalog.version != version:
+                    if catalog is not None:
+                        # Cached carts embed menu names and prices
+                        self._carts.evict()
+                    catalog = MenuCatalog.load(conn, version)
+                    self._menu_catalog = catalog
+                if own_transaction:
+                    conn.commit()
+
+            self._menu_checked_at = time.monotonic()
+            return catalog
+
+    def invalidate_menu_catalog(self):
+        """Force the next menu read to re-check the menu version"""
+        self._menu_checked_at = 0.0
+
     def get_main_categories(self) -> List[Dict]:
         """Get main categories"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT id, name_ar, name_en, display_order, available
-                    FROM main_categories 
-                    WHERE available = 1
-                    ORDER BY display_order
-                """)
-
-                categories = []
-                for row in cursor.fetchall():
-                    categories.append({
-                        'id': row[0],
-                        'name_ar': row[1],
-                        'name_en': row[2],
-                        'display_order': row[3],
-                        'available': bool(row[4])
-                    })
-
-                return categories
+            return self.get_menu_catalog().get_main_categories()
         except Exception as e:
             logger.error(f"❌ Error getting main categories: {e}")
             return []
@@ -483,29 +726,7 @@ class ThreadSafeDatabaseManager:
     def get_category_items(self, main_category_id: int) -> List[Dict]:
         """Get all items for a main category"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT mi.id, mi.sub_category_id, mi.main_category_id, 
-                           mi.item_name_ar, mi.item_name_en, mi.price, mi.unit, mi.available
-                    FROM menu_items mi
-                    WHERE mi.main_category_id = ? AND mi.available = 1
-                    ORDER BY mi.item_name_ar
-                """, (main_category_id,))
-
-                items = []
-                for row in cursor.fetchall():
-                    items.append({
-                        'id': row[0],
-                        'sub_category_id': row[1],
-                        'main_category_id': row[2],
-                        'item_name_ar': row[3],
-                        'item_name_en': row[4],
-                        'price': row[5],
-                        'unit': row[6],
-                        'available': bool(row[7])
-                    })
-
-                return items
+            return self.get_menu_catalog().get_category_items(main_category_id)
         except Exception as e:
             logger.error(f"❌ Error getting category items: {e}")
             return []
@@ -513,26 +734,7 @@ class ThreadSafeDatabaseManager:
     def get_sub_categories(self, main_category_id: int) -> List[Dict]:
         """Get sub-categories for a main category"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT id, main_category_id, name_ar, name_en, display_order, available
-                    FROM sub_categories 
-                    WHERE main_category_id = ? AND available = 1
-                    ORDER BY display_order
-                """, (main_category_id,))
-
-                sub_categories = []
-                for row in cursor.fetchall():
-                    sub_categories.append({
-                        'id': row[0],
-                        'main_category_id': row[1],
-                        'name_ar': row[2],
-                        'name_en': row[3],
-                        'display_order': row[4],
-                        'available': bool(row[5])
-                    })
-
-                return sub_categories
+            return self.get_menu_catalog().get_sub_categories(main_category_id)
         except Exception as e:
             logger.error(f"❌ Error getting sub-categories: {e}")
             return []
@@ -540,29 +742,7 @@ class ThreadSafeDatabaseManager:
     def get_sub_category_items(self, sub_category_id: int) -> List[Dict]:
         """Get items for a specific sub-category"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT mi.id, mi.sub_category_id, mi.main_category_id, 
-                           mi.item_name_ar, mi.item_name_en, mi.price, mi.unit, mi.available
-                    FROM menu_items mi
-                    WHERE mi.sub_category_id = ? AND mi.available = 1
-                    ORDER BY mi.item_name_ar
-                """, (sub_category_id,))
-
-                items = []
-                for row in cursor.fetchall():
-                    items.append({
-                        'id': row[0],
-                        'sub_category_id': row[1],
-                        'main_category_id': row[2],
-                        'item_name_ar': row[3],
-                        'item_name_en': row[4],
-                        'price': row[5],
-                        'unit': row[6],
-                        'available': bool(row[7])
-                    })
-
-                return items
+            return self.get_menu_catalog().get_sub_category_items(sub_category_id)
         except Exception as e:
             logger.error(f"❌ Error getting sub-category items: {e}")
             return []
@@ -570,36 +750,71 @@ class ThreadSafeDatabaseManager:
     def get_item_by_id(self, item_id: int) -> Optional[Dict]:
         """Get item by ID"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT id, sub_category_id, main_category_id, item_name_ar, 
-                           item_name_en, price, unit, available
-                    FROM menu_items 
-                    WHERE id = ? AND available = 1
-                """, (item_id,))
-
-                row = cursor.fetchone()
-                if row:
-                    return {
-                        'id': row[0],
-                        'sub_category_id': row[1],
-                        'main_category_id': row[2],
-                        'item_name_ar': row[3],
-                        'item_name_en': row[4],
-                        'price': row[5],
-                        'unit': row[6],
-                        'available': bool(row[7])
-                    }
-                return None
-
+            return self.get_menu_catalog().get_item_by_id(item_id)
         except Exception as e:
             logger.error(f"❌ Error getting item by ID: {e}")
             return None
 
+    def get_popular_items(self, limit: int = 5) -> List[Dict]:
+        """Get the top available menu items by time-decayed order volume"""
+        try:
+            catalog = self.get_menu_catalog()
+            popular_items = []
+            if limit <= 0:
+                return popular_items
+
+            # Page down the ranking until enough available items are collected:
+            # items no longer on the menu are skipped, as in the in-memory backend
+            page_size = limit * 2
+            position = (float('inf'), 0)  # Keyset (decay_score, menu_item_id) of the last row seen
+            with self.get_db_connection() as conn:
+                while len(popular_items) < limit:
+                    rows = conn.execute("""
+                        SELECT menu_item_id, order_count, total_quantity, total_revenue, last_ordered_at, decay_score
+                        FROM item_stats
+                        WHERE (decay_score, menu_item_id) < (?, ?)
+                        ORDER BY decay_score DESC, menu_item_id DESC
+                        LIMIT ?
+                    """, (position[0], position[1], page_size)).fetchall()
+
+                    for row in rows:
+                        item = catalog.get_item_by_id(row[0])
+                        if not item:
+                            continue
+                        item.update({
+                            'order_count': row[1],
+                            'total_quantity': row[2],
+                            'total_revenue': row[3],
+                            'last_ordered_at': row[4]
+                        })
+                        popular_items.append(item)
+                        if len(popular_items) >= limit:
+                            break
+
+                    if len(rows) < page_size:
+                        break
+                    position = (rows[-1][5], rows[-1][0])
+
+            return popular_items
+        except Exception as e:
+            logger.error(f"❌ Error getting popular items: {e}")
+            return []
+
+    def get_all_menu_items(self) -> List[Dict]:
+        """Get every available item across all categories, in menu order"""
+        try:
+            return self.get_menu_catalog().get_all_items()
+        except Exception as e:
+            logger.error(f"❌ Error getting all menu items: {e}")
+            return []
+
     def update_session_field(self, phone_number: str, field_name: str, value: Any) -> bool:
         """Update a specific field in user session with thread safety"""
         try:
-            with self.get_db_connection() as conn:
+            # Write pending in-memory changes first so they can't overwrite this update
+            self._session_writer.flush([phone_number])
+
+            def update_field(conn):
                 # Build dynamic update query
                 query = f"""
                     UPDATE user_sessions 
@@ -607,9 +822,10 @@ class ThreadSafeDatabaseManager:
                     WHERE phone_number = ?
                 """
                 conn.execute(query, (value, phone_number))
-                conn.commit()
-                logger.info(f"✅ Updated session field '{field_name}' for {phone_number}")
-                return True
+
+            self.execute_write(update_field)
+            logger.info(f"✅ Updated session field '{field_name}' for {phone_number}")
+            return True
         except Exception as e:
             logger.error(f"❌ Error updating session field: {e}")
             return False
@@ -617,35 +833,40 @@ class ThreadSafeDatabaseManager:
     def update_order_details(self, phone_number: str, **kwargs) -> bool:
         """Update order details with thread safety"""
         try:
-            with self.get_db_connection() as conn:
-                # First, ensure the order_details record exists
+            # Build the UPDATE query for order_details table
+            update_fields = []
+            values = []
+            for field, value in kwargs.items():
+                if value is not None:
+                    update_fields.append(f"{field} = ?")
+                    values.append(value)
+
+            def update_details(conn):
+                # First, ensure the session and order_details records exist
+                self._ensure_session_row(conn, phone_number)
                 conn.execute("""
                     INSERT OR IGNORE INTO order_details (phone_number)
                     VALUES (?)
                 """, (phone_number,))
-                
-                # Build the UPDATE query for order_details table
-                update_fields = []
-                values = []
-                for field, value in kwargs.items():
-                    if value is not None:
-                        update_fields.append(f"{field} = ?")
-                        values.append(value)
-                
+
                 if update_fields:
-                    values.append(phone_number)
                     query = f"""
                         UPDATE order_details 
                         SET {', '.join(update_fields)}
                         WHERE phone_number = ?
                     """
-                    conn.execute(query, values)
-                    conn.commit()
-                    logger.info(f"✅ Updated order details for {phone_number}: {kwargs}")
-                    return True
-                
-                return True
-                    
+                    conn.execute(query, values + [phone_number])
+
+            with session_manager.user_session_lock(phone_number), self._carts.mutation(phone_number):
+                self.execute_write(update_details)
+                self._carts.update_details(
+                    phone_number, **{field: value for field, value in kwargs.items() if value is not None}
+                )
+
+            if update_fields:
+                logger.info(f"✅ Updated order details for {phone_number}: {kwargs}")
+            return True
+
         except Exception as e:
             logger.error(f"❌ Error updating order details: {e}")
             return False
@@ -653,7 +874,7 @@ class ThreadSafeDatabaseManager:
     def remove_last_item_from_order(self, phone_number: str) -> bool:
         """Remove the last added item from user's order with thread safety"""
         try:
-            with self.get_db_connection() as conn:
+            def remove_last(conn):
                 # Get the last added item
                 cursor = conn.execute("""
                     SELECT id, menu_item_id, quantity 
@@ -662,23 +883,29 @@ class ThreadSafeDatabaseManager:
                     ORDER BY added_at DESC 
                     LIMIT 1
                 """, (phone_number,))
-                
+
                 last_item = cursor.fetchone()
-                
+
                 if last_item:
                     # Remove the last item
                     conn.execute("""
                         DELETE FROM user_orders 
                         WHERE id = ?
                     """, (last_item[0],))
-                    
-                    conn.commit()
-                    logger.info(f"✅ Removed last item {last_item[1]} × {last_item[2]} from order for {phone_number}")
-                    return True
-                else:
-                    logger.warning(f"⚠️ No items found in order for {phone_number}")
-                    return False
-                
+                return last_item
+
+            with session_manager.user_session_lock(phone_number), self._carts.mutation(phone_number):
+                last_item = self.execute_write(remove_last)
+                if last_item:
+                    self._carts.remove_items(phone_number, lambda item: item.id == last_item[0])
+
+            if last_item:
+                logger.info(f"✅ Removed last item {last_item[1]} × {last_item[2]} from order for {phone_number}")
+                return True
+            else:
+                logger.warning(f"⚠️ No items found in order for {phone_number}")
+                return False
+
         except Exception as e:
             logger.error(f"❌ Error removing last item from order: {e}")
             return False
@@ -686,21 +913,22 @@ class ThreadSafeDatabaseManager:
     def remove_item_from_order(self, phone_number: str, menu_item_id: int) -> bool:
         """Remove a specific item from user's order by menu_item_id"""
         try:
-            with self.get_db_connection() as conn:
-                # Remove the specific item
-                cursor = conn.execute("""
+            # Remove the specific item
+            with session_manager.user_session_lock(phone_number), self._carts.mutation(phone_number):
+                removed = self.execute_write(lambda conn: conn.execute("""
                     DELETE FROM user_orders 
                     WHERE phone_number = ? AND menu_item_id = ?
-                """, (phone_number, menu_item_id))
-                
-                if cursor.rowcount > 0:
-                    conn.commit()
-                    logger.info(f"✅ Removed menu item {menu_item_id} from order for {phone_number}")
-                    return True
-                else:
-                    logger.warning(f"⚠️ Item {menu_item_id} not found in order for {phone_number}")
-                    return False
-                
+                """, (phone_number, menu_item_id)).rowcount)
+                if removed > 0:
+                    self._carts.remove_items(phone_number, lambda item: item.menu_item_id == menu_item_id)
+
+            if removed > 0:
+                logger.info(f"✅ Removed menu item {menu_item_id} from order for {phone_number}")
+                return True
+            else:
+                logger.warning(f"⚠️ Item {menu_item_id} not found in order for {phone_number}")
+                return False
+
         except Exception as e:
             logger.error(f"❌ Error removing item from order: {e}")
             return False
@@ -708,17 +936,18 @@ class ThreadSafeDatabaseManager:
     def update_item_quantity(self, phone_number: str, item_id: int, new_quantity: int) -> bool:
         """Update quantity of existing item in user's order (thread-safe)"""
         try:
-            with self.get_db_connection() as conn:
-                # Update the quantity of the existing item
-                cursor = conn.execute("""
+            # Update the quantity of the existing item
+            with session_manager.user_session_lock(phone_number), self._carts.mutation(phone_number):
+                updated = self.execute_write(lambda conn: conn.execute("""
                     UPDATE user_orders 
                     SET quantity = ?, subtotal = ? * (SELECT price FROM menu_items WHERE id = ?)
                     WHERE phone_number = ? AND menu_item_id = ?
-                """, (new_quantity, new_quantity, item_id, phone_number, item_id))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-                
+                """, (new_quantity, new_quantity, item_id, phone_number, item_id)).rowcount)
+                if updated > 0:
+                    self._carts.set_quantity(phone_number, item_id, new_quantity)
+
+            return updated > 0
+
         except Exception as e:
             logger.error(f"❌ Error updating item quantity: {e}")
             return False
@@ -726,24 +955,23 @@ class ThreadSafeDatabaseManager:
     def delete_menu_item(self, item_id: int) -> bool:
         """Delete a menu item by setting it as unavailable (thread-safe)"""
         try:
-            with self.get_db_connection() as conn:
-                # Set the item as unavailable instead of actually deleting it
-                cursor = conn.execute("""
-                    UPDATE menu_items 
-                    SET available = 0
-                    WHERE id = ?
-                """, (item_id,))
-                
-                conn.commit()
-                success = cursor.rowcount > 0
-                
-                if success:
-                    logger.info(f"✅ Successfully deleted menu item with ID: {item_id}")
-                else:
-                    logger.warning(f"⚠️ Menu item with ID {item_id} not found or already deleted")
-                
-                return success
-                
+            # Set the item as unavailable instead of actually deleting it
+            updated = self.execute_write(lambda conn: conn.execute("""
+                UPDATE menu_items 
+                SET available = 0
+                WHERE id = ?
+            """, (item_id,)).rowcount)
+
+            success = updated > 0
+
+            if success:
+                self.invalidate_menu_catalog()
+                logger.info(f"✅ Successfully deleted menu item with ID: {item_id}")
+            else:
+                logger.warning(f"⚠️ Menu item with ID {item_id} not found or already deleted")
+
+            return success
+
         except Exception as e:
             logger.error(f"❌ Error deleting menu item {item_id}: {e}")
             return False
@@ -756,14 +984,10 @@ class ThreadSafeDatabaseManager:
             memory_cleaned = session_manager.cleanup_expired_sessions()
 
             # Clean database sessions
-            with self.get_db_connection() as conn:
-                cursor = conn.execute("""
-                    DELETE FROM user_sessions 
-                    WHERE created_at < datetime('now', '-{} days')
-                """.format(days_old))
-
-                db_cleaned = cursor.rowcount
-                conn.commit()
+            db_cleaned = self.execute_write(lambda conn: conn.execute("""
+                DELETE FROM user_sessions 
+                WHERE created_at < datetime('now', '-{} days')
+            """.format(days_old)).rowcount)
 
             total_cleaned = memory_cleaned + db_cleaned
             logger.info(f"🧹 Cleaned up {total_cleaned} old sessions")
@@ -779,121 +1003,219 @@ class ThreadSafeDatabaseManager:
             with self.get_db_connection() as conn:
                 stats = {}
 
-                # Count records in each table
-                tables = ['user_sessions', 'menu_items', 'user_orders', 'order_details',
-                          'completed_orders', 'step_rules']
-
-                for table in tables:
-                    cursor = conn.execute(f"SELECT COUNT(*) FROM {table}")
-                    stats[f"{table}_count"] = cursor.fetchone()[0]
-
-                # Additional stats
-                cursor = conn.execute("SELECT COUNT(DISTINCT phone_number) FROM user_sessions")
-                stats['active_users'] = cursor.fetchone()[0]
-
-                cursor = conn.execute("SELECT SUM(total_amount) FROM completed_orders")
-                total_revenue = cursor.fetchone()[0]
-                stats['total_revenue'] = total_revenue or 0
+                # Trigger-maintained counters: constant cost however large the tables get
+                counters = read_counters(conn)
+                stats.update({name: value for name, value in counters.items() if name.endswith('_count')})
+                stats['active_users'] = counters.get('user_sessions_count', 0)
+                stats['total_revenue'] = counters.get('total_revenue', 0)
 
                 # Add session manager stats
                 session_stats = session_manager.get_session_stats()
                 stats.update(session_stats)
 
+                stats['connection_pool'] = self._pool.get_stats()
+                if self._log_pool is not None:
+                    stats['log_connection_pool'] = self._log_pool.get_stats()
+                stats['session_writer'] = self._session_writer.get_stats()
+                stats['cart_cache'] = self._carts.get_stats()
+                if self._leases is not None:
+                    stats['session_leases'] = self._leases.get_stats()
+                if self._writer is not None:
+                    stats['single_writer'] = self._writer.get_stats()
+                stats['conversation_log_writer'] = self._log_writer.get_stats()
+                stats['conversation_log_archive'] = self._log_archiver.get_stats()
+                stats['maintenance'] = self.get_maintenance_stats()
+
                 return stats
 
         except Exception as e:
             logger.error(f"❌ Error getting database stats: {e}")
             return {}
 
+    def verify_order_totals(self, repair: bool = True) -> List[Dict]:
+        """Check stored cart totals against user_orders, repairing drift by default"""
+        try:
+            if repair:
+                drifted = self.execute_write(lambda conn: verify_order_totals(conn, repair=True))
+            else:
+                with self.get_db_connection() as conn:
+                    drifted = verify_order_totals(conn)
+
+            if drifted:
+                for entry in drifted:
+                    self._carts.evict(entry['phone_number'])
+                action = "Repaired" if repair else "Found"
+                logger.warning(f"⚠️ {action} drifted totals for {len(drifted)} carts")
+            return drifted
+
+        except Exception as e:
+            logger.error(f"❌ Error verifying order totals: {e}")
+            return []
+
+    def refresh_database_counters(self) -> Dict[str, int]:
+        """Recount the stats counters from the base tables (repairs any drift).
+
+        The full scans run on one read snapshot without the write lock; only
+        the differences found there are applied, in a short write.
+        """
+        try:
+            with self.get_db_connection() as conn:
+                began = not conn.in_transaction
+                if began:
+                    conn.execute("BEGIN")  # Counters and rows from the same snapshot
+                try:
+                    before = read_counters(conn)
+                    after = count_counters(conn)
+                finally:
+                    if began:
+                        conn.commit()
+
+            drift = {name: value - before.get(name, 0) for name, value in after.items()
+                     if value != before.get(name, 0)}
+            if drift:
+                self.execute_write(lambda conn: apply_counter_deltas(conn, drift))
+                logger.warning(f"⚠️ Repaired database counter drift: {drift}")
+            return after
+
+        except Exception as e:
+            logger.error(f"❌ Error refreshing database counters: {e}")
+            return {}
+
     def log_conversation(self, phone_number: str, message_type: str, content: str,
                          ai_response: str = None, current_step: str = None):
-        """Log conversation for analytics (non-blocking) - FIXED"""
+        """Queue a conversation record for the background log writer (non-blocking)"""
         try:
-            with self.get_db_connection() as conn:
-                # First ensure user session exists to avoid foreign key constraint
-                conn.execute("""
-                    INSERT OR IGNORE INTO user_sessions 
-                    (phone_number, current_step, updated_at)
-                    VALUES (?, ?, CURRENT_TIMESTAMP)
-                """, (phone_number, current_step or 'waiting_for_language'))
-                
-                # Now log the conversation
-                conn.execute("""
-                    INSERT INTO conversation_log 
-                    (phone_number, message_type, content, ai_response, current_step)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (phone_number, message_type, content, ai_response, current_step))
-                conn.commit()
+            self._log_writer.submit(phone_number, message_type, content, ai_response, current_step)
         except Exception as e:
             logger.error(f"❌ Error logging conversation: {e}")
             # Don't fail the main operation if logging fails
 
-    def validate_step_transition(self, phone_number: str, next_step: str) -> bool:
-        """Validate step transition"""
-        state = session_manager.get_user_state(phone_number)
-        current_step = state.current_step if state else 'waiting_for_language'
+    def flush_sessions(self, phone_numbers: List[str] = None) -> int:
+        """Persist in-memory session changes now (all users, or just `phone_numbers`)"""
+        try:
+            return self._session_writer.flush(phone_numbers)
+        except Exception as e:
+            logger.error(f"❌ Error flushing sessions: {e}")
+            return 0
 
-        # Allow transitions from any step to language (restart)
-        if next_step == 'waiting_for_language':
-            return True
+    def flush_conversation_log(self) -> int:
+        """Write queued conversation records immediately"""
+        return self._log_writer.flush()
 
-        # Define allowed transitions
-        allowed_transitions = {
-            'waiting_for_language': ['waiting_for_category'],
-            'waiting_for_category': ['waiting_for_item'],
-            'waiting_for_item': ['waiting_for_quantity'],
-            'waiting_for_quantity': ['waiting_for_additional'],
-            'waiting_for_additional': ['waiting_for_category', 'waiting_for_service'],
-            'waiting_for_service': ['waiting_for_location'],
-            'waiting_for_location': ['waiting_for_confirmation'],
-            'waiting_for_confirmation': ['completed', 'waiting_for_language']
-        }
+    def get_log_writer_stats(self) -> Dict:
+        """Get conversation log writer metrics"""
+        return self._log_writer.get_stats()
+
+    def run_maintenance(self, force: bool = False) -> Dict[str, Dict[str, float]]:
+        """Run due maintenance tasks unless the database is busy (everything with `force`)"""
+        try:
+            return {maintenance.name: maintenance.run_due(force) for maintenance in self._maintenance}
+        except Exception as e:
+            logger.error(f"❌ Error running database maintenance: {e}")
+            return {}
+
+    def get_maintenance_stats(self) -> Dict:
+        """Get maintenance metrics per database file"""
+        return {maintenance.name: maintenance.get_stats() for maintenance in self._maintenance}
 
-        return next_step in allowed_transitions.get(current_step, [])
+    def archive_conversation_log(self, max_batches: Optional[int] = None) -> int:
+        """Archive and delete conversation log rows past the retention period"""
+        return self._log_archiver.archive_expired(max_batches)
 
-    def get_current_order(self, phone_number: str) -> Optional[Dict]:
-        """Get current order for a user (alias for get_user_order)"""
-        return self.get_user_order(phone_number)
+    def iter_archived_conversation_log(self, start_day: str = None, end_day: str = None,
+                                       phone_number: str = None):
+        """Stream archived conversation records (days as YYYY-MM-DD)"""
+        return self._log_archiver.iter_archived(start_day, end_day, phone_number)
+
+    def _ensure_session_row(self, conn, phone_number: str, current_step: str = 'waiting_for_language'):
+        """Create a placeholder session row so foreign keys to user_sessions hold"""
+        conn.execute("""
+            INSERT OR IGNORE INTO user_sessions
+            (phone_number, current_step, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, (phone_number, current_step))
 
     def get_order_history(self, phone_number: str = None, limit: int = 50) -> List[Dict]:
         """Get order history with thread safety"""
         try:
             with self.get_db_connection() as conn:
-                conn.row_factory = sqlite3.Row
-
+                # Columns in CompletedOrder field order
                 if phone_number:
                     cursor = conn.execute("""
-                        SELECT * FROM completed_orders 
+                        SELECT id, phone_number, order_id, items_json, total_amount,
+                               service_type, location, completed_at
+                        FROM completed_orders 
                         WHERE phone_number = ?
                         ORDER BY completed_at DESC
                         LIMIT ?
                     """, (phone_number, limit))
                 else:
                     cursor = conn.execute("""
-                        SELECT * FROM completed_orders 
+                        SELECT id, phone_number, order_id, items_json, total_amount,
+                               service_type, location, completed_at
+                        FROM completed_orders 
                         ORDER BY completed_at DESC
                         LIMIT ?
                     """, (limit,))
 
-                return [dict(row) for row in cursor.fetchall()]
+                return [CompletedOrder.dict_from_row(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"❌ Error getting order history: {e}")
             return []
 
+    def get_recent_order_items(self, phone_number: str, limit: int = 3) -> List[Dict]:
+        """Get the line items of a user's most recent completed orders, newest order first"""
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT co.order_id, co.completed_at, coi.menu_item_id, coi.quantity, coi.subtotal,
+                           COALESCE(mi.item_name_ar, 'Unknown Item') as item_name_ar,
+                           COALESCE(mi.item_name_en, 'Unknown Item') as item_name_en
+                    FROM completed_order_items coi
+                    JOIN completed_orders co ON co.order_id = coi.order_id
+                    LEFT JOIN menu_items mi ON mi.id = coi.menu_item_id
+                    WHERE coi.order_id IN (
+                        SELECT order_id FROM completed_orders
+                        WHERE phone_number = ?
+                        ORDER BY completed_at DESC
+                        LIMIT ?
+                    )
+                    ORDER BY co.completed_at DESC, coi.id
+                """, (phone_number, limit))
+
+                return [
+                    {
+                        'order_id': row[0],
+                        'completed_at': row[1],
+                        'menu_item_id': row[2],
+                        'quantity': row[3],
+                        'subtotal': row[4],
+                        'item_name_ar': row[5],
+                        'item_name_en': row[6]
+                    }
+                    for row in cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"❌ Error getting recent order items: {e}")
+            return []
+
     def cancel_order(self, phone_number: str) -> bool:
         """Cancel order for a user with thread safety"""
         try:
-            with self.get_db_connection() as conn:
+            # Write pending in-memory changes first so they can't overwrite the reset
+            self._session_writer.flush([phone_number])
+
+            def cancel(conn):
                 # Delete current order
                 conn.execute("""
                     DELETE FROM user_orders WHERE phone_number = ?
                 """, (phone_number,))
-                
+
                 # Delete order details
                 conn.execute("""
                     DELETE FROM order_details WHERE phone_number = ?
                 """, (phone_number,))
-                
+
                 # Reset session to initial state
                 conn.execute("""
                     UPDATE user_sessions 
@@ -904,11 +1226,14 @@ class ThreadSafeDatabaseManager:
                         updated_at = datetime('now')
                     WHERE phone_number = ?
                 """, (phone_number,))
-                
-                conn.commit()
-                logger.info(f"✅ Order cancelled for {phone_number}")
-                return True
-                
+
+            with session_manager.user_session_lock(phone_number), self._carts.mutation(phone_number):
+                self.execute_write(cancel)
+                self._carts.clear(phone_number)
+
+            logger.info(f"✅ Order cancelled for {phone_number}")
+            return True
+
         except Exception as e:
             logger.error(f"❌ Error cancelling order: {e}")
             return False
\ No newline at end of file
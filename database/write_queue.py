@@ -0,0 +1,225 @@
+# database/write_queue.py
+"""
+Single-writer execution of database mutations
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# A write job receives a connection inside an open transaction and must not
+# commit, roll back or begin transactions itself
+WriteJob = Callable[[sqlite3.Connection], T]
+
+
+def run_in_transaction(connection_factory: Callable, job: WriteJob) -> T:
+    """Run a write job in its own BEGIN IMMEDIATE transaction.
+
+    If the checked-out connection is already inside a transaction (a nested
+    call on the same thread), the job simply joins it.
+    """
+    with connection_factory() as conn:
+        if conn.in_transaction:
+            return job(conn)
+
+        conn.execute("BEGIN IMMEDIATE TRANSACTION")
+        try:
+            result = job(conn)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+class SingleWriter:
+    """Serializes all write jobs onto one dedicated thread and connection.
+
+    Jobs queued while a transaction is being committed are grouped: the
+    writer opens one transaction, runs up to `max_batch` jobs each inside
+    its own SAVEPOINT (so one failing job rolls back alone), commits once
+    and then resolves every job's future. Request threads never compete for
+    SQLite's write lock, and the commit fsync is shared by the whole batch.
+
+    At most `max_queue_size` jobs wait; a submitter that finds the queue
+    full waits for space within its own timeout and then gets TimeoutError.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 64,
+                 max_queue_size: int = 10000):
+        self.max_batch = max(1, int(max_batch))
+
+        self._conn = connect()
+        self._conn.isolation_level = None  # Transactions are managed explicitly below
+
+        self.max_queue_size = max(1, int(max_queue_size))
+        self._queue = deque()  # (job, future) pairs waiting for the writer
+        self._stopped = False
+        # Guards the queue; submitters waiting for space release it, so close() never waits on them
+        self._queue_lock = threading.Condition()
+
+        self._metrics = {
+            'jobs': 0,
+            'failed_jobs': 0,
+            'cancelled_jobs': 0,
+            'queue_full': 0,
+            'transactions': 0,
+            'failed_transactions': 0,
+            'max_batch': 0,
+            'last_commit_ms': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: WriteJob, timeout: float = None) -> Future:
+        """Queue a write job; the future resolves after its transaction commits.
+
+        Waits up to `timeout` seconds (None: indefinitely) for space in a full
+        queue, then raises TimeoutError.
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # A job issuing another write: run it inside the current transaction
+            self._run_job(job, future)
+            return future
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue_lock:
+            while not self._stopped and len(self._queue) >= self.max_queue_size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._metrics['queue_full'] += 1
+                    raise TimeoutError(f"Single writer queue full ({self.max_queue_size} jobs) for {timeout}s")
+                self._queue_lock.wait(remaining)
+            if self._stopped:
+                raise RuntimeError("Single writer is closed")
+            self._queue.append((job, future))
+            self._queue_lock.notify_all()
+        return future
+
+    def execute(self, job: WriteJob, timeout: float = 30.0) -> T:
+        """Run a write job and wait for its result; `timeout` covers queueing too.
+
+        On timeout a job that hasn't started is cancelled, so it never commits
+        after its caller gave up. A job already running can't be stopped mid
+        transaction: it gets up to another `timeout` to finish, after which
+        TimeoutError is raised and the job may still commit.
+        """
+        deadline = time.monotonic() + timeout
+        future = self.submit(job, timeout)
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            logger.warning(f"⚠️ Write job still running after {timeout}s; waiting for its commit")
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Write job still running after {2 * timeout}s; it may still commit") from None
+
+    def _run(self):
+        """Worker loop: drain a batch, run it in one transaction, commit, resolve"""
+        while True:
+            with self._queue_lock:
+                while not self._queue and not self._stopped:
+                    self._queue_lock.wait()
+                if not self._queue:
+                    return  # Closed and drained
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                self._queue_lock.notify_all()  # Room for submitters waiting on a full queue
+
+            self._run_batch(batch)
+
+    def _run_job(self, job: WriteJob, future: Future, savepoint: str = "write_job"):
+        """Run one job inside a savepoint; its failure only undoes its own changes"""
+        self._conn.execute(f"SAVEPOINT {savepoint}")
+        try:
+            result = job(self._conn)
+            self._conn.execute(f"RELEASE {savepoint}")
+            future.set_result(result)
+        except BaseException as e:
+            self._conn.execute(f"ROLLBACK TO {savepoint}")
+            self._conn.execute(f"RELEASE {savepoint}")
+            future.set_exception(e)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        # Callers that timed out have cancelled their jobs: skip those
+        pending = [(job, outer) for job, outer in batch if outer.set_running_or_notify_cancel()]
+        self._metrics['cancelled_jobs'] += len(batch) - len(pending)
+        batch = pending
+        if not batch:
+            return
+        inner = [(job, Future(), outer) for job, outer in batch]
+
+        try:
+            self._conn.execute("BEGIN IMMEDIATE TRANSACTION")
+            for job, future, _ in inner:
+                self._run_job(job, future)
+            self._conn.execute("COMMIT")
+        except Exception as e:
+            # The transaction itself failed: nothing in this batch was written
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            self._metrics['failed_transactions'] += 1
+            logger.error(f"❌ Write batch of {len(batch)} jobs failed: {e}")
+            for _, _, outer in inner:
+                outer.set_exception(e)
+            return
+
+        # Report results only once they are durable
+        failed = 0
+        for _, future, outer in inner:
+            error = future.exception()
+            if error is not None:
+                failed += 1
+                outer.set_exception(error)
+            else:
+                outer.set_result(future.result())
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._metrics['jobs'] += len(batch)
+        self._metrics['failed_jobs'] += failed
+        self._metrics['transactions'] += 1
+        self._metrics['max_batch'] = max(self._metrics['max_batch'], len(batch))
+        self._metrics['last_commit_ms'] = round(elapsed_ms, 2)
+
+    def close(self, timeout: float = 5.0):
+        """Finish queued jobs, stop the thread and close the writer connection"""
+        with self._queue_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue_lock.notify_all()  # Wakes the writer and submitters waiting for space
+        self._thread.join(timeout)
+
+        # Jobs the writer didn't get to (it timed out or died) fail instead of hanging their callers
+        with self._queue_lock:
+            leftover = list(self._queue)
+            self._queue.clear()
+        abandoned = 0
+        for _, future in leftover:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("Single writer is closed"))
+                abandoned += 1
+        if abandoned:
+            logger.warning(f"⚠️ Single writer closed with {abandoned} jobs still queued")
+        self._conn.close()
+        logger.info(f"✍️ Single writer stopped after {self._metrics['jobs']} jobs")
+
+    def get_stats(self) -> Dict:
+        """Get writer metrics"""
+        stats = dict(self._metrics)
+        stats.update({
+            'queued': len(self._queue),
+            'max_batch_size': self.max_batch,
+        })
+        return stats
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test the write-through cart cache: loads racing a mutation are not cached,
+order lifecycle calls evict or clear the cached cart, and cached totals
+match order_details
+"""
+
+import logging
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.cart_cache import Cart, CartCache, DEFAULT_DETAILS
+from database.models import CartItem
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+from utils.thread_safe_session import session_manager
+
+PHONE = '9647000000013'
+
+
+def line(row_id, quantity=1, price=1000):
+    return CartItem(row_id, PHONE, row_id, quantity, quantity * price, None,
+                    '2024-01-01 12:00:00', 'عنصر', 'Item', price, 'piece')
+
+
+def stored(db, phone_number):
+    """The cart as SQLite has it, bypassing the cache"""
+    with db.get_db_connection() as conn:
+        order = db._read_user_order(conn, phone_number).snapshot()
+        row = conn.execute("SELECT total_amount FROM order_details WHERE phone_number = ?",
+                           (phone_number,)).fetchone()
+    return order, row[0] if row else 0
+
+
+def test_load_racing_a_mutation_is_not_cached():
+    cache = CartCache()
+    rows = [line(1)]
+
+    def stale_load():
+        snapshot = list(rows)
+        # A write commits and patches the cache while this load is running
+        with cache.mutation(PHONE):
+            rows.append(line(2))
+            cache.add_item(PHONE, rows[-1])
+        return Cart(snapshot, DEFAULT_DETAILS)
+
+    assert len(cache.get(PHONE, stale_load)['items']) == 1  # The caller still gets its own read
+    assert cache.get_total(PHONE) is None, "Load that predates a mutation was cached"
+    assert [item['id'] for item in cache.get(PHONE, lambda: Cart(rows, DEFAULT_DETAILS))['items']] == [1, 2]
+
+    # A load started while a mutation is in flight isn't cached either
+    with cache.mutation(PHONE):
+        cache.evict(PHONE)
+        cache.get(PHONE, lambda: Cart(rows, DEFAULT_DETAILS))
+        rows.append(line(3))
+    assert cache.get_total(PHONE) is None
+
+    # A failed write forgets the cart instead of trusting an unknown outcome
+    cache.get(PHONE, lambda: Cart(rows, DEFAULT_DETAILS))
+    try:
+        with cache.mutation(PHONE):
+            raise RuntimeError("write failed")
+    except RuntimeError:
+        pass
+    assert cache.get_total(PHONE) is None
+
+
+def test_order_lifecycle_clears_cached_cart():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ThreadSafeDatabaseManager(os.path.join(tmp, 'carts.db'))
+        try:
+            db.create_or_update_session(PHONE, 'waiting_for_item', 'arabic')
+            assert db.add_items_to_order(PHONE, [(1, 2), (2, 1)]) == 2
+            assert db.get_user_order(PHONE)['items'] and db._carts.get_total(PHONE) is not None
+
+            assert db.cancel_order(PHONE)
+            assert db.get_user_order(PHONE)['items'] == [] and db.get_order_total(PHONE) == 0
+            assert stored(db, PHONE)[0]['items'] == []
+
+            assert db.add_items_to_order(PHONE, [(3, 1)]) == 1
+            db.get_user_order(PHONE)
+            assert db.complete_order(PHONE)
+            assert db._carts.get_total(PHONE) is None, "Completed cart still cached"
+            assert db.get_user_order(PHONE)['items'] == []
+
+            assert db.add_items_to_order(PHONE, [(1, 1)]) == 1
+            db.get_user_order(PHONE)
+            assert db.delete_session(PHONE)
+            assert db._carts.get_total(PHONE) is None, "Deleted user's cart still cached"
+            assert db.get_user_order(PHONE)['items'] == []
+        finally:
+            session_manager.delete_user_state(PHONE)
+            db.close()
+
+
+def test_cached_total_matches_order_details():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ThreadSafeDatabaseManager(os.path.join(tmp, 'carts.db'))
+        try:
+            db.create_or_update_session(PHONE, 'waiting_for_item', 'arabic')
+            db.get_user_order(PHONE)  # Cache the empty cart so every change below is a patch
+            steps = [
+                lambda: db.add_items_to_order(PHONE, [(1, 2), (2, 1, 1000), (3, 4)]),
+                lambda: db.update_item_quantity(PHONE, 1, 5),
+                lambda: db.remove_item_from_order(PHONE, 2),
+                lambda: db.add_item_to_order(PHONE, 4, 1),
+                lambda: db.remove_last_item_from_order(PHONE),
+                lambda: db.update_order_details(PHONE, service_type='delivery'),
+            ]
+            for step in steps:
+                assert step()
+                cached = db.get_user_order(PHONE)
+                order, total_amount = stored(db, PHONE)
+                assert cached['total'] == total_amount == order['total'], (cached['total'], total_amount)
+                assert cached['items'] == order['items']
+                assert cached['details'] == order['details']
+            assert db.get_database_stats()['cart_cache']['misses'] == 1
+        finally:
+            session_manager.delete_user_state(PHONE)
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing cart cache")
+    print("=" * 50)
+    test_load_racing_a_mutation_is_not_cached()
+    test_order_lifecycle_clears_cached_cart()
+    test_cached_total_matches_order_details()
+    print("\n✅ Cached carts stay in step with SQLite")
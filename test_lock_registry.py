@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Churn test for the per-user lock registry: millions of distinct phone
+numbers cycle through user_session_lock and no lock may outlive its users
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.lock_registry import UserLockRegistry
+from utils.thread_safe_session import ThreadSafeSessionManager
+
+CHURN_NUMBERS = int(os.getenv('LOCK_CHURN_NUMBERS', '1000000'))
+THREADS = 4
+HOT_USERS = 8  # Numbers every thread keeps coming back to, so locks are contended
+
+
+def test_locks_are_dropped_under_churn():
+    manager = ThreadSafeSessionManager()
+    counters = {phone: 0 for phone in (f"9647900000{n:02d}" for n in range(HOT_USERS))}
+    peak = [0]
+
+    def worker(index):
+        hot = list(counters)
+        for n in range(index, CHURN_NUMBERS, THREADS):
+            with manager.user_session_lock(f"964{n:010d}"):
+                pass
+            if n % 1000 < THREADS:
+                # Unsynchronized read-modify-write: only correct if the user lock excludes
+                phone_number = hot[n % HOT_USERS]
+                with manager.user_session_lock(phone_number):
+                    with manager.user_session_lock(phone_number):  # Reentrant
+                        value = counters[phone_number]
+                        time.sleep(0)
+                        counters[phone_number] = value + 1
+                peak[0] = max(peak[0], manager.get_session_stats()['user_locks_count'])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = manager.get_session_stats()
+    print(f"🔁 {CHURN_NUMBERS:,} numbers in {elapsed:.1f}s, peak live locks {peak[0]}, "
+          f"created {stats['user_locks_created']:,}")
+
+    assert stats['user_locks_count'] == 0, f"{stats['user_locks_count']} locks leaked"
+    assert peak[0] <= 2 * THREADS, f"Live locks grew to {peak[0]}"
+    expected = sum(1 for n in range(CHURN_NUMBERS) if n % 1000 < THREADS)
+    assert sum(counters.values()) == expected, "User lock did not exclude concurrent holders"
+
+
+def test_timeout_and_waiters_keep_lock_alive():
+    registry = UserLockRegistry()
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with registry.hold('964700'):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+    lock = registry.get('964700')
+    assert lock is not None and len(registry) == 1
+
+    try:
+        with registry.hold('964700', timeout=0.05):
+            raise AssertionError("Lock should be held by another thread")
+    except TimeoutError:
+        pass
+    assert registry.get('964700') is lock, "A timed-out waiter must not replace the held lock"
+
+    release.set()
+    thread.join()
+    assert len(registry) == 0 and registry.get('964700') is None
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing per-user lock registry")
+    print("=" * 50)
+    test_timeout_and_waiters_keep_lock_alive()
+    test_locks_are_dropped_under_churn()
+    print("\n✅ No per-user locks leaked")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test conversation log retention: expired rows are archived in bounded
+chunks, trimmed from the table and readable from the archive exactly once
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from collections import Counter
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+
+EXPIRED = 2350
+RECENT = 50
+
+
+def make_db(tmp, **archive_config):
+    """Manager with a split log file holding EXPIRED old and RECENT new rows"""
+    config = {'archive_dir': os.path.join(tmp, 'archive'), 'retention_days': 30,
+              'batch_size': 100, 'batch_pause_ms': 0, 'chunk_batches': 5}
+    config.update(archive_config)
+    db = ThreadSafeDatabaseManager(os.path.join(tmp, 'main.db'), log_db_path=os.path.join(tmp, 'log.db'),
+                                   log_archive_config=config)
+
+    def insert(conn):
+        conn.executemany("""
+            INSERT INTO conversation_log (phone_number, message_type, content, timestamp)
+            VALUES (?, 'user', ?, ?)
+        """, [(f"96477{n % 9}", f"old {n}", f"2020-01-{n % 28 + 1:02d} 12:00:00") for n in range(EXPIRED)])
+        conn.executemany("""
+            INSERT INTO conversation_log (phone_number, message_type, content, timestamp)
+            VALUES (?, 'user', ?, datetime('now'))
+        """, [(f"96477{n % 9}", f"new {n}") for n in range(RECENT)])
+
+    db.execute_log_write(insert)
+    return db
+
+
+def remaining(db):
+    with db.get_log_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT content FROM conversation_log")]
+
+
+def test_pass_archives_every_row_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp, max_batches=None)
+        try:
+            assert db.archive_conversation_log() == EXPIRED
+            assert sorted(remaining(db)) == sorted(f"new {n}" for n in range(RECENT)), "Table not trimmed"
+
+            archived = Counter(record['content'] for record in db.iter_archived_conversation_log())
+            assert set(archived) == {f"old {n}" for n in range(EXPIRED)}
+            assert max(archived.values()) == 1, "Row archived more than once"
+
+            stats = db.get_database_stats()['conversation_log_archive']
+            assert stats['chunks'] == 5  # 24 batches of 100 in chunks of 5
+            assert db.archive_conversation_log() == 0
+        finally:
+            db.close()
+
+
+def test_max_batches_bounds_a_pass():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp, max_batches=7)
+        try:
+            assert db.archive_conversation_log() == 700
+            assert len(remaining(db)) == EXPIRED + RECENT - 700
+
+            while db.archive_conversation_log():
+                pass
+            archived = Counter(record['content'] for record in db.iter_archived_conversation_log())
+            assert len(archived) == EXPIRED and max(archived.values()) == 1
+            assert len(remaining(db)) == RECENT
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing conversation log archiving")
+    print("=" * 50)
+    test_pass_archives_every_row_once()
+    test_max_batches_bounds_a_pass()
+    print("\n✅ Expired rows are archived exactly once")
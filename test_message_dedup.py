@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test the bounded message deduplication store
+"""
+
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.message_dedup import MessageDeduplicator
+from utils.thread_safe_session import ThreadSafeSessionManager
+
+
+def test_duplicates_expire_and_store_is_bounded():
+    dedup = MessageDeduplicator(ttl=0.05, max_entries=1000)
+    assert not dedup.seen('964700:wamid.1')
+    assert dedup.seen('964700:wamid.1'), "Retry inside the window must be a duplicate"
+    assert not dedup.seen('964701:wamid.1'), "Same message ID from another user is new"
+
+    time.sleep(0.06)
+    assert not dedup.seen('964700:wamid.1'), "Entry should expire after the TTL"
+    assert len(dedup) == 1
+
+    for n in range(5000):
+        dedup.seen(f"964702:wamid.{n}")
+    stats = dedup.get_stats()
+    assert stats['entries'] == 1000
+    assert stats['evicted'] == 4001
+    assert stats['hits'] == 1 and stats['misses'] == 5003
+    assert dedup.seen('964702:wamid.4999') and not dedup.seen('964702:wamid.0')
+
+
+def test_session_manager_dedup_is_constant_time():
+    manager = ThreadSafeSessionManager(dedup_max_entries=50_000)
+
+    def per_message_us(count):
+        start = time.perf_counter()
+        for n in range(count):
+            manager.is_message_duplicate(f"9647{n % 500:06d}", f"wamid.{count}.{n}")
+        return (time.perf_counter() - start) / count * 1e6
+
+    small = per_message_us(2_000)
+    large = per_message_us(200_000)  # Store stays full: every message expires or evicts one
+    print(f"📨 {small:.2f}µs per message with a small store, {large:.2f}µs with a full one")
+
+    stats = manager.get_session_stats()['message_dedup']
+    assert stats['entries'] == 50_000
+    assert large < small * 5, "Dedup cost grew with the number of remembered messages"
+    assert manager.is_message_duplicate("9647000499", "wamid.200000.199999")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing message deduplication")
+    print("=" * 50)
+    test_duplicates_expire_and_store_is_bounded()
+    test_session_manager_dedup_is_constant_time()
+    print("\n✅ Message deduplication works")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test the trigger-maintained cart totals in order_details and the
+verify_order_totals drift repair
+"""
+
+import logging
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+from utils.thread_safe_session import session_manager
+
+PHONES = ['9647000000161', '9647000000162']
+
+
+def totals(db):
+    """phone -> ((total_amount, item_count) from triggers, recomputed from user_orders)"""
+    with db.get_db_connection() as conn:
+        stored = {row[0]: (row[1], row[2]) for row in conn.execute(
+            "SELECT phone_number, total_amount, item_count FROM order_details")}
+        actual = {row[0]: (row[1], row[2]) for row in conn.execute(
+            "SELECT phone_number, SUM(subtotal), COUNT(*) FROM user_orders GROUP BY phone_number")}
+    return {phone: (stored.get(phone, (0, 0)), actual.get(phone, (0, 0))) for phone in PHONES}
+
+
+def make_db(tmp):
+    db = ThreadSafeDatabaseManager(os.path.join(tmp, 'totals.db'))
+    for phone_number in PHONES:
+        db.create_or_update_session(phone_number, 'waiting_for_item', 'arabic')
+    return db
+
+
+def test_triggers_track_cart_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        try:
+            first, second = PHONES
+            steps = [
+                ('add', lambda: db.add_items_to_order(first, [(1, 2), (2, 1, 1000), (3, 3)])),
+                ('add other user', lambda: db.add_items_to_order(second, [(1, 1), (4, 2)])),
+                ('update quantity', lambda: db.update_item_quantity(first, 1, 5)),
+                ('remove last', lambda: db.remove_last_item_from_order(first)),
+                ('remove item', lambda: db.remove_item_from_order(first, 2)),
+                ('remove item', lambda: db.remove_item_from_order(second, 4)),
+                ('remove last', lambda: db.remove_last_item_from_order(second)),
+            ]
+            for name, step in steps:
+                assert step(), f"{name} failed"
+                for phone_number, (stored, actual) in totals(db).items():
+                    assert stored == actual, f"After {name}: {phone_number} stored {stored}, actual {actual}"
+
+            assert totals(db)[first][0] == (5 * 3000, 1)
+            assert totals(db)[second][0] == (0, 0)
+            assert db.verify_order_totals(repair=False) == []
+        finally:
+            for phone_number in PHONES:
+                session_manager.delete_user_state(phone_number)
+            db.close()
+
+
+def test_verify_repairs_drifted_totals():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        try:
+            first, second = PHONES
+            db.add_items_to_order(first, [(1, 2), (3, 1)])
+            db.add_items_to_order(second, [(2, 1)])
+            expected = totals(db)
+            db.get_order_total(first)  # Cache the correct total before the corruption
+
+            def corrupt(conn):
+                conn.execute("UPDATE order_details SET total_amount = total_amount + 777, item_count = 9 "
+                             "WHERE phone_number = ?", (first,))
+                conn.execute("DELETE FROM order_details WHERE phone_number = ?", (second,))
+            db.execute_write(corrupt)
+
+            found = db.verify_order_totals(repair=False)
+            assert sorted(entry['phone_number'] for entry in found) == PHONES
+            assert totals(db)[second][0] == (0, 0), "Check without repair changed totals"
+
+            repaired = {entry['phone_number']: entry for entry in db.verify_order_totals()}
+            assert repaired[first]['stored_item_count'] == 9 and repaired[first]['item_count'] == 2
+            assert repaired[second]['stored_total'] is None  # order_details row was missing
+            assert totals(db) == expected
+            assert db.verify_order_totals() == []
+            assert db.get_order_total(first) == expected[first][1][0]
+        finally:
+            for phone_number in PHONES:
+                session_manager.delete_user_state(phone_number)
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing order totals triggers")
+    print("=" * 50)
+    test_triggers_track_cart_changes()
+    test_verify_repairs_drifted_totals()
+    print("\n✅ Stored totals match user_orders")
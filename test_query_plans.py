@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test script that checks every SQL query in the database/ package
+with EXPLAIN QUERY PLAN and fails on full table scans
+"""
+
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+
+DATABASE_PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database')
+
+SQL_STATEMENT = re.compile(r'^(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\s')
+
+# Sample values for the placeholders inside f-string queries
+FSTRING_SAMPLES = {
+    'field_name': 'current_step',
+    "', '.join(update_fields)": 'service_type = ?',
+    "', '.join(updates)": 'service_type = ?',
+    'placeholders': '?, ?',
+    'table': 'user_orders',
+}
+
+# Queries that intentionally read a whole table, with the reason why
+ALLOWED_FULL_SCANS = {
+    'SELECT COUNT(*) FROM main_categories': 'one-off seed check at startup on a tiny table',
+    'SELECT id as category_id, name_ar as category_name_ar': 'a handful of main categories',
+    'SELECT id, name_ar, name_en, display_order, available FROM main_categories': 'a handful of main categories',
+    'SELECT id, main_category_id, name_ar, name_en, display_order, available FROM sub_categories':
+        'menu catalog loads the whole menu once per refresh',
+    'SELECT id, sub_category_id, main_category_id, item_name_ar': 'menu catalog loads the whole menu once per refresh',
+    'SELECT * FROM menu_items': 'one-off copy when migrating the old schema',
+    'SELECT * FROM user_sessions': 'one-off copy when migrating the old schema',
+    'SELECT name, value FROM db_counters': 'a handful of counter rows',
+    'SELECT COALESCE(SUM(total_amount), 0) FROM completed_orders':
+        'counter seed and drift repair, on a read snapshot',
+    'SELECT 1 FROM sqlite_master': 'schema catalog lookup once per maintenance run',
+    'SELECT co.order_id, co.items_json FROM completed_orders co': 'one-off migration backfill',
+    "SELECT co.order_id, CAST(strftime('%s', co.completed_at)": 'one-off migration backfill',
+    'SELECT phones.phone_number, od.total_amount': 'periodic cart totals audit reads every cart',
+    'SELECT id, phone_number, message_type, content, ai_response, current_step, timestamp FROM conversation_log ORDER BY id':
+        'startup move of rows logged before the log file was split out, in rowid order',
+}
+
+# Queries written against another schema on purpose, with the reason why
+SCHEMA_PROBES = {
+    'SELECT category_id FROM menu_items': 'detects the pre-migration schema',
+}
+
+FULL_SCAN = re.compile(r'^SCAN \S+$')
+
+
+class _QueryCollector(ast.NodeVisitor):
+    """Collect SQL statements written as string literals, f-strings or str.format calls"""
+
+    def __init__(self, source):
+        self.source = source
+        self.queries = []
+
+    def _add(self, text, lineno):
+        sql = ' '.join(text.split())
+        if SQL_STATEMENT.match(sql):
+            self.queries.append((lineno, sql))
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str):
+            self._add(node.value, node.lineno)
+
+    def visit_JoinedStr(self, node):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                expression = ast.unparse(value.value)
+                if expression not in FSTRING_SAMPLES:
+                    # Only matters if this f-string is SQL; checked below
+                    parts.append('{' + expression + '}')
+                else:
+                    parts.append(FSTRING_SAMPLES[expression])
+        text = ''.join(parts)
+        if SQL_STATEMENT.match(' '.join(text.split())):
+            assert '{' not in text, f"{self.source}:{node.lineno}: add a sample for the f-string placeholder in: {text}"
+        self._add(text, node.lineno)
+
+    def visit_Call(self, node):
+        # "...".format(x) - fill every {} with a sample number
+        if (isinstance(node.func, ast.Attribute) and node.func.attr == 'format'
+                and isinstance(node.func.value, ast.Constant) and isinstance(node.func.value.value, str)):
+            self._add(node.func.value.value.replace('{}', '7'), node.lineno)
+            for arg in node.args:
+                self.visit(arg)
+            return
+        self.generic_visit(node)
+
+
+def collect_queries():
+    """Parse every module of the database package and return (location, sql) pairs"""
+    queries = []
+    for name in sorted(os.listdir(DATABASE_PACKAGE)):
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(DATABASE_PACKAGE, name), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        collector = _QueryCollector(name)
+        collector.visit(tree)
+        queries.extend((f"{name}:{lineno}", sql) for lineno, sql in collector.queries)
+    return queries
+
+
+def test_no_full_table_scans():
+    """Every query in the database package must be served by an index"""
+
+    print("🧪 Checking query plans in database/")
+    print("=" * 50)
+
+    queries = collect_queries()
+    assert queries, "No SQL queries found in database/"
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'query_plans.db')
+    db = ThreadSafeDatabaseManager(db_path)
+
+    offenders = []
+    try:
+        with db.get_db_connection() as conn:
+            for location, sql in queries:
+                params = (None,) * sql.count('?')
+                try:
+                    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+                except sqlite3.Error as e:
+                    probe = next((reason for prefix, reason in SCHEMA_PROBES.items()
+                                  if sql.startswith(prefix)), None)
+                    if probe:
+                        print(f"⚪ schema probe ({probe}) {location}: {sql[:90]}")
+                    else:
+                        print(f"❌ {location}: {sql[:90]}\n      {e}")
+                        offenders.append((location, sql, [str(e)]))
+                    continue
+                scans = [row[3] for row in plan if FULL_SCAN.match(row[3])]
+
+                allowed = next((reason for prefix, reason in ALLOWED_FULL_SCANS.items()
+                                if sql.startswith(prefix)), None)
+                status = '✅'
+                if scans and allowed:
+                    status = f'⚪ allowed ({allowed})'
+                elif scans:
+                    status = '❌'
+                    offenders.append((location, sql, scans))
+
+                print(f"{status} {location}: {sql[:90]}")
+                for row in plan:
+                    print(f"      {row[3]}")
+    finally:
+        db.close()
+
+    for location, sql, scans in offenders:
+        print(f"\n❌ Full table scan or invalid query at {location}: {scans}\n   {sql}")
+
+    assert not offenders, f"{len(offenders)} queries do a full table scan or do not compile"
+
+
+if __name__ == "__main__":
+    test_no_full_table_scans()
+    print("\n✅ All queries use indexes")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the bounded session cache: LRU eviction, dirty sessions persisted
+before they are evicted or expire, and evicted users reloaded from SQLite
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+from utils.thread_safe_session import ThreadSafeSessionManager, session_manager
+
+
+def test_lru_eviction_skips_users_in_use():
+    manager = ThreadSafeSessionManager(stripes=4, max_sessions=40)
+    with manager.user_session_lock('964700000000'):
+        manager.create_or_update_user_state('964700000000', current_step='waiting_for_item')
+        for n in range(1, 500):
+            manager.create_or_update_user_state(f"9647{n:08d}")
+        assert manager.get_user_state('964700000000') is not None, "Locked user was evicted"
+
+    stats = manager.get_session_stats()
+    assert stats['active_sessions'] <= 40
+    assert stats['evicted_sessions'] == 500 - stats['active_sessions']
+    assert manager.get_user_state('964700000499') is not None, "Most recent user was evicted"
+
+
+def test_dirty_sessions_persist_before_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ThreadSafeDatabaseManager(os.path.join(tmp, 'cache.db'),
+                                       session_writer_config={'flush_interval_ms': 60_000})
+        previous_limit, session_manager.max_sessions = session_manager.max_sessions, 32
+        try:
+            for n in range(300):
+                db.create_or_update_session(f"9648{n:08d}", 'waiting_for_quantity',
+                                            language='english', selected_item=n)
+
+            stats = session_manager.get_session_stats()
+            assert stats['active_sessions'] <= 32 and stats['evicted_sessions'] > 0
+
+            # Evicted before the writer's interval ever ran: must come back from SQLite
+            session = db.get_user_session('964800000007')
+            assert session['current_step'] == 'waiting_for_quantity'
+            assert session['selected_item'] == 7 and session['language_preference'] == 'english'
+        finally:
+            session_manager.max_sessions = previous_limit
+            for n in range(300):
+                session_manager.delete_user_state(f"9648{n:08d}")
+            db.close()
+
+
+def test_expired_dirty_sessions_persist_before_removal():
+    manager = ThreadSafeSessionManager(stripes=4)
+    persisted, failing = [], [True]
+
+    def handler(phone_numbers):
+        taken = manager.take_dirty_sessions(phone_numbers)
+        if failing[0]:
+            manager.mark_dirty(*(row[0] for row in taken))  # Same as a failed SessionWriter flush
+            raise RuntimeError("disk full")
+        persisted.extend(row[0] for row in taken)
+
+    manager.set_eviction_handler(handler)
+    for phone_number in ('964700000001', '964700000002', '964700000003'):
+        manager.create_or_update_user_state(phone_number, current_step='waiting_for_item')
+    manager.mark_dirty('964700000001', '964700000002')  # The third one is already saved
+    for stripe in manager._stripes:
+        for state in stripe.sessions.values():
+            state.updated_at = time.time() - manager.session_timeout - 1
+
+    # The write fails: unsaved states stay cached and dirty for the next flush
+    assert manager.get_user_state('964700000001') is None
+    assert manager.cleanup_expired_sessions() == 1  # Only the saved one
+    assert manager.dirty_session_count() == 2 and persisted == []
+
+    failing[0] = False
+    assert manager.get_user_state('964700000001') is None
+    assert persisted == ['964700000001']
+    assert manager.cleanup_expired_sessions() == 1
+    assert persisted == ['964700000001', '964700000002']
+    assert manager.get_session_stats()['active_sessions'] == 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing bounded session cache")
+    print("=" * 50)
+    test_lru_eviction_skips_users_in_use()
+    test_dirty_sessions_persist_before_eviction()
+    test_expired_dirty_sessions_persist_before_removal()
+    print("\n✅ Session cache eviction works")
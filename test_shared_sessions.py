@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test cross-process session coherence: several worker processes on one
+database update the same users and see the same message retries
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+WORKERS = 4
+USERS = ['9647700000001', '9647700000002', '9647700000003']
+ROUNDS = 60  # Per worker and user
+MESSAGES = 200  # Retried to every worker
+
+
+def _worker(db_path, shared, results):
+    logging.disable(logging.WARNING)
+    from database.thread_safe_manager import ThreadSafeDatabaseManager
+    from utils.thread_safe_session import session_manager
+
+    db = ThreadSafeDatabaseManager(db_path, pool_size=2, shared_sessions=shared)
+    try:
+        # Read-modify-write of the session under the user lock; a stale cache loses increments
+        for _ in range(ROUNDS):
+            for phone_number in USERS:
+                with session_manager.user_session_lock(phone_number):
+                    session = db.get_user_session(phone_number)
+                    count = session['selected_item'] if session else 0
+                    db.create_or_update_session(phone_number, 'waiting_for_quantity', selected_item=count + 1)
+
+        processed = sum(not session_manager.is_message_duplicate(USERS[0], f"wamid.{n}")
+                        for n in range(MESSAGES))
+        results.put(processed)
+    finally:
+        db.close()
+
+
+def _dying_worker(db_path, phone_number):
+    """Change a user and exit while still holding their lease"""
+    logging.disable(logging.WARNING)
+    from database.thread_safe_manager import ThreadSafeDatabaseManager
+    from utils.thread_safe_session import session_manager
+
+    db = ThreadSafeDatabaseManager(db_path, pool_size=2, shared_sessions=True,
+                                   shared_session_config={'lease_ttl': 1.0})
+    with session_manager.user_session_lock(phone_number):
+        db.create_or_update_session(phone_number, 'waiting_for_confirmation', selected_item=99)
+        db.flush_sessions([phone_number])
+        os._exit(1)
+
+
+def run_workers(shared):
+    """Final counters and messages processed across all workers"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'shared.db')
+
+        from database.thread_safe_manager import ThreadSafeDatabaseManager
+        ThreadSafeDatabaseManager(db_path).close()  # Create the schema once
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [context.Process(target=_worker, args=(db_path, shared, results)) for _ in range(WORKERS)]
+        for worker in workers:
+            worker.start()
+        processed = sum(results.get(timeout=120) for _ in workers)
+        for worker in workers:
+            worker.join(30)
+            assert worker.exitcode == 0, f"Worker exited with {worker.exitcode}"
+
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        counts = dict(conn.execute("SELECT phone_number, selected_item FROM user_sessions"))
+        conn.close()
+        return counts, processed
+
+
+def test_workers_share_sessions_and_dedup():
+    counts, processed = run_workers(shared=True)
+    print(f"🔁 shared sessions: counters {counts}, {processed} of {MESSAGES} messages processed")
+    assert counts == {phone_number: WORKERS * ROUNDS for phone_number in USERS}, "Lost updates across workers"
+    assert processed == MESSAGES, "A retried message was processed by more than one worker"
+
+
+def test_takeover_after_worker_dies_invalidates_cache():
+    from database.thread_safe_manager import ThreadSafeDatabaseManager
+    from utils.thread_safe_session import session_manager
+
+    phone_number = '9647700000009'
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'crash.db')
+        db = ThreadSafeDatabaseManager(db_path, shared_sessions=True, shared_session_config={'lease_ttl': 1.0})
+        try:
+            # Cache the user here, then let another worker change them and die mid-message
+            with session_manager.user_session_lock(phone_number):
+                db.create_or_update_session(phone_number, 'waiting_for_quantity', selected_item=1)
+
+            worker = multiprocessing.get_context('spawn').Process(target=_dying_worker, args=(db_path, phone_number))
+            worker.start()
+            worker.join(60)
+            assert worker.exitcode == 1
+
+            with session_manager.user_session_lock(phone_number):  # Waits out the dead worker's lease
+                session = db.get_user_session(phone_number)
+            stats = db.get_database_stats()['session_leases']
+            print(f"💀 after takeover: step {session['current_step']}, item {session['selected_item']}, "
+                  f"takeovers {stats['takeovers']}")
+            assert stats['takeovers'] == 1
+            assert session['selected_item'] == 99, "Stale cached session served after taking over a dead worker's lease"
+        finally:
+            session_manager.delete_user_state(phone_number)
+            db.close()
+
+
+def test_held_lease_is_renewed():
+    from database.session_leases import SessionLeases
+    from database.thread_safe_manager import ThreadSafeDatabaseManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ThreadSafeDatabaseManager(os.path.join(tmp, 'renew.db'))
+        first = SessionLeases(db.execute_write, lambda phone_number: None, lease_ttl=0.3)
+        second = SessionLeases(db.execute_write, lambda phone_number: None, lease_ttl=0.3)
+        try:
+            first.acquire('9647700000010')
+            time.sleep(1.0)  # Several ttls: only renewal keeps the lease
+            try:
+                second.acquire('9647700000010', timeout=0.2)
+                raise AssertionError("Lease held past its ttl was taken over")
+            except TimeoutError:
+                pass
+            assert first.get_stats()['renewals'] >= 2
+
+            first.release('9647700000010')
+            second.acquire('9647700000010', timeout=1.0)
+            second.release('9647700000010')
+            assert second.get_stats()['takeovers'] == 0
+        finally:
+            first.close()
+            second.close()
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing cross-process session coherence")
+    print("=" * 50)
+    counts, processed = run_workers(shared=False)
+    print(f"⚪ process-local sessions: counters {counts}, {processed} of {MESSAGES} messages processed")
+    test_workers_share_sessions_and_dedup()
+    test_takeover_after_worker_dies_invalidates_cache()
+    test_held_lease_is_renewed()
+    print("\n✅ Workers stay coherent")
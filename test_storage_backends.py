@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script that runs the same cart/order scenario against the SQLite and
+in-memory storage backends and checks that they return the same results
+"""
+
+import logging
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.memory_storage import InMemoryStorage
+from database.storage import StorageBackend
+from database.thread_safe_manager import ThreadSafeDatabaseManager
+from utils.thread_safe_session import session_manager
+
+PHONE = '9647000000001'
+
+
+def run_scenario(db: StorageBackend) -> dict:
+    """Drive one backend through a full order and collect what it returns"""
+    session_manager.delete_user_state(PHONE)
+    results = {}
+
+    assert db.create_or_update_session(PHONE, 'waiting_for_category', 'arabic')
+    results['session_step'] = db.get_user_session(PHONE)['current_step']
+    results['empty_cart_order'] = db.complete_order(PHONE)
+
+    results['categories'] = [c['id'] for c in db.get_main_categories()]
+    results['sub_categories'] = [s['id'] for s in db.get_sub_categories(1)]
+    results['items'] = [i['id'] for i in db.get_sub_category_items(1)]
+
+    results['added'] = db.add_items_to_order(PHONE, [(1, 2), (2, 1, 1000, 'no ice'), (9999, 1)])
+    assert db.add_item_to_order(PHONE, 3, 1)
+    assert db.update_item_quantity(PHONE, 1, 3)
+    assert db.remove_last_item_from_order(PHONE)
+    assert db.update_order_details(PHONE, service_type='delivery', location='Table 4')
+
+    order = db.get_user_order(PHONE)
+    results['cart'] = [(i['menu_item_id'], i['quantity'], i['subtotal'], i['special_requests'])
+                       for i in order['items']]
+    results['total'] = order['total']
+    results['order_total'] = db.get_order_total(PHONE)
+    results['details'] = {k: order['details'][k] for k in ('service_type', 'location', 'item_count')}
+
+    order_id = db.complete_order(PHONE)
+    results['order_id_format'] = (order_id[:3], len(order_id))
+    results['order_sequence'] = order_id[-4:]  # The empty cart above must not use up a number
+    results['cart_after'] = db.get_user_order(PHONE)['items']
+    results['session_after'] = db.get_user_session(PHONE) is None
+
+    history = db.get_order_history(PHONE)
+    results['history'] = [(o['order_id'] == order_id, o['total_amount'], o['service_type']) for o in history]
+    results['recent_items'] = [(i['menu_item_id'], i['quantity']) for i in db.get_recent_order_items(PHONE)]
+    results['popular'] = [i['id'] for i in db.get_popular_items(2)]
+
+    assert db.delete_menu_item(2)
+    results['popular_after_delete'] = [i['id'] for i in db.get_popular_items(2)]
+    results['deleted_item'] = db.get_item_by_id(2)
+    return results
+
+
+def test_backends_agree():
+    db_path = os.path.join(tempfile.mkdtemp(), 'storage_backends.db')
+    sqlite_db = ThreadSafeDatabaseManager(db_path)
+    try:
+        expected = run_scenario(sqlite_db)
+    finally:
+        sqlite_db.close()
+    actual = run_scenario(InMemoryStorage())
+
+    for key, value in expected.items():
+        print(f"{'✅' if actual[key] == value else '❌'} {key}: {value}")
+    assert actual == expected, f"In-memory backend differs: {actual}"
+    assert expected['total'] == 3 * 3000 + 1000
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Comparing SQLite and in-memory storage backends")
+    print("=" * 50)
+    test_backends_agree()
+    print("\n✅ Both backends return the same results")
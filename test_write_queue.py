@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test the single-writer queue: batching, nested writes, cancellation on
+timeout, a full queue and shutdown
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.write_queue import SingleWriter
+
+
+def make_writer(tmp, **config):
+    path = os.path.join(tmp, 'writer.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS t (value INTEGER)")
+    writer = SingleWriter(lambda: sqlite3.connect(path, check_same_thread=False), **config)
+    return writer, path
+
+
+def values(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM t"))
+
+
+def insert(value):
+    return lambda conn: conn.execute("INSERT INTO t (value) VALUES (?)", (value,)).rowcount
+
+
+def block(writer):
+    """Occupy the writer thread until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def job(conn):
+        started.set()
+        release.wait(10)
+
+    writer.submit(job)
+    assert started.wait(5)
+    return release
+
+
+def test_jobs_queued_during_a_commit_share_one_transaction():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, path = make_writer(tmp)
+        try:
+            release = block(writer)
+            futures = [writer.submit(insert(n)) for n in range(10)]
+            release.set()
+            assert [future.result(5) for future in futures] == [1] * 10
+
+            stats = writer.get_stats()
+            assert stats['transactions'] == 2 and stats['max_batch'] == 10
+            assert values(path) == list(range(10))
+        finally:
+            writer.close()
+
+
+def test_failing_and_nested_jobs():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, path = make_writer(tmp)
+        try:
+            def fails(conn):
+                conn.execute("INSERT INTO t (value) VALUES (100)")
+                raise ValueError("job failed")
+
+            def nested(conn):
+                conn.execute("INSERT INTO t (value) VALUES (1)")
+                # A write issued from inside a job joins the current transaction
+                assert writer.execute(insert(2)) == 1
+                try:
+                    writer.execute(fails)
+                except ValueError:
+                    pass
+                return 'done'
+
+            assert writer.execute(nested) == 'done'
+            try:
+                writer.execute(fails)
+                raise AssertionError("Job error was not raised")
+            except ValueError:
+                pass
+            assert values(path) == [1, 2], "A failed job's changes were committed"
+        finally:
+            writer.close()
+
+
+def test_timed_out_job_is_cancelled():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, path = make_writer(tmp)
+        try:
+            release = block(writer)
+            try:
+                writer.execute(insert(1), timeout=0.2)
+                raise AssertionError("execute did not time out")
+            except TimeoutError:
+                pass
+            release.set()
+            writer.execute(insert(2))
+            assert values(path) == [2], "Job committed after its caller gave up"
+            assert writer.get_stats()['cancelled_jobs'] == 1
+        finally:
+            writer.close()
+
+
+def test_full_queue_respects_timeout_and_close():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, path = make_writer(tmp, max_queue_size=2)
+        release = block(writer)
+        try:
+            queued = [writer.submit(insert(n)) for n in range(2)]
+
+            start = time.monotonic()
+            try:
+                writer.execute(insert(99), timeout=0.2)
+                raise AssertionError("Submit into a full queue did not time out")
+            except TimeoutError as e:
+                assert 'queue full' in str(e)
+            assert time.monotonic() - start < 2
+
+            # A submitter waiting for space without a timeout must not hold up close()
+            errors = []
+
+            def waiting_submitter():
+                try:
+                    writer.submit(insert(98))
+                except RuntimeError as e:
+                    errors.append(e)
+
+            waiter = threading.Thread(target=waiting_submitter)
+            waiter.start()
+            time.sleep(0.1)
+            threading.Timer(0.3, release.set).start()  # Free the writer only once close() is waiting
+        finally:
+            writer.close()
+
+        waiter.join(5)
+        assert not waiter.is_alive() and len(errors) == 1, "Waiting submitter was not refused on close"
+        # Jobs queued before close() still commit
+        assert [future.result(0) for future in queued] == [1, 1]
+        assert values(path) == [0, 1]
+
+        try:
+            writer.submit(insert(3))
+            raise AssertionError("Submit after close was accepted")
+        except RuntimeError:
+            pass
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    print("🧪 Testing the single-writer queue")
+    print("=" * 50)
+    test_jobs_queued_during_a_commit_share_one_transaction()
+    test_failing_and_nested_jobs()
+    test_timed_out_job_is_cancelled()
+    test_full_queue_respects_timeout_and_close()
+    print("\n✅ Single writer batches, cancels and shuts down cleanly")
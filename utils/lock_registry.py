@@ -0,0 +1,90 @@
+# utils/lock_registry.py
+"""
+Reference-counted registry of per-user locks
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class _LockEntry:
+    """A user's lock and the number of threads holding or waiting on it"""
+
+    __slots__ = ('lock', 'refs')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.refs = 0
+
+
+class _LockStripe:
+    __slots__ = ('mutex', 'entries', 'created')
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.entries: Dict[str, _LockEntry] = {}
+        self.created = 0
+
+
+class UserLockRegistry:
+    """Per-key RLocks that only exist while somebody holds or waits on them.
+
+    A thread registers interest (refs + 1) before acquiring a key's lock and
+    drops it after releasing or timing out; the entry is removed when the
+    count reaches zero, so the registry holds one entry per *active* user
+    instead of one per user ever seen. Registration locks only the key's
+    stripe, never a global lock.
+    """
+
+    def __init__(self, stripes: int = 16):
+        self._stripes = tuple(_LockStripe() for _ in range(max(1, int(stripes))))
+
+    def _stripe(self, key: str) -> _LockStripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _checkout(self, stripe: _LockStripe, key: str) -> _LockEntry:
+        with stripe.mutex:
+            entry = stripe.entries.get(key)
+            if entry is None:
+                entry = stripe.entries[key] = _LockEntry()
+                stripe.created += 1
+            entry.refs += 1
+            return entry
+
+    def _checkin(self, stripe: _LockStripe, key: str, entry: _LockEntry):
+        with stripe.mutex:
+            entry.refs -= 1
+            if not entry.refs:
+                del stripe.entries[key]
+
+    @contextmanager
+    def hold(self, key: str, timeout: float = -1):
+        """Hold `key`'s lock for the block (reentrant); TimeoutError if not acquired in time"""
+        stripe = self._stripe(key)
+        entry = self._checkout(stripe, key)
+        try:
+            if not entry.lock.acquire(timeout=timeout):
+                raise TimeoutError(f"Could not acquire lock for user {key}")
+            try:
+                yield
+            finally:
+                entry.lock.release()
+        finally:
+            self._checkin(stripe, key, entry)
+
+    def get(self, key: str) -> Optional[threading.RLock]:
+        """The lock currently registered for `key` (None when nobody holds or waits on it)"""
+        stripe = self._stripe(key)
+        with stripe.mutex:
+            entry = stripe.entries.get(key)
+            return entry.lock if entry else None
+
+    def __len__(self) -> int:
+        """Number of live locks"""
+        return sum(len(stripe.entries) for stripe in self._stripes)
+
+    def get_stats(self) -> Dict:
+        return {
+            'live_locks': len(self),
+            'created_locks': sum(stripe.created for stripe in self._stripes),
+        }
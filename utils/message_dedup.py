@@ -0,0 +1,69 @@
+# utils/message_dedup.py
+"""
+Bounded store of recently processed message IDs
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+
+
+class MessageDeduplicator:
+    """Remembers message keys for `ttl` seconds, at most `max_entries` of them.
+
+    Keys live in an OrderedDict in arrival order, so the oldest entries are
+    always at the head: expiry pops from the head until it reaches a live
+    entry, and the memory cap evicts the head. Insert, lookup and expiry are
+    amortized O(1) per message.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self._seen: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def _expire(self, now: float):
+        # Caller holds self._lock
+        cutoff = now - self.ttl
+        seen = self._seen
+        while seen:
+            key, seen_at = next(iter(seen.items()))
+            if seen_at >= cutoff:
+                break
+            del seen[key]
+            self._expired += 1
+
+    def seen(self, key: str) -> bool:
+        """True if `key` was seen within the TTL; otherwise remember it and return False"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._seen:
+                self._hits += 1
+                return True
+
+            self._misses += 1
+            self._seen[key] = now
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+                self._evicted += 1
+            return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def get_stats(self) -> Dict:
+        return {
+            'entries': len(self._seen),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self._hits,
+            'misses': self._misses,
+            'expired': self._expired,
+            'evicted': self._evicted,
+        }
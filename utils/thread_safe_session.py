@@ -2,214 +2,468 @@
 """
 Thread-safe session management to prevent user session conflicts
 """
+import json
+import math
 import threading
 import time
 import logging
-from typing import Dict, Optional, Any
-from datetime import datetime, timedelta
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Any
 from contextlib import contextmanager
 
+from utils.constants import WorkflowSteps
+from utils.lock_registry import UserLockRegistry
+from utils.message_dedup import MessageDeduplicator
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+# Workflow steps are stored as small integer codes; unknown step names get a code on first use
+_STEP_NAMES: List[str] = [
+    WorkflowSteps.WAITING_FOR_LANGUAGE, WorkflowSteps.WAITING_FOR_CATEGORY, WorkflowSteps.WAITING_FOR_ITEM,
+    WorkflowSteps.WAITING_FOR_QUANTITY, WorkflowSteps.WAITING_FOR_ADDITIONAL, WorkflowSteps.WAITING_FOR_SERVICE,
+    WorkflowSteps.WAITING_FOR_LOCATION, WorkflowSteps.WAITING_FOR_CONFIRMATION, WorkflowSteps.COMPLETED,
+]
+_STEP_CODES: Dict[str, int] = {name: code for code, name in enumerate(_STEP_NAMES)}
+_step_codes_lock = threading.Lock()
+
+
+def step_code(step: str) -> int:
+    """Integer code for a workflow step name"""
+    code = _STEP_CODES.get(step)
+    if code is None:
+        with _step_codes_lock:
+            code = _STEP_CODES.get(step)
+            if code is None:
+                _STEP_NAMES.append(step)
+                code = _STEP_CODES[step] = len(_STEP_NAMES) - 1
+    return code
+
+
 class UserWorkflowState:
-    """Isolated workflow state for each user"""
-    phone_number: str
-    current_step: str = 'waiting_for_language'
-    language_preference: Optional[str] = None
-    customer_name: Optional[str] = None
-    selected_main_category: Optional[int] = None
-    selected_sub_category: Optional[int] = None
-    selected_item: Optional[int] = None
-    order_mode: Optional[str] = None  # 'quick' or 'explore'
-    quick_order_item: Optional[str] = None  # JSON string to store item data
-    conversation_context: Dict = field(default_factory=dict)
-    created_at: datetime = field(default_factory=datetime.now)
-    updated_at: datetime = field(default_factory=datetime.now)
-    processing: bool = False  # Flag to prevent concurrent processing
-    last_message_id: Optional[str] = None  # Prevent duplicate processing
+    """Isolated workflow state for each user.
+
+    A slotted record: the step is kept as an integer code (`current_step`
+    still reads and writes the name), timestamps are epoch seconds and the
+    conversation context dict is only allocated when it is used.
+    """
+
+    __slots__ = ('phone_number', '_step', 'language_preference', 'customer_name',
+                 'selected_main_category', 'selected_sub_category', 'selected_item',
+                 'order_mode', 'quick_order_item', '_context', 'created_at', 'updated_at',
+                 'processing', 'last_message_id')
+
+    def __init__(self, phone_number: str, current_step: str = WorkflowSteps.WAITING_FOR_LANGUAGE,
+                 language_preference: Optional[str] = None, customer_name: Optional[str] = None,
+                 selected_main_category: Optional[int] = None, selected_sub_category: Optional[int] = None,
+                 selected_item: Optional[int] = None,
+                 order_mode: Optional[str] = None,  # 'quick' or 'explore'
+                 quick_order_item: Optional[str] = None,  # JSON string to store item data
+                 conversation_context: Optional[Dict] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None,
+                 processing: bool = False,  # Flag to prevent concurrent processing
+                 last_message_id: Optional[str] = None):  # Prevent duplicate processing
+        now = time.time()
+        self.phone_number = phone_number
+        self._step = step_code(current_step)
+        self.language_preference = language_preference
+        self.customer_name = customer_name
+        self.selected_main_category = selected_main_category
+        self.selected_sub_category = selected_sub_category
+        self.selected_item = selected_item
+        self.order_mode = order_mode
+        self.quick_order_item = quick_order_item
+        self._context = conversation_context or None
+        self.created_at = now if created_at is None else created_at
+        self.updated_at = now if updated_at is None else updated_at
+        self.processing = processing
+        self.last_message_id = last_message_id
+
+    @property
+    def current_step(self) -> str:
+        return _STEP_NAMES[self._step]
+
+    @current_step.setter
+    def current_step(self, step: str):
+        self._step = step_code(step)
+
+    @property
+    def conversation_context(self) -> Dict:
+        if self._context is None:
+            self._context = {}
+        return self._context
+
+    @conversation_context.setter
+    def conversation_context(self, context: Optional[Dict]):
+        self._context = context or None
+
+    def context_json(self) -> str:
+        """Conversation context as JSON, without allocating an empty context"""
+        return json.dumps(self._context or {})
+
+    def touch(self):
+        """Record an update now"""
+        self.updated_at = time.time()
+
+    def __repr__(self) -> str:
+        return f"UserWorkflowState(phone_number={self.phone_number!r}, current_step={self.current_step!r})"
+
+
+# Least recently used states looked at per eviction beyond the ones needed
+_EVICTION_SCAN = 8
+
+
+class _SessionStripe:
+    """One shard of the session cache, with its own lock and counters"""
+
+    __slots__ = ('lock', 'sessions', 'dirty', 'processing', 'evicted')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sessions: 'OrderedDict[str, UserWorkflowState]' = OrderedDict()  # Least recently used first
+        self.dirty = set()  # Users whose in-memory state hasn't been persisted yet
+        self.processing = 0  # Cached states with processing=True
+        self.evicted = 0
 
 
 class ThreadSafeSessionManager:
-    """Thread-safe session manager with user isolation"""
+    """Thread-safe session manager with user isolation.
 
-    def __init__(self):
-        # Per-user locks to prevent concurrent processing
-        self._user_locks: Dict[str, threading.RLock] = {}
-        self._locks_lock = threading.Lock()  # Lock for the locks dict itself
+    The session cache is split into `stripes` shards keyed by phone number
+    hash, so users on different stripes never contend for a lock. Stats are
+    read from per-stripe counters rather than by scanning the cache.
+
+    The cache holds at most `max_sessions` states (0 for no limit). Each
+    stripe evicts its least recently used states once it is over its share,
+    skipping users that are locked or being processed. A dirty victim is
+    handed to the eviction handler (the session writer's flush) so it is
+    persisted before it is dropped; evicted users are reloaded from SQLite
+    on their next message.
+    """
 
-        # In-memory session cache with thread safety
-        self._session_cache: Dict[str, UserWorkflowState] = {}
-        self._cache_lock = threading.RLock()
+    def __init__(self, stripes: int = 16, dedup_ttl: float = 300, dedup_max_entries: int = 100_000,
+                 max_sessions: int = 50_000):
+        # Per-user locks to prevent concurrent processing (dropped once nobody holds or waits on them)
+        self._user_locks = UserLockRegistry(stripes)
 
-        # Message deduplication
-        self._processed_messages: Dict[str, float] = {}
-        self._message_cleanup_lock = threading.Lock()
+        # Lock-striped in-memory session cache
+        self._stripes = tuple(_SessionStripe() for _ in range(max(1, int(stripes))))
+
+        # Message deduplication (5 minute window, bounded)
+        self._processed_messages = MessageDeduplicator(ttl=dedup_ttl, max_entries=dedup_max_entries)
 
         # Session timeout in seconds
         self.session_timeout = 1800  # 30 minutes
 
-        logger.info("✅ Thread-safe session manager initialized")
-
-    def get_user_lock(self, phone_number: str) -> threading.RLock:
-        """Get or create a lock for specific user - thread safe"""
-        with self._locks_lock:
-            if phone_number not in self._user_locks:
-                self._user_locks[phone_number] = threading.RLock()
-            return self._user_locks[phone_number]
+        # Cache size limit and the callback that persists dirty sessions before eviction
+        self.max_sessions = max_sessions
+        self._eviction_handler: Optional[Callable[[List[str]], Any]] = None
+
+        # Optional cross-process coordination (database.session_leases.SessionLeases) and
+        # the users each thread holds, so only outermost holds take a lease
+        self._coordinator = None
+        self._held = threading.local()
+
+        logger.info(f"✅ Thread-safe session manager initialized ({len(self._stripes)} cache stripes)")
+
+    def _stripe(self, phone_number: str) -> _SessionStripe:
+        return self._stripes[hash(phone_number) % len(self._stripes)]
+
+    def _remove_state(self, stripe: _SessionStripe, phone_number: str) -> Optional[UserWorkflowState]:
+        # Caller holds stripe.lock
+        state = stripe.sessions.pop(phone_number, None)
+        stripe.dirty.discard(phone_number)
+        if state is not None and state.processing:
+            stripe.processing -= 1
+        return state
+
+    def set_eviction_handler(self, handler: Optional[Callable[[List[str]], Any]]):
+        """Set the callback that persists dirty sessions (by phone number) before they are evicted"""
+        self._eviction_handler = handler
+
+    def _evict(self, stripe: _SessionStripe, candidates: Iterable[str] = None) -> List[str]:
+        """Drop least recently used states while the stripe is over its share of max_sessions.
+
+        Returns the dirty victims, which must be persisted before they can go.
+        Caller holds stripe.lock.
+        """
+        if not self.max_sessions:
+            return []
+        excess = len(stripe.sessions) - math.ceil(self.max_sessions / len(self._stripes))
+        if excess <= 0:
+            return []
+
+        if candidates is None:
+            candidates = list(islice(stripe.sessions, excess + _EVICTION_SCAN))
+        unsaved = []
+        for phone_number in candidates:
+            if excess <= 0:
+                break
+            state = stripe.sessions.get(phone_number)
+            if state is None or state.processing or self._user_locks.get(phone_number) is not None:
+                continue  # Gone already, or in use
+            if phone_number in stripe.dirty and self._eviction_handler is not None:
+                unsaved.append(phone_number)
+                continue
+            self._remove_state(stripe, phone_number)
+            stripe.evicted += 1
+            excess -= 1
+        return unsaved
+
+    def _evict_unsaved(self, stripe: _SessionStripe, unsaved: List[str]):
+        """Persist dirty eviction victims, then evict the ones still over the limit"""
+        try:
+            self._eviction_handler(unsaved)
+        except Exception as e:
+            logger.error(f"❌ Error persisting {len(unsaved)} sessions before eviction: {e}")
+            return
+        with stripe.lock:
+            # Still dirty means changed again (or not written): those stay
+            self._evict(stripe, unsaved)
+
+    def _expire(self, stripe: _SessionStripe, phone_numbers: Iterable[str]) -> List[str]:
+        """Drop expired states; returns the dirty ones, which must be persisted first.
+
+        Caller holds stripe.lock.
+        """
+        unsaved = []
+        for phone_number in phone_numbers:
+            state = stripe.sessions.get(phone_number)
+            if state is None or not self._is_session_expired(state):
+                continue  # Gone already, or used again meanwhile
+            if phone_number in stripe.dirty and self._eviction_handler is not None:
+                unsaved.append(phone_number)
+                continue
+            self._remove_state(stripe, phone_number)
+        return unsaved
+
+    def _expire_unsaved(self, unsaved: List[str]) -> int:
+        """Persist dirty expired states, then drop the ones that were written; returns how many"""
+        try:
+            self._eviction_handler(unsaved)
+        except Exception as e:
+            logger.error(f"❌ Error persisting {len(unsaved)} expired sessions: {e}")
+            return 0
+        removed = 0
+        for phone_number in unsaved:
+            stripe = self._stripe(phone_number)
+            with stripe.lock:
+                # Still dirty means the write failed: keep it for the next flush
+                if not self._expire(stripe, [phone_number]) and phone_number not in stripe.sessions:
+                    removed += 1
+        return removed
+
+    def get_user_lock(self, phone_number: str) -> Optional[threading.RLock]:
+        """Get the user's live lock (None when nobody holds or waits on it)"""
+        return self._user_locks.get(phone_number)
+
+    def set_coordinator(self, coordinator):
+        """Share user locks, cache validity and deduplication with other processes (None: this process only).
+
+        `coordinator` provides acquire(phone_number, timeout), release(phone_number)
+        and claim_message(key) -> bool.
+        """
+        self._coordinator = coordinator
 
     @contextmanager
     def user_session_lock(self, phone_number: str):
         """Context manager for user-specific locking"""
-        user_lock = self.get_user_lock(phone_number)
-        acquired = False
-        try:
-            # Try to acquire lock with timeout
-            acquired = user_lock.acquire(timeout=10)
-            if not acquired:
-                raise TimeoutError(f"Could not acquire lock for user {phone_number}")
-
+        # Try to acquire lock with timeout (TimeoutError if it isn't acquired)
+        with self._user_locks.hold(phone_number, timeout=10):
+            held = self._held.__dict__.setdefault('users', {})
+            depth = held.get(phone_number, 0)
+            coordinator = self._coordinator if not depth else None
+            if coordinator is not None:
+                coordinator.acquire(phone_number, timeout=10)  # Other processes
+            held[phone_number] = depth + 1
             logger.debug(f"🔒 Acquired lock for user {phone_number}")
-            yield
-
-        finally:
-            if acquired:
-                user_lock.release()
-                logger.debug(f"🔓 Released lock for user {phone_number}")
+            try:
+                yield
+            finally:
+                if depth:
+                    held[phone_number] = depth
+                else:
+                    del held[phone_number]
+                if coordinator is not None:
+                    coordinator.release(phone_number)
+        logger.debug(f"🔓 Released lock for user {phone_number}")
 
     def is_message_duplicate(self, phone_number: str, message_id: str) -> bool:
-        """Check if message was already processed (thread-safe) - ENHANCED"""
-        with self._message_cleanup_lock:
-            # Clean old entries first
-            current_time = time.time()
-            cutoff = current_time - 300  # 5 minutes
-
-            to_remove = [msg_id for msg_id, timestamp in self._processed_messages.items()
-                         if timestamp < cutoff]
-
-            for msg_id in to_remove:
-                del self._processed_messages[msg_id]
-
-            # Check for duplicate using multiple keys
-            keys_to_check = [
-                f"{phone_number}:{message_id}",
-                f"{phone_number}:{message_id}:{int(current_time)}",  # Add timestamp for extra uniqueness
-                f"{phone_number}:{message_id[:20]}"  # Check partial message ID
-            ]
-            
-            for key in keys_to_check:
-                if key in self._processed_messages:
-                    logger.warning(f"🔄 Duplicate message detected: {key}")
-                    return True
-
-            # Mark as processed with multiple keys for better deduplication
-            primary_key = f"{phone_number}:{message_id}"
-            self._processed_messages[primary_key] = current_time
-            
-            # Also mark with timestamp for extra protection
-            timestamp_key = f"{phone_number}:{message_id}:{int(current_time)}"
-            self._processed_messages[timestamp_key] = current_time
-            
-            return False
+        """Check if message was already processed (thread-safe)"""
+        key = f"{phone_number}:{message_id}"
+        duplicate = self._processed_messages.seen(key)
+        if not duplicate and self._coordinator is not None:
+            duplicate = not self._coordinator.claim_message(key)  # Retry delivered to another worker
+        if duplicate:
+            logger.warning(f"🔄 Duplicate message detected: {key}")
+        return duplicate
 
     def get_user_state(self, phone_number: str) -> Optional[UserWorkflowState]:
         """Get user state from cache (thread-safe)"""
-        with self._cache_lock:
-            state = self._session_cache.get(phone_number)
-
-            # Check if session expired
-            if state and self._is_session_expired(state):
-                logger.info(f"⏰ Session expired for user {phone_number}")
-                del self._session_cache[phone_number]
-                return None
-
-            return state
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            state = stripe.sessions.get(phone_number)
+            if not state or not self._is_session_expired(state):
+                if state:
+                    stripe.sessions.move_to_end(phone_number)
+                return state
+
+            # Expired: unsaved changes are persisted before the state is dropped
+            logger.info(f"⏰ Session expired for user {phone_number}")
+            unsaved = self._expire(stripe, [phone_number])
+
+        if unsaved:
+            self._expire_unsaved(unsaved)
+        return None
 
     def create_or_update_user_state(self, phone_number: str, **kwargs) -> UserWorkflowState:
         """Create or update user state (thread-safe)"""
-        with self._cache_lock:
-            state = self._session_cache.get(phone_number)
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            state = stripe.sessions.get(phone_number)
+            was_processing = state.processing if state else False
 
             if state:
                 # Update existing state
                 for key, value in kwargs.items():
                     if hasattr(state, key) and value is not None:
                         setattr(state, key, value)
-                state.updated_at = datetime.now()
+                state.touch()
+                stripe.sessions.move_to_end(phone_number)
             else:
                 # Create new state
                 state = UserWorkflowState(phone_number=phone_number, **kwargs)
+                stripe.sessions[phone_number] = state
 
-            self._session_cache[phone_number] = state
+            stripe.processing += state.processing - was_processing
             logger.debug(f"💾 Updated state for user {phone_number}: {state.current_step}")
-            return state
+            unsaved = self._evict(stripe)
+
+        if unsaved:
+            self._evict_unsaved(stripe, unsaved)
+        return state
+
+    def mark_dirty(self, *phone_numbers: str):
+        """Flag cached states as changed since they were last persisted"""
+        for phone_number in phone_numbers:
+            stripe = self._stripe(phone_number)
+            with stripe.lock:
+                if phone_number in stripe.sessions:
+                    stripe.dirty.add(phone_number)
+
+    def take_dirty_sessions(self, phone_numbers: Iterable[str] = None) -> List[tuple]:
+        """Snapshot dirty states as user_sessions rows and clear their dirty flags"""
+        selected: Dict[_SessionStripe, Optional[List[str]]] = {}
+        if phone_numbers is None:
+            selected = dict.fromkeys(self._stripes)
+        else:
+            for phone_number in phone_numbers:
+                selected.setdefault(self._stripe(phone_number), []).append(phone_number)
+
+        rows = []
+        for stripe, wanted in selected.items():
+            with stripe.lock:
+                if wanted is None:
+                    taken = list(stripe.dirty)
+                else:
+                    taken = [p for p in wanted if p in stripe.dirty]
+
+                for phone_number in taken:
+                    stripe.dirty.discard(phone_number)
+                    state = stripe.sessions.get(phone_number)
+                    if state:
+                        rows.append((
+                            state.phone_number, state.current_step, state.language_preference,
+                            state.customer_name, state.selected_main_category, state.selected_sub_category,
+                            state.selected_item, state.order_mode, state.quick_order_item
+                        ))
+        return rows
+
+    def dirty_session_count(self) -> int:
+        """Number of states waiting to be persisted"""
+        return sum(len(stripe.dirty) for stripe in self._stripes)
+
+    def invalidate_user_state(self, phone_number: str):
+        """Drop a cached state that may be out of date, so it is read again from storage"""
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            if self._remove_state(stripe, phone_number) is not None:
+                logger.debug(f"♻️ Invalidated cached state for user {phone_number}")
 
     def delete_user_state(self, phone_number: str) -> bool:
         """Delete user state (thread-safe)"""
-        with self._cache_lock:
-            if phone_number in self._session_cache:
-                del self._session_cache[phone_number]
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            if self._remove_state(stripe, phone_number) is not None:
                 logger.info(f"🗑️ Deleted state for user {phone_number}")
                 return True
             return False
 
     def set_user_processing(self, phone_number: str, processing: bool = True):
         """Mark user as currently being processed"""
-        with self._cache_lock:
-            state = self._session_cache.get(phone_number)
-            if state:
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            state = stripe.sessions.get(phone_number)
+            if state and state.processing != processing:
                 state.processing = processing
+                stripe.processing += 1 if processing else -1
 
     def is_user_processing(self, phone_number: str) -> bool:
         """Check if user is currently being processed"""
-        with self._cache_lock:
-            state = self._session_cache.get(phone_number)
+        stripe = self._stripe(phone_number)
+        with stripe.lock:
+            state = stripe.sessions.get(phone_number)
             return state.processing if state else False
 
     def _is_session_expired(self, state: UserWorkflowState) -> bool:
         """Check if session has expired"""
-        time_diff = datetime.now() - state.updated_at
-        return time_diff.total_seconds() > self.session_timeout
+        return time.time() - state.updated_at > self.session_timeout
 
     def cleanup_expired_sessions(self) -> int:
-        """Clean up expired sessions (thread-safe)"""
-        with self._cache_lock:
-            expired_users = []
-
-            for phone_number, state in self._session_cache.items():
-                if self._is_session_expired(state):
-                    expired_users.append(phone_number)
-
-            for phone_number in expired_users:
-                del self._session_cache[phone_number]
-
-            logger.info(f"🧹 Cleaned up {len(expired_users)} expired sessions")
-            return len(expired_users)
+        """Clean up expired sessions (thread-safe, one stripe at a time)"""
+        cleaned = 0
+        unsaved = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                expired_users = [phone_number for phone_number, state in stripe.sessions.items()
+                                 if self._is_session_expired(state)]
+                dirty = self._expire(stripe, expired_users)
+                unsaved.extend(dirty)
+                cleaned += len(expired_users) - len(dirty)
+
+        # Expired sessions with unsaved changes are persisted in one batch first
+        if unsaved:
+            cleaned += self._expire_unsaved(unsaved)
+
+        logger.info(f"🧹 Cleaned up {cleaned} expired sessions")
+        return cleaned
 
     def get_session_stats(self) -> Dict:
-        """Get current session statistics"""
-        with self._cache_lock:
-            active_sessions = len(self._session_cache)
-            processing_users = sum(1 for state in self._session_cache.values() if state.processing)
-
-            return {
-                'active_sessions': active_sessions,
-                'processing_users': processing_users,
-                'session_timeout_minutes': self.session_timeout // 60,
-                'user_locks_count': len(self._user_locks)
-            }
+        """Get current session statistics (from counters, without scanning the cache)"""
+        return {
+            'active_sessions': sum(len(stripe.sessions) for stripe in self._stripes),
+            'processing_users': sum(stripe.processing for stripe in self._stripes),
+            'dirty_sessions': self.dirty_session_count(),
+            'session_timeout_minutes': self.session_timeout // 60,
+            'user_locks_count': len(self._user_locks),
+            'user_locks_created': self._user_locks.get_stats()['created_locks'],
+            'cache_stripes': len(self._stripes),
+            'max_sessions': self.max_sessions,
+            'evicted_sessions': sum(stripe.evicted for stripe in self._stripes),
+            'message_dedup': self._processed_messages.get_stats()
+        }
 
     def force_unlock_user(self, phone_number: str):
         """Force unlock a user (admin function)"""
         try:
             user_lock = self.get_user_lock(phone_number)
             # Try to release any held locks
-            try:
-                user_lock.release()
-            except:
-                pass  # Lock might not be held
+            if user_lock is not None:
+                try:
+                    user_lock.release()
+                except:
+                    pass  # Lock might not be held
 
             # Mark as not processing
             self.set_user_processing(phone_number, False)
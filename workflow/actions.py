@@ -444,8 +444,7 @@ class OrderManager:
 
     def calculate_order_total(self, phone_number: str) -> int:
         """Calculate total amount for user's order"""
-        order = self.db.get_user_order(phone_number)
-        return sum(item.get('subtotal', 0) for item in order.get('items', []))
+        return self.db.get_order_total(phone_number)
 
     def format_order_summary(self, phone_number: str, language: str = 'arabic') -> str:
         """Format order summary for display"""
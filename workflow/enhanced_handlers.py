@@ -506,10 +506,11 @@ class EnhancedMessageHandler:
         if not processed_items:
             return self._create_response("لم أتمكن من العثور على أي من العناصر المطلوبة. الرجاء المحاولة مرة أخرى.")
         
-        # Add items to order
-        for item in processed_items:
-            self.db.add_item_to_order(phone_number, item['item_id'], item['quantity'])
-            logger.info(f"➕ Added item {item['item_id']} × {item['quantity']} to order for {phone_number}")
+        # Add items to order in one write
+        added = self.db.add_items_to_order(
+            phone_number, [(item['item_id'], item['quantity']) for item in processed_items]
+        )
+        logger.info(f"➕ Added {added}/{len(processed_items)} items to order for {phone_number}")
         
         # Check if service type and location were detected by AI first
         detected_service_type = extracted_data.get('service_type')
@@ -2507,16 +2508,7 @@ class EnhancedMessageHandler:
 
     def _get_all_items(self) -> List[Dict]:
         """Get all items from all categories for quick order search"""
-        all_items = []
-        main_categories = self.db.get_main_categories()
-        
-        for category in main_categories:
-            sub_categories = self.db.get_sub_categories(category['id'])
-            for sub_category in sub_categories:
-                items = self.db.get_sub_category_items(sub_category['id'])
-                all_items.extend(items)
-        
-        return all_items
+        return self.db.get_all_menu_items()
 
     def _handle_structured_sub_category_selection(self, phone_number: str, text: str, session: Dict, user_context: Dict) -> Dict:
         """Handle sub-category selection with enhanced number extraction"""
@@ -3437,7 +3429,12 @@ class EnhancedMessageHandler:
     def _get_popular_items(self) -> List[Dict]:
         """Get popular items for quick order suggestions from database"""
         try:
-            # Get items from all categories to show variety
+            # Most ordered items (time-decayed), maintained at order completion
+            popular_items = self.db.get_popular_items(limit=6)
+            if popular_items:
+                return popular_items
+
+            # No order history yet: fall back to a price-range mix
             all_items = []
             
             # Get main categories
@@ -3474,36 +3471,21 @@ class EnhancedMessageHandler:
     def _get_recent_orders(self, phone_number: str) -> List[str]:
         """Get recent orders for quick reorder suggestions from database"""
         try:
-            # Get recent orders from database using order history
-            recent_orders = self.db.get_order_history(phone_number, limit=3)
-            
-            if recent_orders:
-                formatted_orders = []
-                for order in recent_orders:
-                    try:
-                        # Parse items from the order
-                        items_json = order.get('items_json', '[]')
-                        if isinstance(items_json, str):
-                            import json
-                            items_data = json.loads(items_json)
-                        else:
-                            items_data = items_json
-                        
-                        # Get the first item from the order for display
-                        if items_data and len(items_data) > 0:
-                            first_item = items_data[0]
-                            quantity = first_item.get('quantity', 1)
-                            item_name = first_item.get('item_name_ar', first_item.get('item_name_en', 'Unknown'))
-                            formatted_orders.append(f"{quantity} {item_name}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error parsing order item: {e}")
-                        continue
-                
-                return formatted_orders
-            
-            # If no recent orders, return empty list
-            return []
-            
+            # Line items of the last 3 orders, newest order first
+            recent_items = self.db.get_recent_order_items(phone_number, limit=3)
+
+            formatted_orders = []
+            seen_orders = set()
+            for item in recent_items:
+                # Show the first item of each order
+                if item['order_id'] in seen_orders:
+                    continue
+                seen_orders.add(item['order_id'])
+                item_name = item.get('item_name_ar') or item.get('item_name_en', 'Unknown')
+                formatted_orders.append(f"{item['quantity']} {item_name}")
+
+            return formatted_orders
+
         except Exception as e:
             logger.warning(f"⚠️ Error getting recent orders from database: {e}")
             # Return empty list if database fails
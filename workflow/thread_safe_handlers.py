@@ -8,7 +8,7 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 
 from utils.thread_safe_session import session_manager
-from database.thread_safe_manager import ThreadSafeDatabaseManager
+from database.storage import StorageBackend
 from workflow.handlers import MessageHandler
 from workflow.enhanced_handlers import EnhancedMessageHandler
 from speech.pipeline import VoicePipeline
@@ -21,7 +21,7 @@ logger = logging.getLogger(__name__)
 class ThreadSafeMessageHandler:
     """Thread-safe wrapper for main message handlers with user isolation"""
 
-    def __init__(self, database_manager: ThreadSafeDatabaseManager, ai_processor=None, action_executor=None, whatsapp_client=None):
+    def __init__(self, database_manager: StorageBackend, ai_processor=None, action_executor=None, whatsapp_client=None):
         self.db = database_manager
         self.ai = ai_processor
         self.executor = action_executor
@@ -110,36 +110,41 @@ class ThreadSafeMessageHandler:
         # Mark user as processing
         session_manager.set_user_processing(phone_number, True)
 
-        try:
-            # Extract customer info
-            customer_name = self._extract_customer_name(message_data)
+        # Count the connections and queries this message costs
+        with self.db.track_message():
+            try:
+                # Extract customer info
+                customer_name = self._extract_customer_name(message_data)
 
-            # Get current user state
-            user_state = session_manager.get_user_state(phone_number)
-            current_step = user_state.current_step if user_state else 'waiting_for_language'
-            language = user_state.language_preference if user_state else None
+                # Get current user state
+                user_state = session_manager.get_user_state(phone_number)
+                current_step = user_state.current_step if user_state else 'waiting_for_language'
+                language = user_state.language_preference if user_state else None
 
-            logger.info(f"👤 Processing for {phone_number}: '{text}' at step '{current_step}'")
+                logger.info(f"👤 Processing for {phone_number}: '{text}' at step '{current_step}'")
 
-            # Log conversation
-            self.db.log_conversation(phone_number, 'user_message', text, current_step=current_step)
+                # Log conversation
+                self.db.log_conversation(phone_number, 'user_message', text, current_step=current_step)
 
-            # Use enhanced handler if available, otherwise fall back to main handler
-            if hasattr(self, 'enhanced_handler') and self.enhanced_handler:
-                logger.info(f"🧠 Using enhanced AI handler for {phone_number}")
-                response = self.enhanced_handler.handle_message(message_data)
-            else:
-                logger.info(f"🤖 Using standard handler for {phone_number}")
-                response = self.main_handler.handle_message(message_data)
+                # Use enhanced handler if available, otherwise fall back to main handler
+                if hasattr(self, 'enhanced_handler') and self.enhanced_handler:
+                    logger.info(f"🧠 Using enhanced AI handler for {phone_number}")
+                    response = self.enhanced_handler.handle_message(message_data)
+                else:
+                    logger.info(f"🤖 Using standard handler for {phone_number}")
+                    response = self.main_handler.handle_message(message_data)
+
+                # Log response
+                self.db.log_conversation(phone_number, 'bot_response', response.get('content', ''))
 
-            # Log response
-            self.db.log_conversation(phone_number, 'bot_response', response.get('content', ''))
+                return response
 
-            return response
+            finally:
+                # Persist the session once per message, however many steps it went through
+                self.db.flush_sessions([phone_number])
 
-        finally:
-            # Always clear processing flag
-            session_manager.set_user_processing(phone_number, False)
+                # Always clear processing flag
+                session_manager.set_user_processing(phone_number, False)
 
     def _extract_customer_name(self, message_data: Dict) -> str:
         """Extract customer name from message data"""